@@ -0,0 +1,74 @@
+# benchmarks/bench_db_pool.py
+"""
+Micro-benchmark: chamadas por segundo com uma conexão nova por chamada (como os
+db_* faziam antes do db_pool) versus conexões emprestadas do pool.
+
+Corre num banco temporário, sem tocar no destiny_events.db:
+    python benchmarks/bench_db_pool.py [--calls 5000]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERY = "SELECT * FROM events WHERE event_id = ?"
+
+
+def per_call(db_path: str, event_id: int):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return conn.execute(QUERY, (event_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def pooled(db_pool, event_id: int):
+    conn = db_pool.acquire()
+    try:
+        return conn.execute(QUERY, (event_id,)).fetchone()
+    finally:
+        db_pool.release(conn)
+
+
+def measure(label: str, func, calls: int) -> float:
+    started = time.perf_counter()
+    for i in range(calls):
+        func(i % 100 + 1)
+    elapsed = time.perf_counter() - started
+    rate = calls / elapsed
+    print(f"{label:<28} {rate:>10.0f} chamadas/s  ({elapsed * 1e6 / calls:.1f} µs/chamada)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=5000)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_db_pool_"))
+    import database
+    import db_pool
+    from constants import DB_NAME
+
+    database.init_db()
+    with db_pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO events (guild_id, channel_id, creator_id, title, event_time_utc, activity_type, max_attendees, created_at_utc) "
+            "VALUES (1, 1, 1, ?, '2030-01-01T00:00:00+00:00', 'raid', 6, '2030-01-01T00:00:00+00:00')",
+            [(f"Evento {i}",) for i in range(100)]
+        )
+        conn.commit()
+
+    before = measure("conexão por chamada", lambda event_id: per_call(DB_NAME, event_id), args.calls)
+    after = measure("pool (db_pool)", lambda event_id: pooled(db_pool, event_id), args.calls)
+    print(f"Ganho: {after / before:.1f}x")
+    db_pool.close_pool()
+
+
+if __name__ == "__main__":
+    main()
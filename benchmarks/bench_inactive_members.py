@@ -0,0 +1,106 @@
+# benchmarks/bench_inactive_members.py
+"""
+Benchmark da busca de membros inativos: a versão antiga (uma consulta MAX() por
+usuário, chamada uma vez por limite de semanas) contra a consulta agrupada
+db_get_last_attendance_by_user + filter_inactive_members, que serve os dois limites
+(3 e 2 semanas) do inactivity_check_task. Confere também que os resultados são iguais.
+
+Corre num banco temporário, sem tocar no destiny_events.db:
+    python benchmarks/bench_inactive_members.py [--rsvps 50000] [--events 2000]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GUILD_ID = 1
+THRESHOLDS_WEEKS = (3, 2)
+
+
+def legacy_inactive_members(db_pool, guild_id: int, weeks_inactive: int, now_utc: datetime.datetime):
+    """db_get_inactive_members antes do user-004 (N+1 consultas)."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    inactive_users = []
+    cutoff_date = (now_utc - datetime.timedelta(weeks=weeks_inactive)).isoformat()
+    try:
+        cursor.execute("SELECT DISTINCT user_id FROM rsvps INNER JOIN events ON rsvps.event_id = events.event_id WHERE events.guild_id = ?", (guild_id,))
+        for (user_id,) in cursor.fetchall():
+            cursor.execute('''
+                SELECT MAX(events.event_time_utc)
+                FROM rsvps
+                INNER JOIN events ON rsvps.event_id = events.event_id
+                WHERE rsvps.user_id = ? AND events.guild_id = ? AND rsvps.attendance_status = 'compareceu'
+            ''', (user_id, guild_id))
+            row = cursor.fetchone()
+            if row is None or row[0] is None or row[0] < cutoff_date:
+                inactive_users.append(user_id)
+    finally:
+        db_pool.release(conn)
+    return inactive_users
+
+
+def seed(db_pool, events: int, rsvps: int, users: int, now_utc: datetime.datetime):
+    rng = random.Random(42)
+    with db_pool.connection() as conn:
+        conn.executemany(
+            "INSERT INTO events (event_id, guild_id, channel_id, creator_id, title, event_time_utc, activity_type, max_attendees, created_at_utc, status) "
+            "VALUES (?, ?, 1, 1, 'Evento', ?, 'raid', 6, ?, 'concluido')",
+            [
+                (event_id, GUILD_ID if event_id % 10 else 2, (now_utc - datetime.timedelta(hours=rng.randint(1, 24 * 120))).isoformat(), now_utc.isoformat())
+                for event_id in range(1, events + 1)
+            ]
+        )
+        pairs = set()
+        while len(pairs) < rsvps:
+            pairs.add((rng.randint(1, events), rng.randint(1, users)))
+        conn.executemany(
+            "INSERT INTO rsvps (event_id, user_id, status, rsvp_timestamp, attendance_status) VALUES (?, ?, 'vou', ?, ?)",
+            [(event_id, user_id, now_utc.isoformat(), rng.choice(('compareceu', 'ausente', 'pendente'))) for event_id, user_id in pairs]
+        )
+        conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rsvps", type=int, default=50000)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_inactive_"))
+    import database
+    import db_pool
+
+    database.init_db()
+    now_utc = datetime.datetime.now(datetime.timezone.utc)
+    seed(db_pool, args.events, args.rsvps, args.users, now_utc)
+
+    def legacy():
+        return [sorted(legacy_inactive_members(db_pool, GUILD_ID, weeks, now_utc)) for weeks in THRESHOLDS_WEEKS]
+
+    def grouped():
+        last_attendance = database.db_get_last_attendance_by_user(GUILD_ID)
+        return [sorted(database.filter_inactive_members(last_attendance, weeks, now_utc)) for weeks in THRESHOLDS_WEEKS]
+
+    assert legacy() == grouped(), "A consulta agrupada devolveu membros diferentes da versão antiga."
+    results = {}
+    for label, func in (("N+1 (antiga)", legacy), ("agrupada", grouped)):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            func()
+        results[label] = (time.perf_counter() - started) / args.repeat
+        print(f"{label:<14} {results[label] * 1000:>8.1f} ms para os dois limites")
+    print(f"Resultados iguais; ganho: {results['N+1 (antiga)'] / results['agrupada']:.1f}x "
+          f"({args.rsvps} RSVPs, {args.events} eventos, {args.users} usuários)")
+    db_pool.close_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,27 @@
 # bungie_api.py
 import aiohttp
 import asyncio
+import json
 from datetime import datetime, timedelta
 import pytz
 import os
 from dotenv import load_dotenv
 from typing import Any, Dict, List, Set, Optional, Tuple
 
-import database as db
+import db_async as adb
 from config import BUNGIE_API_KEY, BUNGIE_CLIENT_ID, BUNGIE_CLIENT_SECRET, BUNGIE_CLAN_ID
+from constants import (
+    BUNGIE_HTTP_MAX_CONNECTIONS, BUNGIE_HTTP_KEEPALIVE_SECONDS,
+    BUNGIE_HTTP_DNS_CACHE_SECONDS, BUNGIE_HTTP_TIMEOUT_SECONDS,
+    BUNGIE_RATE_LIMITS, BUNGIE_THROTTLE_MAX_RETRIES, BUNGIE_DEFAULT_RETRY_SECONDS,
+    BUNGIE_CLAN_MEMBERS_CACHE_SECONDS, BUNGIE_PENDING_INVITES_CACHE_SECONDS,
+    BUNGIE_TOKEN_PROACTIVE_REFRESH_SECONDS, BUNGIE_TOKEN_EXPIRY_MARGIN_SECONDS,
+    BUNGIE_TOKEN_REFRESH_LOOKAHEAD_SECONDS, BUNGIE_TOKEN_REFRESH_CONCURRENCY, BUNGIE_TOKEN_REFRESH_BATCH_LIMIT,
+    BUNGIE_REQUEST_TIMEOUT_SECONDS, BUNGIE_RETRY_MAX_ATTEMPTS, BUNGIE_CHARACTERS_CACHE_SECONDS
+)
+from caching import AsyncTTLCache
+from bungie_resilience import BungieUnavailableError, CircuitBreaker, backoff_delay
+from rate_limit import PriorityRateLimiter, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND
 
 load_dotenv()
 
@@ -17,7 +30,192 @@ CLAN_ID = BUNGIE_CLAN_ID
 BUNGIE_API_ROOT = "https://www.bungie.net/Platform"
 TOKEN_URL = "https://www.bungie.net/Platform/App/OAuth/Token/"
 
-async def exchange_code_for_token(code: str) -> Optional[Dict[str, Any]]:
+
+class BungieResponse:
+    """Resposta já lida por completo, para que a conexão volte logo ao pool."""
+    def __init__(self, status: int, data: Optional[Dict[str, Any]], text: str, headers: Dict[str, str]):
+        self.status = status
+        self.data = data
+        self.text = text
+        self.headers = headers
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200 and self.data is not None
+
+
+class BungieClient:
+    """
+    Sessão HTTP única para bungie.net, reaproveitando conexões TCP/TLS entre chamadas.
+
+    É criada no setup_hook do bot (`start`) e fechada no encerramento (`close`).
+    Se alguma função for chamada antes do arranque, a sessão é aberta sob demanda.
+    """
+    def __init__(self, max_connections: int = BUNGIE_HTTP_MAX_CONNECTIONS,
+                 keepalive: float = BUNGIE_HTTP_KEEPALIVE_SECONDS,
+                 dns_cache: int = BUNGIE_HTTP_DNS_CACHE_SECONDS,
+                 timeout: float = BUNGIE_HTTP_TIMEOUT_SECONDS):
+        self.max_connections = max_connections
+        self.keepalive = keepalive
+        self.dns_cache = dns_cache
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._lock = asyncio.Lock()
+        self.limiter = PriorityRateLimiter(BUNGIE_RATE_LIMITS)
+        self.breaker = CircuitBreaker()
+
+    @property
+    def is_open(self) -> bool:
+        return self._session is not None and not self._session.closed
+
+    async def start(self) -> aiohttp.ClientSession:
+        async with self._lock:
+            if not self.is_open:
+                connector = aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    ttl_dns_cache=self.dns_cache,
+                    keepalive_timeout=self.keepalive,
+                )
+                self._session = aiohttp.ClientSession(
+                    connector=connector,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                )
+            return self._session
+
+    async def close(self):
+        async with self._lock:
+            if self.is_open:
+                await self._session.close()
+            self._session = None
+            self.limiter.close()
+
+    async def _send(self, method: str, url: str, **kwargs) -> BungieResponse:
+        session = self._session if self.is_open else await self.start()
+        async with session.request(method, url, **kwargs) as resp:
+            text = await resp.text()
+            try:
+                data = json.loads(text) if text else None
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                data = None
+            return BungieResponse(resp.status, data, text, dict(resp.headers))
+
+    async def request(self, method: str, url: str, endpoint_class: str = "default",
+                      priority: int = PRIORITY_NORMAL, **kwargs) -> BungieResponse:
+        """
+        Faz o pedido passando pelo disjuntor e pelo limitador da classe de endpoint e devolve
+        o corpo já lido; `data` é None se a resposta não for JSON.
+
+        - 429 / ThrottleLimitExceeded suspendem a classe inteira e o pedido é repetido
+          até BUNGIE_THROTTLE_MAX_RETRIES vezes;
+        - GETs (idempotentes) que falham por rede, tempo esgotado ou 5xx são repetidos
+          com espera exponencial aleatória, até BUNGIE_RETRY_MAX_ATTEMPTS vezes;
+        - SystemDisabled abre o disjuntor e levanta BungieUnavailableError, tal como
+          qualquer pedido feito enquanto ele estiver aberto.
+        """
+        kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=BUNGIE_REQUEST_TIMEOUT_SECONDS))
+        idempotent = method.upper() == "GET"
+        throttle_attempt = 0
+        error_attempt = 0
+        while True:
+            if self.breaker.is_open:
+                self.breaker.before_request()  # Falha já, sem entrar na fila do limitador
+            await self.limiter.acquire(endpoint_class, priority)
+            is_probe = self.breaker.before_request()
+            try:
+                resp = await self._send(method, url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure(f"{type(e).__name__}")
+                if not idempotent or error_attempt >= BUNGIE_RETRY_MAX_ATTEMPTS:
+                    raise
+                error_attempt += 1
+                await asyncio.sleep(backoff_delay(error_attempt))
+                continue
+            finally:
+                if is_probe:
+                    self.breaker.release_probe()
+
+            if _is_system_disabled(resp):
+                self.breaker.trip("SystemDisabled")
+                raise BungieUnavailableError("API da Bungie em manutenção (SystemDisabled).")
+            if resp.status >= 500:
+                self.breaker.record_failure(f"HTTP {resp.status}")
+                if idempotent and error_attempt < BUNGIE_RETRY_MAX_ATTEMPTS:
+                    error_attempt += 1
+                    await asyncio.sleep(backoff_delay(error_attempt))
+                    continue
+                return resp
+            self.breaker.record_success()
+
+            throttle_seconds = _throttle_seconds(resp)
+            if throttle_seconds > 0:
+                self.limiter.throttle(endpoint_class, throttle_seconds)
+            if not _is_throttled(resp) or throttle_attempt >= BUNGIE_THROTTLE_MAX_RETRIES:
+                return resp
+            throttle_attempt += 1
+            if throttle_seconds <= 0:
+                self.limiter.throttle(endpoint_class, BUNGIE_DEFAULT_RETRY_SECONDS)
+            print(f"BUNGIE_API: Limite atingido em '{endpoint_class}' (status {resp.status}). Nova tentativa {throttle_attempt}/{BUNGIE_THROTTLE_MAX_RETRIES}.")
+
+    async def download(self, url: str, timeout: float, priority: int = PRIORITY_BACKGROUND) -> Optional[bytes]:
+        """
+        Descarrega um ficheiro estático (ex.: conteúdo do manifesto) sem interpretar o corpo,
+        que pode ter dezenas de MB. Devolve None se o status não for 200.
+        """
+        if self.breaker.is_open:
+            self.breaker.before_request()
+        await self.limiter.acquire("default", priority)
+        session = self._session if self.is_open else await self.start()
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            if resp.status != 200:
+                return None
+            return await resp.read()
+
+    def get_rate_limit_stats(self) -> Dict[str, Dict[str, float]]:
+        return self.limiter.get_stats()
+
+
+def _throttle_seconds(resp: BungieResponse) -> float:
+    """Pausa pedida pelo servidor: Retry-After num 429 ou ThrottleSeconds no corpo da Bungie."""
+    if resp.status == 429:
+        try:
+            return float(resp.headers.get("Retry-After", ""))
+        except ValueError:
+            pass
+    if resp.data:
+        try:
+            return float(resp.data.get("ThrottleSeconds") or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+def _is_system_disabled(resp: BungieResponse) -> bool:
+    return bool(resp.data) and resp.data.get("ErrorStatus") == "SystemDisabled"
+
+def _is_throttled(resp: BungieResponse) -> bool:
+    if resp.status == 429:
+        return True
+    error_status = (resp.data or {}).get("ErrorStatus") or ""
+    return "Throttle" in error_status
+
+
+client = BungieClient()
+
+def is_available() -> bool:
+    """Falso enquanto o disjuntor estiver aberto; as tarefas em segundo plano usam isto para saltar a vez."""
+    return not client.breaker.is_open
+
+async def start_client():
+    await client.start()
+
+async def close_client():
+    await client.close()
+
+def _auth_headers(access_token: str) -> Dict[str, str]:
+    return {"X-API-Key": BUNGIE_API_KEY, "Authorization": f"Bearer {access_token}"}
+
+async def exchange_code_for_token(code: str, priority: int = PRIORITY_INTERACTIVE) -> Optional[Dict[str, Any]]:
     """Troca um código de autorização por tokens de acesso e de atualização."""
     data = {
         'grant_type': 'authorization_code',
@@ -26,146 +224,437 @@ async def exchange_code_for_token(code: str) -> Optional[Dict[str, Any]]:
         'client_secret': BUNGIE_CLIENT_SECRET
     }
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(TOKEN_URL, data=data, headers=headers) as resp:
-            if resp.status == 200:
-                return await resp.json()
-            else:
-                print(f"BUNGIE_API_ERROR: Falha ao trocar código por token. Status: {resp.status}, Resposta: {await resp.text()}")
-                return None
+    try:
+        resp = await client.request("POST", TOKEN_URL, "oauth", priority, data=data, headers=headers)
+    except (BungieUnavailableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao trocar código por token: {type(e).__name__} {e}")
+        return None
+    if resp.ok:
+        return resp.data
+    print(f"BUNGIE_API_ERROR: Falha ao trocar código por token. Status: {resp.status}, Resposta: {resp.text}")
+    return None
 
-async def get_bungie_memberships_for_current_user(access_token: str) -> Optional[Dict[str, Any]]:
+async def get_bungie_memberships_for_current_user(access_token: str, priority: int = PRIORITY_INTERACTIVE) -> Optional[Dict[str, Any]]:
     """Busca as informações de perfil do usuário autenticado."""
     url = f"{BUNGIE_API_ROOT}/User/GetMembershipsForCurrentUser/"
-    headers = {
-        "X-API-Key": BUNGIE_API_KEY,
-        "Authorization": f"Bearer {access_token}"
-    }
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, headers=headers) as resp:
-            if resp.status == 200:
-                return await resp.json()
-            else:
-                print(f"BUNGIE_API_ERROR: Falha ao buscar perfil do usuário. Status: {resp.status}")
-                return None
+    try:
+        resp = await client.request("GET", url, "user", priority, headers=_auth_headers(access_token))
+    except (BungieUnavailableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao buscar perfil do usuário: {type(e).__name__} {e}")
+        return None
+    if resp.ok:
+        return resp.data
+    print(f"BUNGIE_API_ERROR: Falha ao buscar perfil do usuário. Status: {resp.status}")
+    return None
 
-async def _get_access_token_from_db(discord_id: int):
-    profile = db.db_get_bungie_profile(discord_id)
-    if not profile:
+async def get_destiny_manifest(priority: int = PRIORITY_BACKGROUND) -> Optional[Dict[str, Any]]:
+    """Metadados do manifesto atual (versão e caminhos dos ficheiros por idioma)."""
+    url = f"{BUNGIE_API_ROOT}/Destiny2/Manifest/"
+    try:
+        resp = await client.request("GET", url, "default", priority, headers={"X-API-Key": BUNGIE_API_KEY})
+    except (BungieUnavailableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao buscar o manifesto: {e}")
         return None
+    if resp.ok and resp.data.get('ErrorCode') == 1:
+        return resp.data.get('Response')
+    print(f"BUNGIE_API_ERROR: Falha ao buscar o manifesto. Status: {resp.status}")
+    return None
 
-    expires_at = datetime.fromisoformat(profile['token_expires_at'])
-    if datetime.now(pytz.utc) >= expires_at:
-        return await _refresh_access_token(discord_id, profile['refresh_token'])
-    else:
-        return profile['access_token']
+async def download_manifest_content(path: str, timeout: float, priority: int = PRIORITY_BACKGROUND) -> Optional[bytes]:
+    """Descarrega um ficheiro do manifesto a partir do caminho relativo indicado em get_destiny_manifest."""
+    try:
+        content = await client.download(f"https://www.bungie.net{path}", timeout, priority)
+    except (BungieUnavailableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao descarregar {path}: {e}")
+        return None
+    if content is None:
+        print(f"BUNGIE_API_ERROR: Falha ao descarregar {path}.")
+    return content
 
-async def _refresh_access_token(discord_id: int, refresh_token: str) -> str | None:
-    print(f"BUNGIE_API: Refreshing token for user {discord_id}")
-    data = {
-        "grant_type": "refresh_token",
-        "refresh_token": refresh_token,
-        'client_id': BUNGIE_CLIENT_ID,
-        'client_secret': BUNGIE_CLIENT_SECRET
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(TOKEN_URL, data=data, headers=headers) as response:
-            if response.status == 200:
-                token_data = await response.json()
-                new_access_token = token_data['access_token']
-                new_refresh_token = token_data['refresh_token']
-                expires_in = token_data['expires_in']
-                new_expires_at = (datetime.now(pytz.utc) + timedelta(seconds=expires_in)).isoformat()
-
-                profile = db.db_get_bungie_profile(discord_id)
-                if profile:
-                    db.db_save_bungie_profile(
-                        discord_id=discord_id,
-                        bungie_membership_id=profile['bungie_membership_id'],
-                        bungie_membership_type=profile['bungie_membership_type'],
-                        bungie_name=profile['bungie_name'],
-                        access_token=new_access_token,
-                        refresh_token=new_refresh_token,
-                        token_expires_at=new_expires_at
-                    )
-                return new_access_token
-            else:
-                print(f"BUNGIE_API_ERROR: Failed to refresh token for user {discord_id}. Status: {response.status}")
-                return None
+class TokenStore:
+    """
+    Tokens OAuth em memória, por discord_id, carregados do banco uma única vez.
+
+    Renovações concorrentes para o mesmo utilizador partilham um único POST ao
+    TOKEN_URL (a Bungie invalida o refresh token antigo a cada renovação, por isso
+    dois POSTs em paralelo deixariam um deles com um token já revogado). Quando o
+    token entra na janela de renovação antecipada, a renovação corre em segundo
+    plano e quem chamou continua com o token atual, ainda válido.
+    """
+    def __init__(self, proactive_seconds: float = BUNGIE_TOKEN_PROACTIVE_REFRESH_SECONDS,
+                 margin_seconds: float = BUNGIE_TOKEN_EXPIRY_MARGIN_SECONDS):
+        self.proactive = timedelta(seconds=proactive_seconds)
+        self.margin = timedelta(seconds=margin_seconds)
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._refreshing: Dict[int, asyncio.Task] = {}
+
+    def remember(self, discord_id: int, access_token: str, refresh_token: str, expires_at: datetime):
+        self._entries[discord_id] = {
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'expires_at': expires_at,
+        }
+
+    def forget(self, discord_id: int):
+        self._entries.pop(discord_id, None)
 
-async def _approve_or_deny_pending_members(admin_discord_id: int, approve: bool, membership_id: str, membership_type: int, message: str) -> bool:
+    async def _load(self, discord_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(discord_id)
+        if entry:
+            return entry
+        profile = await adb.db_get_bungie_profile(discord_id)
+        if not profile or not profile['refresh_token']:
+            return None
+        # Outra corrotina pode ter renovado enquanto líamos o banco; a memória ganha.
+        if discord_id not in self._entries:
+            self.remember(discord_id, profile['access_token'], profile['refresh_token'],
+                          datetime.fromisoformat(profile['token_expires_at']))
+        return self._entries[discord_id]
+
+    async def get(self, discord_id: int, priority: int = PRIORITY_NORMAL) -> Optional[str]:
+        entry = await self._load(discord_id)
+        if not entry:
+            return None
+        now = datetime.now(pytz.utc)
+        if now >= entry['expires_at'] - self.margin:
+            return await self.refresh(discord_id, priority)
+        if now >= entry['expires_at'] - self.proactive:
+            self._start_refresh(discord_id, PRIORITY_BACKGROUND)
+        return entry['access_token']
+
+    def _start_refresh(self, discord_id: int, priority: int, persist: bool = True) -> asyncio.Task:
+        task = self._refreshing.get(discord_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._refresh(discord_id, priority, persist))
+            self._refreshing[discord_id] = task
+        return task
+
+    async def refresh(self, discord_id: int, priority: int = PRIORITY_NORMAL) -> Optional[str]:
+        """Renova já (ou junta-se à renovação em curso) e devolve o novo access token."""
+        access_token, _ = await asyncio.shield(self._start_refresh(discord_id, priority))
+        return access_token
+
+    async def _refresh(self, discord_id: int, priority: int, persist: bool) -> Tuple[Optional[str], str]:
+        try:
+            return await self._refresh_once(discord_id, priority, persist)
+        except Exception as e:
+            print(f"BUNGIE_API_ERROR: Erro inesperado ao renovar token do user {discord_id}: {e}")
+            return None, "failed"
+        finally:
+            self._refreshing.pop(discord_id, None)
+
+    async def _refresh_once(self, discord_id: int, priority: int, persist: bool) -> Tuple[Optional[str], str]:
+        entry = await self._load(discord_id)
+        if not entry:
+            return None, "failed"
+        print(f"BUNGIE_API: Refreshing token for user {discord_id}")
+        data = {
+            "grant_type": "refresh_token",
+            "refresh_token": entry['refresh_token'],
+            'client_id': BUNGIE_CLIENT_ID,
+            'client_secret': BUNGIE_CLIENT_SECRET
+        }
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        response = await client.request("POST", TOKEN_URL, "oauth", priority, data=data, headers=headers)
+        if not response.ok:
+            if response.status in (400, 401) and "invalid_grant" in response.text:
+                # O utilizador revogou o acesso (ou o refresh token expirou): é preciso vincular de novo.
+                print(f"BUNGIE_API_ERROR: Refresh token do user {discord_id} foi revogado.")
+                self.forget(discord_id)
+                return None, "revoked"
+            print(f"BUNGIE_API_ERROR: Failed to refresh token for user {discord_id}. Status: {response.status}")
+            return None, "failed"
+
+        token_data = response.data
+        new_expires_at = datetime.now(pytz.utc) + timedelta(seconds=token_data['expires_in'])
+        self.remember(discord_id, token_data['access_token'], token_data['refresh_token'], new_expires_at)
+        if persist:
+            await adb.db_update_bungie_tokens(
+                discord_id, token_data['access_token'], token_data['refresh_token'], new_expires_at.isoformat()
+            )
+        return token_data['access_token'], "refreshed"
+
+    async def refresh_expiring(self, lookahead_seconds: float = BUNGIE_TOKEN_REFRESH_LOOKAHEAD_SECONDS,
+                               concurrency: int = BUNGIE_TOKEN_REFRESH_CONCURRENCY,
+                               batch_limit: int = BUNGIE_TOKEN_REFRESH_BATCH_LIMIT) -> Dict[str, int]:
+        """
+        Renova, com no máximo `concurrency` pedidos em paralelo, os tokens que expiram
+        nos próximos `lookahead_seconds`, e grava tudo no banco numa única transação.
+        Devolve a contagem de renovados, falhados e revogados.
+        """
+        cutoff = datetime.now(pytz.utc) + timedelta(seconds=lookahead_seconds)
+        candidates = await adb.db_get_bungie_profiles_expiring_before(cutoff.isoformat(), batch_limit)
+        report = {"refreshed": 0, "failed": 0, "revoked": 0}
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def refresh_one(discord_id: int) -> Tuple[int, str]:
+            async with semaphore:
+                entry = await self._load(discord_id)
+                # A memória pode já estar à frente do banco (renovação interativa recente).
+                if entry and entry['expires_at'] > cutoff:
+                    return discord_id, "skipped"
+                _, outcome = await asyncio.shield(self._start_refresh(discord_id, PRIORITY_BACKGROUND, persist=False))
+                return discord_id, outcome
+
+        results = await asyncio.gather(*(refresh_one(discord_id) for discord_id in candidates))
+        updates, revoked = [], []
+        for discord_id, outcome in results:
+            if outcome in report:
+                report[outcome] += 1
+            if outcome == "refreshed" and discord_id in self._entries:
+                entry = self._entries[discord_id]
+                updates.append((discord_id, entry['access_token'], entry['refresh_token'], entry['expires_at'].isoformat()))
+            elif outcome == "revoked":
+                revoked.append(discord_id)
+        await adb.db_apply_bungie_token_refreshes(updates, revoked)
+        return report
+
+
+tokens = TokenStore()
+
+async def _get_access_token(discord_id: int, priority: int = PRIORITY_NORMAL) -> Optional[str]:
+    return await tokens.get(discord_id, priority)
+
+async def refresh_expiring_tokens() -> Dict[str, int]:
+    return await tokens.refresh_expiring()
+
+def remember_tokens(discord_id: int, access_token: str, refresh_token: str, expires_at: datetime):
+    """Chamado após uma nova vinculação, para que a memória não fique com o token anterior."""
+    tokens.remember(discord_id, access_token, refresh_token, expires_at)
+
+async def _approve_or_deny_pending_members(admin_discord_id: int, approve: bool, membership_id: str, membership_type: int, message: str, priority: int = PRIORITY_NORMAL, clan_id: Optional[str] = None) -> bool:
     action_word = "Approving" if approve else "Denying"
-    admin_token = await _get_access_token_from_db(admin_discord_id)
+    clan_id = clan_id or CLAN_ID
+    admin_token = await _get_access_token(admin_discord_id, priority)
     if not admin_token: return False
 
-    url = f"{BUNGIE_API_ROOT}/GroupV2/{CLAN_ID}/Members/{'Approve' if approve else 'Deny'}/{membership_type}/{membership_id}/"
-    headers = {"X-API-Key": BUNGIE_API_KEY, "Authorization": f"Bearer {admin_token}"}
+    url = f"{BUNGIE_API_ROOT}/GroupV2/{clan_id}/Members/{'Approve' if approve else 'Deny'}/{membership_type}/{membership_id}/"
+    try:
+        response = await client.request("POST", url, "group_admin", priority, headers=_auth_headers(admin_token), json={"message": message})
+    except BungieUnavailableError as e:
+        print(f"BUNGIE_API_ERROR: {action_word} member {membership_id} failed: {e}")
+        return False
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # Sem resposta não dá para saber se a Bungie aplicou o pedido: o cache deixa de ser confiável.
+        print(f"BUNGIE_API_ERROR: {action_word} member {membership_id} failed: {type(e).__name__} {e}")
+        invalidate_clan_cache(clan_id)
+        return False
+    # O pedido saiu da lista de pendentes (e talvez entrou no clã) mesmo que a resposta seja um erro.
+    invalidate_clan_cache(clan_id)
+    if response.ok:
+        return response.data.get("ErrorStatus") == "Success" and response.data.get("Response")
+    return False
+
+async def approve_pending_invitation(admin_discord_id: int, membership_id: str, membership_type: int, priority: int = PRIORITY_NORMAL, clan_id: Optional[str] = None) -> bool:
+    return await _approve_or_deny_pending_members(admin_discord_id, True, membership_id, membership_type, "Bem-vindo ao clã!", priority, clan_id)
+
+async def deny_pending_invitation(admin_discord_id: int, membership_id: str, membership_type: int, priority: int = PRIORITY_NORMAL, clan_id: Optional[str] = None) -> bool:
+    return await _approve_or_deny_pending_members(admin_discord_id, False, membership_id, membership_type, "Seu pedido de entrada no clã foi recusado.", priority, clan_id)
+
+
+class BungieApiError(Exception):
+    """Resposta inválida da Bungie; usada para não guardar falhas no cache."""
+
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json={"message": message}) as response:
-            if response.status == 200:
-                data = await response.json()
-                return data.get("ErrorStatus") == "Success" and data.get("Response")
-            return False
+# Listas do clã partilhadas entre as tarefas, por (clan_id, admin_discord_id).
+_clan_members_cache = AsyncTTLCache(BUNGIE_CLAN_MEMBERS_CACHE_SECONDS)
+_pending_invites_cache = AsyncTTLCache(BUNGIE_PENDING_INVITES_CACHE_SECONDS)
 
-async def approve_pending_invitation(admin_discord_id: int, membership_id: str, membership_type: int) -> bool:
-    return await _approve_or_deny_pending_members(admin_discord_id, True, membership_id, membership_type, "Bem-vindo ao clã!")
+def invalidate_clan_cache(clan_id: Any = None):
+    """Descarta membros e convites em cache de um clã (ou de todos, se clan_id for None)."""
+    for cache in (_clan_members_cache, _pending_invites_cache):
+        if clan_id is None:
+            cache.clear()
+        else:
+            cache.invalidate_where(lambda key: key[0] == str(clan_id))
 
-async def deny_pending_invitation(admin_discord_id: int, membership_id: str, membership_type: int) -> bool:
-    return await _approve_or_deny_pending_members(admin_discord_id, False, membership_id, membership_type, "Seu pedido de entrada no clã foi recusado.")
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    return {
+        "clan_members": _clan_members_cache.get_stats(),
+        "pending_invites": _pending_invites_cache.get_stats(),
+        "characters": _character_ids_cache.get_stats(),
+    }
+
+async def _fetch_group_results(admin_discord_id: int, url: str, priority: int) -> List[Dict[str, Any]]:
+    admin_token = await _get_access_token(admin_discord_id, priority)
+    if not admin_token:
+        raise BungieApiError(f"Sem token válido para o admin {admin_discord_id}.")
+    response = await client.request("GET", url, "group_read", priority, headers=_auth_headers(admin_token))
+    if not response.ok:
+        raise BungieApiError(f"Status HTTP {response.status}.")
+    if response.data.get('ErrorStatus') != 'Success':
+        raise BungieApiError(f"ErrorStatus {response.data.get('ErrorStatus')}.")
+    return response.data.get('Response', {}).get('results', [])
 
-async def get_pending_invitations(admin_discord_id: int) -> List[Dict[str, Any]]:
-    admin_token = await _get_access_token_from_db(admin_discord_id)
-    if not admin_token: return []
-    url = f"{BUNGIE_API_ROOT}/GroupV2/{CLAN_ID}/Members/Pending/"
-    headers = {"X-API-Key": BUNGIE_API_KEY, "Authorization": f"Bearer {admin_token}"}
+async def _load_pending_invitations(clan_id: str, admin_discord_id: int, priority: int) -> List[Dict[str, Any]]:
+    url = f"{BUNGIE_API_ROOT}/GroupV2/{clan_id}/Members/Pending/"
     invites = []
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                data = await response.json()
-                if data.get('ErrorStatus') == 'Success':
-                    for invite in data.get('Response', {}).get('results', []):
-                        user_info = invite.get('destinyUserInfo', {})
-                        if user_info.get('membershipId'):
-                            invites.append({
-                                'bungie_name': f"{user_info.get('bungieGlobalDisplayName', 'N/A')}#{user_info.get('bungieGlobalDisplayNameCode', '0000')}",
-                                'membership_id': user_info.get('membershipId'),
-                                'membership_type': user_info.get('membershipType'),
-                                'date_applied': invite.get('dateApplied')
-                            })
-        except Exception as e:
-            print(f"BUNGIE_API_ERROR: An unexpected error occurred while fetching pending invites: {e}")
+    for invite in await _fetch_group_results(admin_discord_id, url, priority):
+        user_info = invite.get('destinyUserInfo', {})
+        if user_info.get('membershipId'):
+            invites.append({
+                'bungie_name': f"{user_info.get('bungieGlobalDisplayName', 'N/A')}#{user_info.get('bungieGlobalDisplayNameCode', '0000')}",
+                'membership_id': user_info.get('membershipId'),
+                'membership_type': user_info.get('membershipType'),
+                'date_applied': invite.get('dateApplied'),
+                'clan_id': clan_id,
+                'admin_discord_id': admin_discord_id
+            })
     return invites
 
-async def kick_clan_member(admin_discord_id: int, member_to_kick_bnet_id: str, member_to_kick_membership_type: int) -> bool:
-    admin_token = await _get_access_token_from_db(admin_discord_id)
+async def get_pending_invitations(admin_discord_id: int, priority: int = PRIORITY_NORMAL, clan_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    clan_id = str(clan_id or CLAN_ID)
+    try:
+        invites = await _pending_invites_cache.get_or_load(
+            (clan_id, admin_discord_id), lambda: _load_pending_invitations(clan_id, admin_discord_id, priority)
+        )
+        return [dict(invite) for invite in invites]
+    except (BungieApiError, BungieUnavailableError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao buscar convites pendentes do clã {clan_id}: {e}")
+    except Exception as e:
+        print(f"BUNGIE_API_ERROR: An unexpected error occurred while fetching pending invites: {e}")
+    return []
+
+async def kick_clan_member(admin_discord_id: int, member_to_kick_bnet_id: str, member_to_kick_membership_type: int, priority: int = PRIORITY_NORMAL, clan_id: Optional[str] = None) -> bool:
+    clan_id = clan_id or CLAN_ID
+    admin_token = await _get_access_token(admin_discord_id, priority)
     if not admin_token: return False
-    url = f"{BUNGIE_API_ROOT}/GroupV2/{CLAN_ID}/Members/{member_to_kick_membership_type}/{member_to_kick_bnet_id}/Kick/"
-    headers = {"X-API-Key": BUNGIE_API_KEY, "Authorization": f"Bearer {admin_token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers) as response:
-            if response.status == 200:
-                return (await response.json()).get("ErrorStatus") == "Success"
-            return False
-
-async def get_clan_members(admin_discord_id: int) -> set[str]:
-    admin_token = await _get_access_token_from_db(admin_discord_id)
-    if not admin_token: return set()
-    url = f"{BUNGIE_API_ROOT}/GroupV2/{CLAN_ID}/Members/"
-    headers = {"X-API-Key": BUNGIE_API_KEY, "Authorization": f"Bearer {admin_token}"}
+    url = f"{BUNGIE_API_ROOT}/GroupV2/{clan_id}/Members/{member_to_kick_membership_type}/{member_to_kick_bnet_id}/Kick/"
+    try:
+        response = await client.request("POST", url, "group_admin", priority, headers=_auth_headers(admin_token))
+    except BungieUnavailableError as e:
+        print(f"BUNGIE_API_ERROR: Falha ao expulsar {member_to_kick_bnet_id} do clã: {e}")
+        return False
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        # Sem resposta não dá para saber se a expulsão foi aplicada: o cache deixa de ser confiável.
+        print(f"BUNGIE_API_ERROR: Falha ao expulsar {member_to_kick_bnet_id} do clã: {type(e).__name__} {e}")
+        invalidate_clan_cache(clan_id)
+        return False
+    invalidate_clan_cache(clan_id)
+    if response.ok:
+        return response.data.get("ErrorStatus") == "Success"
+    return False
+
+async def _load_clan_members(clan_id: str, admin_discord_id: int, priority: int) -> frozenset:
+    url = f"{BUNGIE_API_ROOT}/GroupV2/{clan_id}/Members/"
     member_ids = set()
-    async with aiohttp.ClientSession() as session:
+    for member in await _fetch_group_results(admin_discord_id, url, priority):
+        if membership_id := member.get('destinyUserInfo', {}).get('membershipId'):
+            member_ids.add(membership_id)
+    return frozenset(member_ids)
+
+async def _get_clan_members_or_raise(clan_id: str, admin_discord_id: int, priority: int) -> frozenset:
+    return await _clan_members_cache.get_or_load(
+        (clan_id, admin_discord_id), lambda: _load_clan_members(clan_id, admin_discord_id, priority)
+    )
+
+async def get_clan_members(admin_discord_id: int, priority: int = PRIORITY_NORMAL, clan_id: Optional[str] = None) -> set[str]:
+    clan_id = str(clan_id or CLAN_ID)
+    try:
+        return set(await _get_clan_members_or_raise(clan_id, admin_discord_id, priority))
+    except (BungieApiError, BungieUnavailableError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao buscar membros do clã {clan_id}: {e}")
+    except Exception as e:
+        print(f"BUNGIE_API_ERROR: An unexpected error occurred while fetching clan members: {e}")
+    return set()
+
+# --- Vários clãs por servidor ---
+
+async def get_guild_clans(guild_id: int, configs: Optional[Any] = None) -> List[Tuple[str, int]]:
+    """
+    Clãs configurados para a guild, como (clan_id, admin_discord_id). Sem admin próprio,
+    cada clã usa o clan_admin_discord_id do servidor; sem nenhum clã em guild_clans,
+    cai no BUNGIE_CLAN_ID do .env para manter as instalações de um só clã a funcionar.
+    """
+    if configs is None:
+        configs = await adb.db_get_server_configs(guild_id)
+    default_admin = configs.get('clan_admin_discord_id') if configs else None
+    rows = await adb.db_get_guild_clans(guild_id)
+    if rows:
+        clans = [(str(row['clan_id']), row['admin_discord_id'] or default_admin) for row in rows]
+    elif CLAN_ID:
+        clans = [(str(CLAN_ID), default_admin)]
+    else:
+        clans = []
+    return [(clan_id, admin_id) for clan_id, admin_id in clans if admin_id]
+
+async def get_clan_rosters(clans: List[Tuple[str, int]], priority: int = PRIORITY_NORMAL) -> Dict[str, Optional[Set[str]]]:
+    """Busca as listas de membros de todos os clãs em paralelo; None marca um clã cuja busca falhou."""
+    async def fetch(clan_id: str, admin_id: int) -> Optional[Set[str]]:
         try:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                data = await response.json()
-                if data.get('ErrorStatus') == 'Success':
-                    for member in data.get('Response', {}).get('results', []):
-                        if membership_id := member.get('destinyUserInfo', {}).get('membershipId'):
-                            member_ids.add(membership_id)
+            return set(await _get_clan_members_or_raise(clan_id, admin_id, priority))
         except Exception as e:
-            print(f"BUNGIE_API_ERROR: An unexpected error occurred while fetching clan members: {e}")
-    return member_ids
\ No newline at end of file
+            print(f"BUNGIE_API_ERROR: Falha ao buscar membros do clã {clan_id}: {e}")
+            return None
+
+    results = await asyncio.gather(*(fetch(clan_id, admin_id) for clan_id, admin_id in clans))
+    return {clan_id: roster for (clan_id, _), roster in zip(clans, results)}
+
+def build_membership_index(rosters: Dict[str, Optional[Set[str]]]) -> Dict[str, str]:
+    """Índice único bungie_membership_id -> clan_id a partir das listas de vários clãs."""
+    index: Dict[str, str] = {}
+    for clan_id, roster in rosters.items():
+        for membership_id in roster or ():
+            index.setdefault(membership_id, clan_id)
+    return index
+
+async def get_all_pending_invitations(clans: List[Tuple[str, int]], priority: int = PRIORITY_NORMAL) -> List[Dict[str, Any]]:
+    """Pedidos pendentes de todos os clãs, buscados em paralelo; cada um traz 'clan_id' e 'admin_discord_id'."""
+    results = await asyncio.gather(*(
+        get_pending_invitations(admin_id, priority, clan_id=clan_id) for clan_id, admin_id in clans
+    ))
+    return [invite for invites in results for invite in invites]
+
+# --- Histórico de atividades e relatórios pós-jogo (PGCR) ---
+# Endpoints públicos: só precisam da X-API-Key, não de OAuth.
+STATS_API_ROOT = "https://stats.bungie.net/Platform"
+
+_character_ids_cache = AsyncTTLCache(BUNGIE_CHARACTERS_CACHE_SECONDS, max_entries=1024)
+
+async def _get_public_response(url: str, priority: int, endpoint_class: str = "stats") -> Dict[str, Any]:
+    response = await client.request("GET", url, endpoint_class, priority, headers={"X-API-Key": BUNGIE_API_KEY})
+    if not response.ok:
+        raise BungieApiError(f"Status HTTP {response.status}.")
+    if response.data.get('ErrorStatus') != 'Success':
+        raise BungieApiError(f"ErrorStatus {response.data.get('ErrorStatus')}.")
+    return response.data.get('Response') or {}
+
+async def _load_character_ids(membership_type: int, membership_id: str, priority: int) -> Tuple[str, ...]:
+    url = f"{BUNGIE_API_ROOT}/Destiny2/{membership_type}/Profile/{membership_id}/?components=100"
+    profile = await _get_public_response(url, priority, "user")
+    return tuple(profile.get('profile', {}).get('data', {}).get('characterIds', []))
+
+async def get_character_ids(membership_type: int, membership_id: str, priority: int = PRIORITY_NORMAL) -> List[str]:
+    try:
+        return list(await _character_ids_cache.get_or_load(
+            (membership_type, membership_id), lambda: _load_character_ids(membership_type, membership_id, priority)
+        ))
+    except (BungieApiError, BungieUnavailableError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao buscar personagens de {membership_id}: {e}")
+    except Exception as e:
+        print(f"BUNGIE_API_ERROR: Erro inesperado ao buscar personagens de {membership_id}: {e}")
+    return []
+
+async def get_activity_history(membership_type: int, membership_id: str, character_id: str, mode: Optional[int] = None,
+                               count: int = 25, priority: int = PRIORITY_NORMAL) -> Optional[List[Dict[str, Any]]]:
+    """Atividades mais recentes do personagem (mais novas primeiro); None se a busca falhar."""
+    url = f"{BUNGIE_API_ROOT}/Destiny2/{membership_type}/Account/{membership_id}/Character/{character_id}/Stats/Activities/?count={count}&page=0"
+    if mode is not None:
+        url += f"&mode={mode}"
+    try:
+        return (await _get_public_response(url, priority)).get('activities', [])
+    except (BungieApiError, BungieUnavailableError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao buscar histórico de {membership_id}/{character_id}: {e}")
+    except Exception as e:
+        print(f"BUNGIE_API_ERROR: Erro inesperado ao buscar histórico de {membership_id}: {e}")
+    return None
+
+async def get_post_game_carnage_report(instance_id: str, priority: int = PRIORITY_NORMAL) -> Optional[Dict[str, Any]]:
+    url = f"{STATS_API_ROOT}/Destiny2/Stats/PostGameCarnageReport/{instance_id}/"
+    try:
+        return await _get_public_response(url, priority)
+    except (BungieApiError, BungieUnavailableError) as e:
+        print(f"BUNGIE_API_ERROR: Falha ao buscar PGCR {instance_id}: {e}")
+    except Exception as e:
+        print(f"BUNGIE_API_ERROR: Erro inesperado ao buscar PGCR {instance_id}: {e}")
+    return None
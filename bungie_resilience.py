@@ -0,0 +1,106 @@
+# bungie_resilience.py
+import random
+import time
+from typing import Dict, Optional
+
+from constants import (
+    BUNGIE_BREAKER_FAILURE_THRESHOLD, BUNGIE_BREAKER_OPEN_SECONDS,
+    BUNGIE_RETRY_BASE_SECONDS, BUNGIE_RETRY_MAX_SECONDS
+)
+
+
+class BungieUnavailableError(Exception):
+    """A Bungie está em manutenção (SystemDisabled) ou inacessível; o pedido nem foi enviado."""
+
+
+def backoff_delay(attempt: int, base: float = BUNGIE_RETRY_BASE_SECONDS, cap: float = BUNGIE_RETRY_MAX_SECONDS) -> float:
+    """Espera exponencial com "full jitter" para a tentativa `attempt` (1, 2, 3...)."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class CircuitBreaker:
+    """
+    Disjuntor para a API da Bungie.
+
+    - fechado: os pedidos passam normalmente;
+    - aberto: após SystemDisabled ou `failure_threshold` falhas seguidas, todos os
+      pedidos falham logo com BungieUnavailableError durante `open_seconds`;
+    - meio-aberto: passado esse tempo, um único pedido de teste é autorizado;
+      se correr bem o disjuntor fecha, senão volta a abrir.
+    """
+    CLOSED = "fechado"
+    OPEN = "aberto"
+    HALF_OPEN = "meio-aberto"
+
+    def __init__(self, failure_threshold: int = BUNGIE_BREAKER_FAILURE_THRESHOLD,
+                 open_seconds: float = BUNGIE_BREAKER_OPEN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self._state = self.CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self.last_reason: Optional[str] = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() >= self._open_until:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """Verdadeiro enquanto o disjuntor recusa pedidos (ainda não chegou a hora do teste)."""
+        return self.state == self.OPEN
+
+    def before_request(self) -> bool:
+        """
+        Autoriza ou recusa um pedido. Devolve True se este pedido for o teste do
+        estado meio-aberto (quem chamou deve depois chamar `release_probe`).
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+            return True
+        self.rejected += 1
+        raise BungieUnavailableError(f"API da Bungie indisponível ({self.last_reason or 'disjuntor aberto'}).")
+
+    def release_probe(self):
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            print("BUNGIE_API: API da Bungie voltou a responder; disjuntor fechado.")
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self, reason: str):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.trip(reason)
+
+    def trip(self, reason: str):
+        if self._state != self.OPEN:
+            self.times_opened += 1
+            print(f"BUNGIE_API_ERROR: Disjuntor aberto por {self.open_seconds:.0f}s ({reason}).")
+        self._state = self.OPEN
+        self._open_until = time.monotonic() + self.open_seconds
+        self._probe_in_flight = False
+        self.last_reason = reason
+
+    def get_stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "last_reason": self.last_reason,
+            "reopens_in_seconds": max(0.0, self._open_until - time.monotonic()) if self._state == self.OPEN else 0.0,
+        }
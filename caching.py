@@ -0,0 +1,182 @@
+# caching.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class AsyncTTLCache:
+    """
+    Cache assíncrono com validade (TTL) por entrada e "single-flight": enquanto
+    um valor está a ser carregado, os outros pedidos pela mesma chave esperam
+    pelo mesmo carregamento em vez de dispararem o seu.
+
+    Se o carregador levantar exceção, nada é guardado e a exceção chega a todos
+    os que estavam à espera. `invalidate` descarta também carregamentos em curso,
+    para que um resultado anterior à invalidação nunca entre no cache.
+    """
+    def __init__(self, ttl: float, max_entries: int = 128):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._generation: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.joins = 0
+
+    def _store(self, key: Hashable, value: Any):
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            oldest = min(self._entries, key=lambda k: self._entries[k][0])
+            del self._entries[oldest]
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.joins += 1
+        else:
+            self.misses += 1
+            generation = self._generation.get(key, 0)
+            task = asyncio.get_running_loop().create_task(self._load(key, loader, generation))
+            self._inflight[key] = task
+        # shield: se um dos que esperam for cancelado, o carregamento continua para os outros.
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], generation: int) -> Any:
+        try:
+            value = await loader()
+            if self._generation.get(key, 0) == generation:
+                self._store(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def set(self, key: Hashable, value: Any):
+        """Grava um valor já conhecido; um carregamento em curso para a chave é descartado."""
+        self.invalidate(key)
+        self._store(key, value)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+        self._generation[key] = self._generation.get(key, 0) + 1
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        for key in [k for k in set(self._entries) | set(self._inflight) if predicate(k)]:
+            self.invalidate(key)
+
+    def clear(self):
+        self.invalidate_where(lambda _: True)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "joins": self.joins,
+        }
+
+
+class LRUCache:
+    """
+    Cache em memória limitado a `max_entries`, seguro entre threads (as funções
+    db_* correm nas threads do db_async).
+
+    Quem lê do banco pede `generation(key)` antes da consulta e passa-a a `put`:
+    se a chave foi invalidada entretanto, o valor lido (possivelmente antigo) é
+    descartado. As gerações vêm de um contador global, por isso esquecer as de
+    chaves antigas só pode recusar um `put`, nunca aceitar um valor desatualizado. Ao encher, sai a entrada menos usada para a qual `pinned` é
+    falso; só quando todas estão presas sai a menos usada de todas.
+    """
+    def __init__(self, max_entries: int, pinned: Optional[Callable[[Any], bool]] = None):
+        self.max_entries = max_entries
+        self.pinned = pinned
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._generation: Dict[Hashable, int] = {}
+        self._clock = 0
+        self._floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Como `get`, mas uma falha não conta: quem chama ainda vai fazer o `get` de verdade."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def generation(self, key: Hashable) -> int:
+        with self._lock:
+            return self._generation.get(key, self._floor)
+
+    def put(self, key: Hashable, value: Any, generation: int):
+        with self._lock:
+            if self._generation.get(key, self._floor) != generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._evict_one()
+
+    def _evict_one(self):
+        victim = next(iter(self._entries))
+        if self.pinned:
+            victim = next((k for k, v in self._entries.items() if not self.pinned(v)), victim)
+        del self._entries[victim]
+        self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._clock += 1
+            self._generation[key] = self._clock
+            self.invalidations += 1
+            if len(self._generation) > 4 * self.max_entries:
+                self._generation.clear()
+                self._floor = self._clock
+
+    def invalidate_many(self, keys):
+        for key in keys:
+            self.invalidate(key)
+
+    def get_stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -4,8 +4,13 @@ from discord import app_commands
 from discord.ext import commands
 from typing import Optional, List, Dict
 
-import database as db
+import database
+import db_async as adb
 import utils
+import retention
+import bungie_api
+import destiny_manifest
+import pgcr_verifier
 from constants import EVENT_TYPE_COLORS
 
 RANKING_ROLES_CONFIG = {
@@ -22,6 +27,7 @@ class AdminCog(commands.Cog):
     # Alteração: Removido default_permissions para tornar os comandos visíveis a todos,
     # com a verificação de permissão feita dentro de cada comando.
     admin_group = app_commands.Group(name="configurar", description="Comandos de configuração para administradores.", guild_only=True)
+    maintenance_group = app_commands.Group(name="manutencao", description="Comandos de manutenção do banco de dados.", guild_only=True)
 
     def is_owner_or_admin(self, interaction: discord.Interaction) -> bool:
         """Verifica se o usuário é o dono do servidor ou um administrador."""
@@ -40,10 +46,10 @@ class AdminCog(commands.Cog):
         if not interaction.guild_id: return
 
         if acao.value == "add":
-            db.db_add_designated_event_channel(interaction.guild_id, canal.id)
+            await adb.db_add_designated_event_channel(interaction.guild_id, canal.id)
             await interaction.response.send_message(f"✅ O canal {canal.mention} foi adicionado à lista de canais permitidos.", ephemeral=True)
         elif acao.value == "remove":
-            db.db_remove_designated_event_channel(interaction.guild_id, canal.id)
+            await adb.db_remove_designated_event_channel(interaction.guild_id, canal.id)
             await interaction.response.send_message(f"🗑️ O canal {canal.mention} foi removido da lista.", ephemeral=True)
 
     @admin_group.command(name="canal_resumo", description="Define ou remove o canal para o resumo diário de eventos.")
@@ -55,10 +61,10 @@ class AdminCog(commands.Cog):
         if not interaction.guild_id: return
 
         if canal:
-            db.db_set_server_config(interaction.guild_id, digest_channel_id=canal.id)
+            await adb.db_set_server_config(interaction.guild_id, digest_channel_id=canal.id)
             await interaction.response.send_message(f"✅ O resumo diário de eventos será enviado em {canal.mention}.", ephemeral=True)
         else:
-            db.db_set_server_config(interaction.guild_id, digest_channel_id=None)
+            await adb.db_set_server_config(interaction.guild_id, digest_channel_id=None)
             await interaction.response.send_message("🗑️ O canal de resumo diário foi removido.", ephemeral=True)
 
     @admin_group.command(name="ranking", description="Configura o sistema de ranking de atividade por voz.")
@@ -70,7 +76,7 @@ class AdminCog(commands.Cog):
         if not interaction.guild or not interaction.guild_id: return
         await interaction.response.defer(ephemeral=True)
 
-        db.db_set_server_config(interaction.guild_id, ranking_channel_id=canal_ranking.id)
+        await adb.db_set_server_config(interaction.guild_id, ranking_channel_id=canal_ranking.id)
 
         created_roles_log = []
         existing_roles_log = []
@@ -100,7 +106,7 @@ class AdminCog(commands.Cog):
                     await interaction.followup.send(f"❌ Erro ao criar o cargo '{role_name}': {e}", ephemeral=True)
                     return
 
-        db.db_set_ranking_roles(interaction.guild_id, role_ids_to_db)
+        await adb.db_set_ranking_roles(interaction.guild_id, role_ids_to_db)
 
         msg = f"✅ **Sistema de Ranking Configurado!**\n\n"
         msg += f"📰 Canal da classificação: {canal_ranking.mention}\n"
@@ -120,7 +126,7 @@ class AdminCog(commands.Cog):
         if not interaction.guild_id: return
 
         penalty_id = cargo_penalidade.id if cargo_penalidade else None
-        db.db_set_server_config(interaction.guild_id, mod_notification_channel_id=canal_moderadores.id, penalty_role_id=penalty_id)
+        await adb.db_set_server_config(interaction.guild_id, mod_notification_channel_id=canal_moderadores.id, penalty_role_id=penalty_id)
 
         msg = f"✅ Canal de notificação de moderadores definido para {canal_moderadores.mention}.\n"
         if cargo_penalidade:
@@ -140,12 +146,12 @@ class AdminCog(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
-        bungie_profile = db.db_get_bungie_profile(admin.id)
+        bungie_profile = await adb.db_get_bungie_profile(admin.id)
         if not bungie_profile:
             await interaction.followup.send(f"❌ O usuário {admin.mention} não possui uma conta Bungie vinculada. Peça para ele usar `/vincular_bungie`.", ephemeral=True)
             return
 
-        db.db_set_server_config(interaction.guild_id, clan_admin_discord_id=admin.id)
+        await adb.db_set_server_config(interaction.guild_id, clan_admin_discord_id=admin.id)
         await interaction.followup.send(f"✅ {admin.mention} foi definido como o Administrador do Clã para as ações da API.", ephemeral=True)
 
     @admin_group.command(name="cargo_cla", description="Define o cargo que será atribuído aos membros do clã.")
@@ -156,9 +162,89 @@ class AdminCog(commands.Cog):
             return
         if not interaction.guild_id: return
 
-        db.db_set_server_config(interaction.guild_id, clan_role_id=cargo.id)
+        await adb.db_set_server_config(interaction.guild_id, clan_role_id=cargo.id)
         await interaction.response.send_message(f"✅ O cargo {cargo.mention} foi definido como o cargo oficial do clã.", ephemeral=True)
 
+    @admin_group.command(name="clas", description="Adiciona ou remove um clã da Bungie gerido por este servidor.")
+    @app_commands.describe(clan_id="O ID do clã na Bungie.net.", acao="Adicionar ou remover o clã.", admin="Administrador deste clã (opcional; usa o admin_cla do servidor).")
+    @app_commands.choices(acao=[
+        app_commands.Choice(name="Adicionar", value="add"),
+        app_commands.Choice(name="Remover", value="remove")
+    ])
+    async def configurar_clas(self, interaction: discord.Interaction, clan_id: str, acao: app_commands.Choice[str], admin: Optional[discord.Member] = None):
+        if not self.is_owner_or_admin(interaction):
+            await interaction.response.send_message("Este comando é restrito ao dono do servidor ou administradores.", ephemeral=True)
+            return
+        if not interaction.guild_id: return
+
+        clan_id = clan_id.strip()
+        if not clan_id.isdigit():
+            await interaction.response.send_message("❌ O ID do clã deve ser numérico (ex.: `1234567`).", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        if acao.value == "add":
+            if admin and not await adb.db_get_bungie_profile(admin.id):
+                await interaction.followup.send(f"❌ O usuário {admin.mention} não possui uma conta Bungie vinculada. Peça para ele usar `/vincular_bungie`.", ephemeral=True)
+                return
+            await adb.db_add_guild_clan(interaction.guild_id, clan_id, admin.id if admin else None)
+            bungie_api.invalidate_clan_cache(clan_id)
+            admin_text = f" com {admin.mention} como administrador" if admin else ""
+            await interaction.followup.send(f"✅ O clã `{clan_id}` foi adicionado{admin_text}.", ephemeral=True)
+        elif acao.value == "remove":
+            removed = await adb.db_remove_guild_clan(interaction.guild_id, clan_id)
+            bungie_api.invalidate_clan_cache(clan_id)
+            if removed:
+                await interaction.followup.send(f"🗑️ O clã `{clan_id}` foi removido da lista.", ephemeral=True)
+            else:
+                await interaction.followup.send(f"ℹ️ O clã `{clan_id}` não estava configurado.", ephemeral=True)
+
+    @admin_group.command(name="verificacao_pgcr", description="Confirma presenças pelos relatórios de partida da Bungie (PGCR).")
+    @app_commands.describe(ativar="Se ativado, quem jogou a atividade do evento fora do canal de voz deixa de contar como ausente.")
+    async def configurar_verificacao_pgcr(self, interaction: discord.Interaction, ativar: bool):
+        if not self.is_owner_or_admin(interaction):
+            await interaction.response.send_message("Este comando é restrito ao dono do servidor ou administradores.", ephemeral=True)
+            return
+        if not interaction.guild_id: return
+
+        await adb.db_set_server_config(interaction.guild_id, pgcr_verification=1 if ativar else 0)
+        if ativar:
+            await interaction.response.send_message("✅ Verificação por PGCR ativada. Ausências de membros com conta Bungie vinculada serão revistas algumas horas após cada evento.", ephemeral=True)
+        else:
+            await interaction.response.send_message("🗑️ Verificação por PGCR desativada.", ephemeral=True)
+
+    @maintenance_group.command(name="reconstruir_tempo_voz", description="Reconstrói o agregado diário de tempo de voz a partir do histórico.")
+    async def manutencao_reconstruir_tempo_voz(self, interaction: discord.Interaction):
+        if not self.is_owner_or_admin(interaction):
+            await interaction.response.send_message("Este comando é restrito ao dono do servidor ou administradores.", ephemeral=True)
+            return
+        if not interaction.guild_id: return
+        await interaction.response.defer(ephemeral=True)
+
+        sessions = await adb.db_rebuild_voice_daily_totals(interaction.guild_id)
+        await interaction.followup.send(f"✅ Agregado de tempo de voz reconstruído a partir de {sessions} sessões registradas.", ephemeral=True)
+
+    @maintenance_group.command(name="retencao", description="Arquiva e remove dados antigos agora, em vez de esperar a rotina diária.")
+    async def manutencao_retencao(self, interaction: discord.Interaction):
+        if not self.is_owner_or_admin(interaction):
+            await interaction.response.send_message("Este comando é restrito ao dono do servidor ou administradores.", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+
+        report = await retention.run_retention()
+        await interaction.followup.send(f"🧹 Retenção concluída: {retention.format_retention_report(report)}", ephemeral=True)
+
+    @maintenance_group.command(name="manifesto", description="Atualiza a cópia local do manifesto do Destiny usada para reconhecer atividades.")
+    @app_commands.describe(forcar="Descarrega de novo mesmo que a versão não tenha mudado.")
+    async def manutencao_manifesto(self, interaction: discord.Interaction, forcar: bool = False):
+        if not self.is_owner_or_admin(interaction):
+            await interaction.response.send_message("Este comando é restrito ao dono do servidor ou administradores.", ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+
+        summary = await destiny_manifest.refresh(force=forcar)
+        await interaction.followup.send(f"📚 {summary}", ephemeral=True)
+
     @app_commands.command(name="ver_configuracoes", description="Mostra as configurações atuais do bot neste servidor.")
     @app_commands.guild_only()
     async def ver_configuracoes(self, interaction: discord.Interaction):
@@ -168,8 +254,8 @@ class AdminCog(commands.Cog):
         if not interaction.guild or not interaction.guild_id: return
         await interaction.response.defer(ephemeral=True)
 
-        configs = db.db_get_server_configs(interaction.guild_id)
-        ranking_roles_data = db.db_get_ranking_roles(interaction.guild_id)
+        configs = await adb.db_get_server_configs(interaction.guild_id)
+        ranking_roles_data = await adb.db_get_ranking_roles(interaction.guild_id)
 
         embed = discord.Embed(title=f"Configurações do Bot para {interaction.guild.name}", color=discord.Color.blurple())
 
@@ -188,6 +274,19 @@ class AdminCog(commands.Cog):
             admin_cla_mention = f"<@{admin_cla_id}>"
         embed.add_field(name="👑 Administrador do Clã (API)", value=admin_cla_mention, inline=False)
 
+        guild_clans = await adb.db_get_guild_clans(interaction.guild_id)
+        if guild_clans:
+            clans_text = "\n".join(
+                f"`{row['clan_id']}`" + (f" (admin: <@{row['admin_discord_id']}>)" if row['admin_discord_id'] else "")
+                for row in guild_clans
+            )
+        else:
+            clans_text = "Apenas o clã padrão (`BUNGIE_CLAN_ID`). Use `/configurar clas`."
+        embed.add_field(name="🛡️ Clãs Bungie", value=clans_text[:1024], inline=False)
+
+        pgcr_text = "Ativada" if configs and configs.get('pgcr_verification') else "Desativada. Use `/configurar verificacao_pgcr`."
+        embed.add_field(name="🎯 Verificação de Presença por PGCR", value=pgcr_text, inline=False)
+
         ranking_text = ""
         if ranking_roles_data:
             for i in range(1, 5):
@@ -200,5 +299,103 @@ class AdminCog(commands.Cog):
 
         await interaction.followup.send(embed=embed, ephemeral=True)
 
+    @app_commands.command(name="diagnostico", description="Mostra métricas internas de desempenho do bot.")
+    @app_commands.guild_only()
+    async def diagnostico(self, interaction: discord.Interaction):
+        if not self.is_owner_or_admin(interaction):
+            await interaction.response.send_message("Este comando é restrito ao dono do servidor ou administradores.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+        embed = discord.Embed(title="🩺 Diagnóstico do Bot", color=discord.Color.blurple())
+
+        loop_lag = getattr(self.bot, 'loop_lag', None)
+        if loop_lag:
+            lag = loop_lag.get_stats()
+            embed.add_field(
+                name="Event Loop",
+                value=f"**Atraso atual:** {lag['last_ms']:.1f} ms\n**p50/p99:** {lag['p50_ms']:.1f} / {lag['p99_ms']:.1f} ms\n**Máximo:** {lag['max_ms']:.1f} ms\n**Bloqueios:** {lag['stalls']}",
+                inline=False
+            )
+
+        db_stats = adb.get_stats()
+        db_lines = []
+        for kind, label in (("read", "Leituras"), ("write", "Escritas")):
+            st = db_stats[kind]
+            db_lines.append(f"**{label}:** {int(st['calls'])} (pendentes: {int(st['pending'])}, média {st['avg_ms']:.2f} ms, máx {st['max_ms']:.1f} ms)")
+        plan_regressions = await adb.db_check_hot_query_plans()
+        if plan_regressions:
+            db_lines.append(f"⚠️ **Consultas sem índice:** {', '.join(plan_regressions)}")
+        else:
+            db_lines.append("✅ Todas as consultas frequentes usam índices.")
+        for cache_name, st in database.get_cache_stats().items():
+            db_lines.append(f"**Cache {cache_name}:** {st['hits']} acertos / {st['misses']} falhas ({st['hit_rate']:.0%}), {st['entries']} em memória, {st['evictions']} removidos")
+        embed.add_field(name="Banco de Dados", value="\n".join(db_lines), inline=False)
+
+        api_lines = []
+        for endpoint_class, st in bungie_api.client.get_rate_limit_stats().items():
+            if not st['granted'] and not st['queued']:
+                continue
+            api_lines.append(f"**{endpoint_class}:** {int(st['granted'])} pedidos (fila: {int(st['queued'])}, espera média {st['avg_wait_ms']:.0f} ms, máx {st['max_wait_ms']:.0f} ms, limitados: {int(st['throttled'])})")
+        breaker = bungie_api.client.breaker.get_stats()
+        breaker_line = f"**Disjuntor:** {breaker['state']} (aberto {breaker['times_opened']}x, {breaker['rejected']} pedidos recusados)"
+        if breaker['state'] != "fechado" and breaker['last_reason']:
+            breaker_line += f"\n↳ Motivo: {breaker['last_reason']}, novo teste em {breaker['reopens_in_seconds']:.0f}s"
+        api_lines.append(breaker_line)
+        for cache_name, st in bungie_api.get_cache_stats().items():
+            api_lines.append(f"**Cache {cache_name}:** {st['hits']} acertos, {st['misses']} downloads, {st['joins']} pedidos partilhados")
+        pgcr = pgcr_verifier.get_stats()
+        if pgcr['hits'] or pgcr['misses']:
+            api_lines.append(f"**PGCRs:** {pgcr['hits']} lidos do disco, {pgcr['misses']} descarregados")
+        embed.add_field(name="API Bungie", value="\n".join(api_lines) or "Nenhum pedido desde o arranque.", inline=False)
+
+        manifest = destiny_manifest.get_stats()
+        embed.add_field(
+            name="Manifesto Destiny",
+            value=f"**Fonte:** {manifest['source']} (versão {manifest['version'] or '-'})\n**Atividades:** {manifest['activities']} ({manifest['aliases']} nomes)\n**Consultas:** {manifest['lookups']} (média {manifest['avg_lookup_us']:.0f} µs)",
+            inline=False
+        )
+
+        coalescer = getattr(self.bot, 'render_coalescer', None)
+        if coalescer:
+            render = coalescer.get_stats()
+            embeds = utils.get_event_embed_cache_stats()
+            embed.add_field(
+                name="Mensagens de Eventos",
+                value=f"**Pedidos de atualização:** {render['requests']}\n**Edições feitas:** {render['renders']} ({render['saved']} poupadas, {render['failures']} falhas)\n**Edições sem mudanças evitadas:** {render['skipped']}\n**Embeds reaproveitados:** {embeds['hits']} ({embeds['hit_rate']:.0%})",
+                inline=False
+            )
+
+        profiles = getattr(self.bot, 'profile_cache', None)
+        if profiles:
+            prof = profiles.get_stats()
+            embed.add_field(
+                name="Cache de Perfis",
+                value=f"**Consultas:** {prof['lookups']} ({prof['hit_rate']:.0%} no cache, {prof['from_gateway']} do gateway)\n**fetch_user:** {prof['rest_fetches']} (evitados: {prof['rest_avoided']})\n**Em memória:** {prof['entries']} ({prof['seeded']} semeados)",
+                inline=False
+            )
+
+        outbox = getattr(self.bot, 'dm_outbox', None)
+        if outbox:
+            dm = outbox.get_stats()
+            dm_counts = await adb.db_get_dm_outbox_counts()
+            embed.add_field(
+                name="Fila de DMs",
+                value=f"**Na fila:** {dm_counts.get('pendente', 0)} (a enviar: {dm['in_flight']}, duplicadas ignoradas: {dm['duplicates']})\n**Enviadas:** {dm['sent']} (latência média {dm['avg_latency_s']:.1f}s, máx {dm['max_latency_s']:.1f}s)\n**Bloqueadas/Falhas:** {dm['blocked']} / {dm['failed']}",
+                inline=False
+            )
+
+        scheduler = getattr(self.bot, 'job_scheduler', None)
+        if scheduler:
+            sched = scheduler.get_stats()
+            next_due = f"{sched['next_due_in_seconds']:.0f}s" if sched['next_due_in_seconds'] is not None else "-"
+            embed.add_field(
+                name="Agendador de Eventos",
+                value=f"**Pendentes:** {sched['pending']} (próxima em {next_due}, a correr: {sched['running']})\n**Executadas:** {sched['executed']} (atraso médio {sched['avg_delay_ms']:.0f} ms, máx {sched['max_delay_ms']:.0f} ms)\n**Expiradas/Falhas/Repetidas:** {sched['expired']} / {sched['failed']} / {sched['retried']}",
+                inline=False
+            )
+
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
 async def setup(bot: commands.Bot):
     await bot.add_cog(AdminCog(bot))
\ No newline at end of file
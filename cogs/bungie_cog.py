@@ -8,7 +8,7 @@ import pytz  # Adicionado para corrigir o NameError
 from urllib.parse import urlparse, parse_qs
 
 import bungie_api
-import database as db
+import db_async as adb
 from config import BUNGIE_CLIENT_ID
 
 class BungieCog(commands.Cog):
@@ -90,7 +90,7 @@ class BungieCog(commands.Cog):
             bungie_membership_id = destiny_membership['membershipId']
             bungie_membership_type = destiny_membership['membershipType']
 
-            db.db_save_bungie_profile(
+            await adb.db_save_bungie_profile(
                 discord_id=original_user_id,
                 bungie_membership_id=bungie_membership_id,
                 bungie_membership_type=bungie_membership_type,
@@ -99,6 +99,7 @@ class BungieCog(commands.Cog):
                 refresh_token=refresh_token,
                 token_expires_at=token_expires_at
             )
+            bungie_api.remember_tokens(original_user_id, access_token, refresh_token, datetime.datetime.fromisoformat(token_expires_at))
 
             await message.channel.send(f"✅ **Sucesso!** Sua conta do Discord foi vinculada ao perfil da Bungie: **{bungie_name}**.")
 
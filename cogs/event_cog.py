@@ -12,12 +12,13 @@ from typing import Literal, Optional, List, Dict, Any
 import dateparser
 
 # Imports customizados
-import database as db
+import db_async as adb
 import utils 
 import role_utils 
 from constants import (
     BRAZIL_TZ, BRAZIL_TZ_STR,
-    DIAS_SEMANA_PT_FULL, DIAS_SEMANA_PT_SHORT, MESES_PT
+    DIAS_SEMANA_PT_FULL, DIAS_SEMANA_PT_SHORT, MESES_PT,
+    RSVP_SEND_CONFIRMATION, RSVP_FAST_PATH_TIMEOUT_SECONDS
 )
 from utils import SelectChannelView, SelectActivityDetailsView, ConfirmActivityView
 
@@ -80,13 +81,13 @@ class EventModal(discord.ui.Modal, title="✏️ Agendar / Editar Evento"):
         }
 
         if self.is_edit and self.event_id:
-            db.db_update_event_details(self.event_id, **event_data)
+            await adb.db_update_event_details(self.event_id, **event_data)
             await interaction.followup.send("✅ Evento atualizado com sucesso!", ephemeral=True)
-            original_event = db.db_get_event_details(self.event_id)
+            original_event = await adb.db_get_event_details(self.event_id)
             if original_event and original_event['message_id']:
                 await self.parent_view_instance._update_event_message_embed(self.event_id, original_event['channel_id'], original_event['message_id'])
         else:
-            event_id = db.db_create_event(
+            event_id = await adb.db_create_event(
                 guild_id=interaction.guild_id, channel_id=interaction.channel_id,
                 creator_id=interaction.user.id, created_at_utc=datetime.datetime.now(pytz.utc).isoformat(),
                 **event_data
@@ -128,7 +129,7 @@ class EditOptionsView(discord.ui.View):
 
     @discord.ui.button(label="Título/Desc/Data/Hora", style=discord.ButtonStyle.green, custom_id="edit_basic_details_opt", emoji="📝")
     async def edit_basic_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
-        event_details = db.db_get_event_details(self.event_id)
+        event_details = await adb.db_get_event_details(self.event_id)
         if not event_details:
             await interaction.response.send_message("Evento não encontrado.", ephemeral=True)
             await self.disable_all_buttons(interaction, "Erro: Evento não encontrado."); return
@@ -145,7 +146,7 @@ class EditOptionsView(discord.ui.View):
         await interaction.response.defer(ephemeral=True)
         user = interaction.user
         dm_channel = await user.create_dm()
-        event_details = db.db_get_event_details(self.event_id)
+        event_details = await adb.db_get_event_details(self.event_id)
         if not event_details:
             await dm_channel.send("Erro: Evento não encontrado."); self.stop(); return
         await interaction.followup.send("Edição de Tipo/Vagas continuará na sua DM.", ephemeral=True)
@@ -161,7 +162,9 @@ class EditOptionsView(discord.ui.View):
             new_activity_type = type_details_view.selected_activity_type
             new_max_attendees = type_details_view.selected_max_attendees
             if new_activity_type != event_details['activity_type'] or new_max_attendees != event_details['max_attendees']:
-                db.db_update_event_details(event_id=self.event_id, activity_type=new_activity_type, max_attendees=new_max_attendees)
+                await adb.db_update_event_details(event_id=self.event_id, activity_type=new_activity_type, max_attendees=new_max_attendees)
+                promoted = await adb.db_rebalance_waitlist(self.event_id)
+                await utils.notify_waitlist_promotions(self.bot, event_details, promoted)
                 await dm_channel.send(f"Tipo/Vagas atualizados para '{new_activity_type}' ({new_max_attendees} vagas).")
                 if self.parent_view_instance and event_details['channel_id'] and event_details['message_id']:
                     await self.parent_view_instance._update_event_message_embed(self.event_id, event_details['channel_id'], event_details['message_id'])
@@ -199,25 +202,18 @@ class ConfirmDeleteView(discord.ui.View):
     @discord.ui.button(label="Sim, Apagar Evento", style=discord.ButtonStyle.danger, custom_id="confirm_delete_event_yes")
     async def confirm_yes_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer() 
-        event_details = db.db_get_event_details(self.event_id)
+        event_details = await adb.db_get_event_details(self.event_id)
         if not event_details:
             await self.disable_all_buttons("Erro: Evento não encontrado.");
             await self.original_button_interaction.followup.send("Erro: Evento não encontrado ao apagar.", ephemeral=True); return
 
-        attendees_to_notify = db.db_get_rsvps_for_event(self.event_id).get('vou', [])
+        attendees_to_notify = (await adb.db_get_rsvps_for_event(self.event_id)).get('vou', [])
         notification_message = f"ℹ️ O evento **'{event_details['title']}'** para o qual você estava inscrito(a) foi cancelado."
-        for user_id_notify in attendees_to_notify:
-            try:
-                member_to_notify = await self.bot.fetch_user(user_id_notify)
-                if not member_to_notify.bot:
-                    await member_to_notify.send(notification_message)
-                    await asyncio.sleep(1)
-            except Exception as e_dm_cancel:
-                print(f"WARN: Não foi possível enviar DM de cancelamento para {user_id_notify}: {e_dm_cancel}")
+        await self.bot.dm_outbox.enqueue(attendees_to_notify, "cancelamento", notification_message, event_id=self.event_id)
 
         delete_time = datetime.datetime.now(pytz.utc) + datetime.timedelta(hours=1)
-        db.db_update_event_status(self.event_id, 'cancelado', delete_time.isoformat())
-        db.db_update_event_details(event_id=self.event_id, temp_role_id=None)
+        await adb.db_update_event_status(self.event_id, 'cancelado', delete_time.isoformat())
+        await adb.db_update_event_details(event_id=self.event_id, temp_role_id=None)
 
         if event_details['message_id'] and event_details['channel_id'] and self.parent_view_instance:
             await self.parent_view_instance._update_event_message_embed(self.event_id, event_details['channel_id'], event_details['message_id'])
@@ -249,40 +245,119 @@ class PersistentRsvpView(discord.ui.View):
         return int(match.group(1))
 
     async def _handle_rsvp_logic(self, interaction: discord.Interaction, new_status: str, event_id: int):
-        await interaction.response.defer(ephemeral=True)
-        event_details = db.db_get_event_details(event_id)
-        if not event_details: return
-        db.db_add_or_update_rsvp(event_id, interaction.user.id, new_status)
-        await self._update_event_message_embed(event_id, event_details['channel_id'], event_details['message_id'])
-        await interaction.followup.send(f"Sua resposta foi atualizada para '{new_status}'.", ephemeral=True)
-
-    async def _update_event_message_embed(self, event_id: int, channel_id: int, message_id: int | None):
-        if message_id is None: return
+        # A mensagem do evento vem na própria interação: grava o RSVP e responde ao clique
+        # com a edição da mensagem, num único pedido HTTP (sem defer/fetch_message/followup).
+        # Se o banco ou o embed demorarem (escritor ocupado, perfil fora do cache), o clique é
+        # confirmado com defer antes do prazo do Discord e a edição segue pelo coalescer.
+        work = asyncio.ensure_future(self._apply_rsvp_and_render(event_id, interaction.user.id, new_status))
+        message_id = interaction.message.id
         try:
-            target_channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
-            if not isinstance(target_channel, discord.TextChannel): return
-            message_to_edit = await target_channel.fetch_message(message_id)
-            event_details = db.db_get_event_details(event_id)
-            if not event_details: return
-            if event_details['status'] in ['cancelado', 'concluido']:
-                embed = message_to_edit.embeds[0]
-                embed.title = f"[{event_details['status'].upper()}] {embed.title}"
-                embed.color = discord.Color.dark_grey()
-                await message_to_edit.edit(embed=embed, view=None)
+            done, _ = await asyncio.wait([work], timeout=RSVP_FAST_PATH_TIMEOUT_SECONDS)
+            deferred = not done
+            if deferred:
+                await interaction.response.defer()
+            error, result, embed, content_key = await work
+            if error:
+                if deferred: await interaction.followup.send(error, ephemeral=True)
+                else: await interaction.response.send_message(error, ephemeral=True)
                 return
-            rsvps_data = db.db_get_rsvps_for_event(event_id)
-            embed = await utils.build_event_embed(event_details, rsvps_data, self.bot)
-            await message_to_edit.edit(embed=embed, view=self)
+            coalescer = self.bot.render_coalescer
+            event_details = result['event']
+            if deferred:
+                self._schedule_event_message_render(event_id, event_details['channel_id'], message_id, delay=0)
+            else:
+                seq = coalescer.bump(message_id)
+                if coalescer.is_applied(message_id, content_key):
+                    # Nada mudou (ex.: repetiu o mesmo botão): só confirma o clique, sem editar.
+                    await interaction.response.defer()
+                else:
+                    is_closed = event_details['status'] in ['cancelado', 'concluido']
+                    await interaction.response.edit_message(embed=embed, view=None if is_closed else self)
+                self._after_event_message_edit(event_id, event_details['channel_id'], message_id, content_key, seq)
         except Exception as e:
-            print(f"ERRO em _update_event_message_embed: {e}")
+            print(f"ERRO_RSVP: Falha ao processar o clique de {interaction.user.id} no evento {event_id}: {e}")
+            self._render_after_failed_rsvp(work, event_id, interaction.channel_id, message_id)
+            error = "Não foi possível registar a sua resposta. Tente novamente."
+            try:
+                if interaction.response.is_done(): await interaction.followup.send(error, ephemeral=True)
+                else: await interaction.response.send_message(error, ephemeral=True)
+            except discord.HTTPException:
+                pass  # A interação já expirou; a mensagem do evento é corrigida pelo coalescer.
+            return
+        await utils.notify_waitlist_promotions(self.bot, event_details, result['promoted'])
+        if result['status'] == 'lista_espera' and new_status == 'vou':
+            await interaction.followup.send("⌛ O evento está lotado: você entrou na lista de espera e será avisado(a) por DM se abrir uma vaga.", ephemeral=True)
+        elif RSVP_SEND_CONFIRMATION:
+            await interaction.followup.send(f"Sua resposta foi atualizada para '{new_status}'.", ephemeral=True)
+
+    async def _apply_rsvp_and_render(self, event_id: int, user_id: int, new_status: str):
+        """Devolve (erro, resultado do db_apply_rsvp, embed, chave de conteúdo)."""
+        if not await adb.db_get_event_details(event_id):
+            return "Evento não encontrado.", None, None, None
+        # Grava o RSVP, decide confirmado/lista de espera e promove da espera numa só transação.
+        result = await adb.db_apply_rsvp(event_id, user_id, new_status)
+        if not result:
+            return "Não foi possível registar a sua resposta. Tente novamente.", None, None, None
+        embed, content_key = await utils.render_event_embed(result['event'], result['rsvps'], self.bot)
+        return None, result, embed, content_key
+
+    def _render_after_failed_rsvp(self, work: asyncio.Future, event_id: int, channel_id: int, message_id: int):
+        """
+        O RSVP pode ter sido gravado antes da falha (ou ainda estar a ser): quando o trabalho
+        acabar, o coalescer volta a desenhar a mensagem a partir do banco, com nova sequência.
+        """
+        def rerender(task: asyncio.Future):
+            if not task.cancelled():
+                task.exception()  # Já registado acima; evita o aviso "exception was never retrieved".
+            self._schedule_event_message_render(event_id, channel_id, message_id)
+        if work.done(): rerender(work)
+        else: work.add_done_callback(rerender)
+
+    def _after_event_message_edit(self, event_id: int, channel_id: int, message_id: int, content_key, seq: int):
+        coalescer = self.bot.render_coalescer
+        coalescer.mark_applied(message_id, content_key, seq)
+        if not coalescer.is_latest(message_id, seq):
+            # Outro clique/edição chegou entretanto; esta edição pode ter ficado por cima de uma mais nova.
+            self._schedule_event_message_render(event_id, channel_id, message_id)
+
+    def _schedule_event_message_render(self, event_id: int, channel_id: int, message_id: int | None, delay: float | None = None):
+        if message_id is None: return None
+        return self.bot.render_coalescer.schedule(
+            message_id, lambda: self._render_event_message(event_id, channel_id, message_id), delay=delay
+        )
+
+    async def _update_event_message_embed(self, event_id: int, channel_id: int, message_id: int | None):
+        """Atualiza já a mensagem do evento (edições, cancelamento, conclusão) e espera pelo resultado."""
+        waiter = self._schedule_event_message_render(event_id, channel_id, message_id, delay=0)
+        if waiter is not None:
+            await asyncio.wait([waiter])
+
+    async def _render_event_message(self, event_id: int, channel_id: int, message_id: int) -> bool:
+        coalescer = self.bot.render_coalescer
+        seq = coalescer.bump(message_id)
+        event_details = await adb.db_get_event_details(event_id)
+        if not event_details: return False
+        rsvps_data = await adb.db_get_rsvps_for_event(event_id)
+        embed, content_key = await utils.render_event_embed(event_details, rsvps_data, self.bot)
+        if coalescer.is_applied(message_id, content_key):
+            return False
+        target_channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+        if not isinstance(target_channel, discord.TextChannel): return False
+        # O embed vem todo do banco, por isso basta uma mensagem parcial (sem fetch_message).
+        message_to_edit = target_channel.get_partial_message(message_id)
+        is_closed = event_details['status'] in ['cancelado', 'concluido']
+        await message_to_edit.edit(embed=embed, view=None if is_closed else self)
+        self._after_event_message_edit(event_id, channel_id, message_id, content_key, seq)
+        return True
 
     async def send_initial_message(self, channel: discord.TextChannel, event_id: int):
-        event_details = db.db_get_event_details(event_id)
+        event_details = await adb.db_get_event_details(event_id)
         if not event_details: return
-        rsvps_data = db.db_get_rsvps_for_event(event_id)
-        embed = await utils.build_event_embed(event_details, rsvps_data, self.bot)
+        rsvps_data = await adb.db_get_rsvps_for_event(event_id)
+        embed, content_key = await utils.render_event_embed(event_details, rsvps_data, self.bot)
         message = await channel.send(embed=embed, view=self)
-        db.db_update_event_message_id(event_id, message.id)
+        await adb.db_update_event_message_id(event_id, message.id)
+        self.bot.render_coalescer.mark_applied(message.id, content_key, self.bot.render_coalescer.bump(message.id))
 
     @discord.ui.button(label=None, emoji="✅", style=discord.ButtonStyle.secondary, custom_id="persistent_rsvp_vou")
     async def vou_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -303,7 +378,7 @@ class PersistentRsvpView(discord.ui.View):
     async def edit_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
         event_id = await self._extract_event_id_from_interaction(interaction)
         if event_id is None: return
-        event_details = db.db_get_event_details(event_id)
+        event_details = await adb.db_get_event_details(event_id)
         if not await utils.is_user_event_manager(interaction, event_details['creator_id'], 'editar_qualquer_evento'):
             return await interaction.response.send_message("Você não tem permissão para editar este evento.", ephemeral=True)
         edit_view = EditOptionsView(self.bot, event_id, interaction, self)
@@ -314,7 +389,7 @@ class PersistentRsvpView(discord.ui.View):
     async def delete_button_callback(self, interaction: discord.Interaction, button: discord.ui.Button):
         event_id = await self._extract_event_id_from_interaction(interaction)
         if event_id is None: return
-        event_details = db.db_get_event_details(event_id)
+        event_details = await adb.db_get_event_details(event_id)
         if not await utils.is_user_event_manager(interaction, event_details['creator_id'], 'apagar_qualquer_evento'):
             return await interaction.response.send_message("Você não tem permissão para apagar este evento.", ephemeral=True)
         confirm_view = ConfirmDeleteView(self.bot, event_id, interaction, self)
@@ -332,7 +407,7 @@ class EventCog(commands.Cog):
     async def agendar(self, interaction: discord.Interaction):
         if not await utils.check_event_permission(interaction, 'criar_eventos'):
             return await interaction.response.send_message("Você não tem permissão para criar eventos.", ephemeral=True)
-        allowed_channels = db.db_get_designated_event_channels(interaction.guild.id)
+        allowed_channels = await adb.db_get_designated_event_channels(interaction.guild.id)
         if allowed_channels and interaction.channel.id not in allowed_channels:
             mentions = " ".join([f"<#{cid}>" for cid in allowed_channels])
             return await interaction.response.send_message(f"Eventos só podem ser criados em: {mentions}", ephemeral=True)
@@ -379,17 +454,16 @@ class EventCog(commands.Cog):
     ])
     async def gerenciar_rsvp(self, interaction: discord.Interaction, id_do_evento: int, acao: Literal['vou', 'lista_espera', 'talvez', 'nao_vou', 'remover'], usuario: discord.Member):
         await interaction.response.defer(ephemeral=True)
-        event_details = db.db_get_event_details(id_do_evento)
+        event_details = await adb.db_get_event_details(id_do_evento)
         if not event_details:
             return await interaction.followup.send(f"Evento com ID {id_do_evento} não encontrado.", ephemeral=True)
         if not await utils.is_user_event_manager(interaction, event_details['creator_id'], 'gerir_rsvp_qualquer_evento'):
             return await interaction.followup.send("Você não tem permissão para gerenciar os RSVPs deste evento.", ephemeral=True)
-        if acao == 'remover':
-            db.db_remove_rsvp(id_do_evento, usuario.id)
-            action_desc = "RSVP removido"
-        else:
-            db.db_add_or_update_rsvp(id_do_evento, usuario.id, acao)
-            action_desc = f"status definido para '{acao}'"
+        # Gestores podem pôr alguém em 'vou' acima da capacidade (force); remover um confirmado promove da espera.
+        result = await adb.db_apply_rsvp(id_do_evento, usuario.id, None if acao == 'remover' else acao, force=True)
+        if result:
+            await utils.notify_waitlist_promotions(self.bot, event_details, result['promoted'])
+        action_desc = "RSVP removido" if acao == 'remover' else f"status definido para '{acao}'"
 
         await self.persistent_view._update_event_message_embed(id_do_evento, event_details['channel_id'], event_details['message_id'])
         await interaction.followup.send(f"✅ {action_desc} para o usuário {usuario.mention} no evento ID {id_do_evento}.", ephemeral=True)
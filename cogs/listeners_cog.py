@@ -3,7 +3,7 @@ import discord
 from discord.ext import commands
 import datetime
 import pytz
-import database as db
+import db_async as adb
 from constants import BRAZIL_TZ
 
 class ListenersCog(commands.Cog):
@@ -11,6 +11,24 @@ class ListenersCog(commands.Cog):
         self.bot = bot
         self.voice_sessions = {}  # user_id -> session_start_time
 
+    # --- Cache de perfis (profile_cache.py) ---
+    @commands.Cog.listener()
+    async def on_ready(self):
+        for guild in self.bot.guilds:
+            self.bot.profile_cache.seed(guild.members)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        self.bot.profile_cache.remember(after)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.bot.profile_cache.remember(after)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.bot.profile_cache.remember(member)
+
     @commands.Cog.listener()
     async def on_voice_state_update(self, member: discord.Member, before: discord.VoiceState, after: discord.VoiceState):
         if member.bot:
@@ -33,7 +51,7 @@ class ListenersCog(commands.Cog):
                 duration_seconds = int(duration.total_seconds())
 
                 if duration_seconds > 10:  # Log sessions longer than 10 seconds
-                    db.db_log_voice_session(
+                    await adb.db_log_voice_session(
                         user_id=user_id,
                         guild_id=member.guild.id,
                         session_start_utc=session_start.isoformat(),
@@ -4,7 +4,7 @@ from discord import app_commands
 from discord.ext import commands
 from typing import Literal, Dict, List
 
-import database as db
+import db_async as adb
 
 # Definir as permissões disponíveis para que sejam consistentes em todo o cog
 AVAILABLE_PERMISSIONS = Literal[
@@ -47,7 +47,7 @@ class PermissionsCog(commands.Cog):
     )
     async def add_permission(self, interaction: discord.Interaction, cargo: discord.Role, permissao: AVAILABLE_PERMISSIONS):
         try:
-            db.db_add_event_permission(interaction.guild_id, cargo.id, permissao)
+            await adb.db_add_event_permission(interaction.guild_id, cargo.id, permissao)
             await interaction.response.send_message(
                 f"✅ Permissão `{permissao}` adicionada com sucesso ao cargo **{cargo.name}**.",
                 ephemeral=True
@@ -66,7 +66,7 @@ class PermissionsCog(commands.Cog):
     )
     async def remove_permission(self, interaction: discord.Interaction, cargo: discord.Role, permissao: AVAILABLE_PERMISSIONS):
         try:
-            db.db_remove_event_permission(interaction.guild_id, cargo.id, permissao)
+            await adb.db_remove_event_permission(interaction.guild_id, cargo.id, permissao)
             await interaction.response.send_message(
                 f"🗑️ Permissão `{permissao}` removida com sucesso do cargo **{cargo.name}**.",
                 ephemeral=True
@@ -86,7 +86,7 @@ class PermissionsCog(commands.Cog):
 
         await interaction.response.defer(ephemeral=True)
 
-        all_perms = db.db_get_all_event_permissions(interaction.guild_id)
+        all_perms = await adb.db_get_all_event_permissions(interaction.guild_id)
 
         if not all_perms:
             await interaction.followup.send("Nenhuma permissão de evento personalizada foi configurada neste servidor.", ephemeral=True)
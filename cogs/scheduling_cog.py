@@ -9,7 +9,7 @@ from typing import Optional, List
 import traceback
 
 # Imports de outros módulos do projeto
-import database as db
+import db_async as adb
 import utils 
 import role_utils
 from constants import BRAZIL_TZ, BRAZIL_TZ_STR
@@ -163,7 +163,7 @@ class AgendarEventoModal(discord.ui.Modal, title="📅 Agendar Novo Evento"):
             if temp_role:
                 created_temp_role_id = temp_role.id
 
-        event_id = db.db_create_event(
+        event_id = await adb.db_create_event(
             guild_id=event_data['guild_id'], channel_id=event_data['channel_id'],
             creator_id=event_data['creator_id'], title=event_data['title'],
             description=event_data.get('description'), event_time_utc=event_data['event_time_utc'],
@@ -184,7 +184,7 @@ class AgendarEventoModal(discord.ui.Modal, title="📅 Agendar Novo Evento"):
             await interaction.followup.send(f"Canal <#{event_data['channel_id']}> não encontrado. Evento salvo, mas não postado.", ephemeral=True)
             return
 
-        event_details_for_embed = db.db_get_event_details(event_id)
+        event_details_for_embed = await adb.db_get_event_details(event_id)
         if not event_details_for_embed:
             await interaction.followup.send("Erro ao buscar detalhes do evento recém-criado para postagem.", ephemeral=True)
             return
@@ -194,13 +194,13 @@ class AgendarEventoModal(discord.ui.Modal, title="📅 Agendar Novo Evento"):
         try:
             view_to_post = PersistentRsvpView(bot_instance=self.bot)
             event_msg = await target_channel.send(embed=embed, view=view_to_post)
-            db.db_update_event_message_id(event_id, event_msg.id)
+            await adb.db_update_event_message_id(event_id, event_msg.id)
 
             # Cria a thread no evento
             try:
                 thread = await event_msg.create_thread(name=event_data['title'], auto_archive_duration=10080)
                 await thread.send("Use esta thread para discutir detalhes, tirar dúvidas e encontrar o seu esquadrão para o evento!")
-                db.db_update_event_details(event_id=event_id, thread_id=thread.id)
+                await adb.db_update_event_details(event_id=event_id, thread_id=thread.id)
             except (discord.Forbidden, discord.HTTPException) as e:
                 print(f"WARN: Falha ao criar thread para evento {event_id}: {e}")
                 await interaction.followup.send("⚠️ Evento postado, mas não consegui criar uma thread de discussão. Verifique as permissões do bot.", ephemeral=True)
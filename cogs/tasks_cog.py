@@ -5,10 +5,20 @@ import asyncio
 import datetime
 import pytz
 import database as db
+import db_async as adb
 import utils 
 import role_utils 
 import bungie_api
-from constants import BRAZIL_TZ, DIGEST_TIMES_BRT
+import retention
+import purge_pipeline
+import pgcr_verifier
+from constants import (
+    BRAZIL_TZ, DIGEST_TIMES_BRT, RETENTION_TIME_BRT, BUNGIE_TOKEN_REFRESH_INTERVAL_MINUTES,
+    PGCR_CHECK_INTERVAL_MINUTES, PGCR_VERIFY_DELAY_HOURS, PGCR_MAX_AGE_HOURS,
+    SCHEDULER_VC_RETRY_SECONDS
+)
+from job_scheduler import JobScheduler
+from rate_limit import PRIORITY_BACKGROUND
 from utils import ConfirmAttendanceView, ClanInviteView
 from cogs.event_cog import PersistentRsvpView 
 
@@ -19,48 +29,79 @@ RANKING_HOURS_TIERS = {
     1: 0
 }
 
+def get_ranking_tier(weekly_hours: float) -> int:
+    for tier, required_hours in sorted(RANKING_HOURS_TIERS.items(), reverse=True):
+        if weekly_hours >= required_hours:
+            return tier
+    return 1
+
 class TasksCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.cleanup_completed_events_task.start()
-        self.delete_event_messages_task.start()
-        self.event_reminder_task.start() 
-        self.confirmation_reminder_task.start() 
         self.daily_event_digest_task.start()
-        self.attendance_check_task.start()
-        self.manage_event_voice_channels_task.start()
         self.update_leaderboard_task.start()
         self.update_ranking_roles_task.start()
         self.inactivity_check_task.start()
         self.clan_role_sync_task.start()
         self.clan_invite_check_task.start()
+        self.data_retention_task.start()
+        self.bungie_token_refresh_task.start()
+        self.pgcr_attendance_task.start()
+        # Lembretes, canais de voz, presença e exclusão de mensagens correm na hora marcada de cada evento.
+        self.scheduler = JobScheduler({
+            "lembrete_confirmacao": self._job_confirmation_reminder,
+            "criar_vc": self._job_create_voice_channel,
+            "lembrete": self._job_event_reminder,
+            "presenca": self._job_attendance_check,
+            "apagar_vc": self._job_delete_voice_channel,
+            "apagar_mensagem": self._job_delete_event_message,
+        })
+        self.bot.job_scheduler = self.scheduler
+        self.bot.dm_outbox.register_view(
+            "lembrete_confirmacao", lambda row, bot: ConfirmAttendanceView(row['user_id'], row['event_id'], bot)
+        )
+        self._scheduler_start = None
+
+    async def cog_load(self):
+        self._scheduler_start = asyncio.create_task(self._start_scheduler())
+
+    async def _start_scheduler(self):
+        await self.bot.wait_until_ready()
+        await self.scheduler.start()
 
-    def cog_unload(self):
+    async def cog_unload(self):
+        if self._scheduler_start:
+            self._scheduler_start.cancel()
+        await self.scheduler.stop()
         self.cleanup_completed_events_task.cancel()
-        self.delete_event_messages_task.cancel()
-        self.event_reminder_task.cancel()
-        self.confirmation_reminder_task.cancel()
         self.daily_event_digest_task.cancel()
-        self.attendance_check_task.cancel()
-        self.manage_event_voice_channels_task.cancel()
         self.update_leaderboard_task.cancel()
         self.update_ranking_roles_task.cancel()
         self.inactivity_check_task.cancel()
         self.clan_role_sync_task.cancel()
         self.clan_invite_check_task.cancel()
+        self.data_retention_task.cancel()
+        self.bungie_token_refresh_task.cancel()
+        self.pgcr_attendance_task.cancel()
 
     @tasks.loop(minutes=15)
     async def clan_invite_check_task(self):
-        db.db_prune_expired_invites() 
+        await adb.db_prune_expired_invites() 
+        if not bungie_api.is_available():
+            print("AVISO: API da Bungie indisponível; verificação de convites adiada.")
+            return
 
         for guild in self.bot.guilds:
-            configs = db.db_get_server_configs(guild.id)
+            configs = await adb.db_get_server_configs(guild.id)
             if not configs: continue
 
-            admin_cla_id = configs.get('clan_admin_discord_id')
             mod_channel_id = configs.get('mod_notification_channel_id')
+            if not mod_channel_id:
+                continue
 
-            if not admin_cla_id or not mod_channel_id:
+            clans = await bungie_api.get_guild_clans(guild.id, configs)
+            if not clans:
                 continue
 
             mod_channel = guild.get_channel(mod_channel_id)
@@ -68,22 +109,25 @@ class TasksCog(commands.Cog):
                 continue
 
             try:
-                pending_invites = await bungie_api.get_pending_invitations(admin_cla_id)
+                # Todos os clãs da guild em paralelo, pela mesma sessão HTTP.
+                pending_invites = await bungie_api.get_all_pending_invitations(clans, priority=PRIORITY_BACKGROUND)
                 for invite_info in pending_invites:
                     bnet_id = invite_info['membership_id']
-                    if not db.db_is_invite_tracked(bnet_id):
+                    if not await adb.db_is_invite_tracked(bnet_id):
                         embed = discord.Embed(
                             title="📥 Pedido de Entrada no Clã",
                             description=f"O jogador **{invite_info['bungie_name']}** solicitou entrada no clã.",
                             color=discord.Color.blue()
                         )
                         embed.add_field(name="ID Bungie", value=f"`{bnet_id}`", inline=False)
+                        if len(clans) > 1:
+                            embed.add_field(name="Clã", value=f"`{invite_info['clan_id']}`", inline=False)
                         embed.set_footer(text="Aja usando os botões abaixo.")
 
                         view = ClanInviteView(applicant_info=invite_info)
                         message = await mod_channel.send(embed=embed, view=view)
 
-                        db.db_track_pending_invite(bnet_id, guild.id, message.id)
+                        await adb.db_track_pending_invite(bnet_id, guild.id, message.id)
                         await asyncio.sleep(2)
 
             except Exception as e:
@@ -91,14 +135,19 @@ class TasksCog(commands.Cog):
 
     @tasks.loop(hours=1.0)
     async def clan_role_sync_task(self):
+        if not bungie_api.is_available():
+            print("AVISO: API da Bungie indisponível; sincronização do cargo de clã adiada.")
+            return
         for guild in self.bot.guilds:
-            configs = db.db_get_server_configs(guild.id)
+            configs = await adb.db_get_server_configs(guild.id)
             if not configs: continue
 
             clan_role_id = configs.get('clan_role_id')
-            admin_cla_id = configs.get('clan_admin_discord_id')
+            if not clan_role_id:
+                continue
 
-            if not clan_role_id or not admin_cla_id:
+            clans = await bungie_api.get_guild_clans(guild.id, configs)
+            if not clans:
                 continue
 
             clan_role = guild.get_role(clan_role_id)
@@ -106,11 +155,13 @@ class TasksCog(commands.Cog):
                 continue
 
             try:
-                clan_member_bnet_ids = await bungie_api.get_clan_members(admin_cla_id)
-                if not clan_member_bnet_ids:
+                rosters = await bungie_api.get_clan_rosters(clans, priority=PRIORITY_BACKGROUND)
+                # Se a lista de algum clã falhou, não dá para saber quem saiu; tenta na próxima hora.
+                if any(not roster for roster in rosters.values()):
                     continue
+                clan_member_bnet_ids = bungie_api.build_membership_index(rosters)
 
-                all_linked_profiles = db.db_get_all_linked_profiles()
+                all_linked_profiles = await adb.db_get_all_linked_profiles()
                 bnet_id_to_discord_id = {
                     profile['bungie_membership_id']: profile['discord_id'] for profile in all_linked_profiles
                 }
@@ -137,7 +188,7 @@ class TasksCog(commands.Cog):
     @tasks.loop(time=datetime.time(hour=7, minute=0, tzinfo=BRAZIL_TZ))
     async def update_leaderboard_task(self):
         for guild in self.bot.guilds:
-            configs = db.db_get_server_configs(guild.id)
+            configs = await adb.db_get_server_configs(guild.id)
             if not configs or not configs.get('ranking_channel_id'):
                 continue
 
@@ -145,7 +196,7 @@ class TasksCog(commands.Cog):
             if not ranking_channel or not isinstance(ranking_channel, discord.TextChannel):
                 continue
 
-            user_times = db.db_get_all_users_weekly_voice_time(guild.id)
+            user_times = await adb.db_get_all_users_weekly_voice_time(guild.id)
             embed = discord.Embed(title="🏆 Ranking de Atividade Semanal", description="Top membros por tempo em canais de voz nos últimos 7 dias.", color=discord.Color.gold())
 
             leaderboard_text = ""
@@ -178,8 +229,8 @@ class TasksCog(commands.Cog):
             return 
 
         for guild in self.bot.guilds:
-            ranking_roles_data = db.db_get_ranking_roles(guild.id)
-            configs = db.db_get_server_configs(guild.id)
+            ranking_roles_data = await adb.db_get_ranking_roles(guild.id)
+            configs = await adb.db_get_server_configs(guild.id)
             if not ranking_roles_data or not configs or not configs.get('ranking_channel_id'):
                 continue
 
@@ -192,31 +243,30 @@ class TasksCog(commands.Cog):
             all_ranking_role_ids = {r.id for r in ranking_roles.values() if r}
             if len(all_ranking_role_ids) != 4: continue
 
-            promoted_members = []
+            # Uma única agregação para toda a guild; quem não tem sessões fica com 0 horas (nível 1).
+            weekly_seconds_by_user = dict(await adb.db_get_all_users_weekly_voice_time(guild.id))
 
+            # Primeiro calcula o diff de cargos, depois aplica apenas as mudanças necessárias.
+            role_changes = []
             for member in guild.members:
                 if member.bot: continue
 
-                weekly_hours = db.db_get_user_weekly_voice_time(guild.id, member.id) / 3600
-
-                correct_tier = 1
-                for tier, required_hours in sorted(RANKING_HOURS_TIERS.items(), reverse=True):
-                    if weekly_hours >= required_hours:
-                        correct_tier = tier
-                        break
-
+                weekly_hours = weekly_seconds_by_user.get(member.id, 0) / 3600
+                correct_tier = get_ranking_tier(weekly_hours)
                 correct_role = ranking_roles.get(correct_tier)
-                if not correct_role: continue
+                if not correct_role or correct_role in member.roles: continue
 
                 current_ranking_roles = [r for r in member.roles if r.id in all_ranking_role_ids]
+                role_changes.append((member, current_ranking_roles, correct_role, correct_tier))
 
-                if correct_role not in member.roles:
-                    if current_ranking_roles:
-                        await member.remove_roles(*current_ranking_roles, reason="Atualização de cargo de ranking.")
-                    await member.add_roles(correct_role, reason="Promoção de cargo de ranking.")
+            promoted_members = []
+            for member, current_ranking_roles, correct_role, correct_tier in role_changes:
+                if current_ranking_roles:
+                    await member.remove_roles(*current_ranking_roles, reason="Atualização de cargo de ranking.")
+                await member.add_roles(correct_role, reason="Promoção de cargo de ranking.")
 
-                    if correct_tier > 1 and not any(r.id == correct_role.id for r in current_ranking_roles):
-                         promoted_members.append(f"👑 {member.mention} alcançou o cargo {correct_role.mention}!")
+                if correct_tier > 1:
+                    promoted_members.append(f"👑 {member.mention} alcançou o cargo {correct_role.mention}!")
 
             if promoted_members:
                 ranking_channel_id = configs.get('ranking_channel_id')
@@ -229,183 +279,175 @@ class TasksCog(commands.Cog):
     @tasks.loop(hours=24)
     async def inactivity_check_task(self):
         for guild in self.bot.guilds:
-            configs = db.db_get_server_configs(guild.id)
+            configs = await adb.db_get_server_configs(guild.id)
             if not configs or not configs.get('mod_notification_channel_id'):
                 continue
 
             mod_channel = guild.get_channel(configs['mod_notification_channel_id'])
             if not mod_channel or not isinstance(mod_channel, discord.TextChannel): continue
 
-            clan_member_ids = set()
-            admin_cla_id = configs.get('clan_admin_discord_id')
-            if admin_cla_id:
-                clan_member_ids = await bungie_api.get_clan_members(admin_cla_id)
-
-            inactive_3_weeks = db.db_get_inactive_members(guild.id, 3)
-            for user_id in inactive_3_weeks:
-                member = guild.get_member(user_id)
-                if not member: continue
-
-                try:
-                    await member.send(f"Olá. Devido a um período de inatividade superior a 3 semanas, seu acesso ao servidor {guild.name} foi revogado.")
-                    await asyncio.sleep(1) 
-                except discord.Forbidden:
-                    pass
-                except Exception as e:
-                    print(f"INACTIVITY_LOG: Erro ao enviar DM para membro inativo {user_id}: {e}")
-
-                bungie_kick_success = False
-                member_bnet_profile = db.db_get_bungie_profile(user_id)
-
-                if admin_cla_id and member_bnet_profile and member_bnet_profile['bungie_membership_id'] in clan_member_ids:
-                    kick_result = await bungie_api.kick_clan_member(
-                        admin_discord_id=admin_cla_id,
-                        member_to_kick_bnet_id=member_bnet_profile['bungie_membership_id'],
-                        member_to_kick_membership_type=member_bnet_profile['bungie_membership_type']
-                    )
-                    if kick_result:
-                        await mod_channel.send(f"🌐 O membro {member.mention} (`{member.id}`) foi removido do clã na Bungie.net.")
-                        bungie_kick_success = True
-                    else:
-                        await mod_channel.send(f"⚠️ Falha ao remover o membro {member.mention} do clã na Bungie.net.")
-
+            clans = await bungie_api.get_guild_clans(guild.id, configs)
+
+            # Uma única consulta agrupada serve os dois limiares (3 e 2 semanas).
+            last_attendance = await adb.db_get_last_attendance_by_user(guild.id)
+            now_utc = datetime.datetime.now(pytz.utc)
+            inactive_3_weeks = db.filter_inactive_members(last_attendance, 3, now_utc)
+            inactive_3_weeks_set = set(inactive_3_weeks)
+
+            # Uma limpeza interrompida (reinício, Bungie em manutenção) é retomada antes de começar outra.
+            open_job = await adb.db_get_open_purge_job(guild.id)
+            job_id = open_job['job_id'] if open_job else None
+            if not job_id:
+                targets = [user_id for user_id in inactive_3_weeks if guild.get_member(user_id)]
+                if targets:
+                    job_id = await adb.db_create_purge_job(guild.id, "inatividade_3_semanas", targets)
+            if job_id:
+                report = await purge_pipeline.run_purge_job(
+                    guild, job_id, clans,
+                    dm_message=f"Olá. Devido a um período de inatividade superior a 3 semanas, seu acesso ao servidor {guild.name} foi revogado.",
+                    kick_reason="Remoção por inatividade (3 semanas).",
+                    resumed=open_job is not None
+                )
                 try:
-                    kick_reason = "Remoção por inatividade (3 semanas)." + (" Removido também do clã Bungie." if bungie_kick_success else "")
-                    await member.kick(reason=kick_reason)
-                    await mod_channel.send(f"🚨 O membro {member.mention} (`{member.id}`) foi removido do Discord por inatividade.")
-                except discord.Forbidden:
-                    await mod_channel.send(f"⚠️ Falha ao remover o membro {member.mention} (`{member.id}`) do Discord.")
+                    await mod_channel.send(embed=purge_pipeline.build_purge_report_embed(report))
                 except Exception as e:
-                    await mod_channel.send(f"❌ Erro ao remover o membro {member.mention} do Discord: {e}")
+                    print(f"INACTIVITY_LOG: Erro ao enviar relatório da limpeza {job_id}: {e}")
 
             await asyncio.sleep(5)
 
-            inactive_2_weeks = db.db_get_inactive_members(guild.id, 2)
-            for user_id in inactive_2_weeks:
-                if user_id in inactive_3_weeks: continue
-                member = guild.get_member(user_id)
-                if member:
-                    try:
-                        await member.send(f"👋 Lembrete de atividade do servidor **{guild.name}**. Notamos que você não participa de um evento há mais de 2 semanas.")
-                        await asyncio.sleep(1)
-                    except discord.Forbidden:
-                         pass
-                    except Exception as e:
-                        print(f"INACTIVITY_LOG: Erro ao enviar DM de aviso para {user_id}: {e}")
-
-    @tasks.loop(minutes=1.0)
-    async def manage_event_voice_channels_task(self):
-        events_for_vc_creation = db.db_get_events_for_vc_creation()
-        for event in events_for_vc_creation:
-            guild = self.bot.get_guild(event['guild_id'])
-            if not guild: continue
-            event_text_channel = guild.get_channel(event['channel_id'])
-            category = event_text_channel.category if event_text_channel else None
-            vc_name = f"{event['activity_type']} {event['title']}"
+            inactive_2_weeks = db.filter_inactive_members(last_attendance, 2, now_utc)
+            warn_ids = [user_id for user_id in inactive_2_weeks if user_id not in inactive_3_weeks_set and guild.get_member(user_id)]
+            await self.bot.dm_outbox.enqueue(
+                warn_ids, "aviso_inatividade",
+                f"👋 Lembrete de atividade do servidor **{guild.name}**. Notamos que você não participa de um evento há mais de 2 semanas.",
+                priority=PRIORITY_BACKGROUND, scope=f"{guild.id}:{now_utc.date().isoformat()}"
+            )
+
+    # --- Tarefas por evento (chamadas pelo JobScheduler) ---
+    async def _job_confirmation_reminder(self, event):
+        if event['status'] != 'ativo' or event['confirmation_reminder_sent']: return
+        guild = self.bot.get_guild(event['guild_id'])
+        if not guild: return
+        attendees = (await adb.db_get_rsvps_for_event(event['event_id'])).get('vou', [])
+        recipients = [user_id for user_id in attendees if user_id != event['creator_id'] and guild.get_member(user_id)]
+        await self.bot.dm_outbox.enqueue(
+            recipients, "lembrete_confirmacao",
+            f"⏳ Lembrete: Evento **'{event['title']}'** em ~1 hora. Ainda pretende comparecer?",
+            event_id=event['event_id']
+        )
+        await adb.db_mark_reminder_sent(event['event_id'], "confirmation")
+
+    async def _job_create_voice_channel(self, event):
+        if event['status'] != 'ativo' or event['voice_channel_id']: return
+        guild = self.bot.get_guild(event['guild_id'])
+        if not guild: return
+        event_text_channel = guild.get_channel(event['channel_id'])
+        category = event_text_channel.category if event_text_channel else None
+        vc_name = f"{event['activity_type']} {event['title']}"
+        try:
+            new_vc = await guild.create_voice_channel(name=vc_name, category=category, reason=f"Canal para evento ID: {event['event_id']}")
+            await adb.db_update_event_details(event['event_id'], voice_channel_id=new_vc.id)
+        except Exception as e: print(f"ERRO_TASK_VC: Falha ao criar VC para evento {event['event_id']}: {e}")
+
+    async def _job_event_reminder(self, event):
+        if event['status'] != 'ativo' or event['reminder_sent']: return
+        guild = self.bot.get_guild(event['guild_id'])
+        if not guild: return
+        link = f"https://discord.com/channels/{guild.id}/{event['channel_id']}/{event['message_id']}"
+        msg = f"🔔 **Lembrete:** O evento **'{event['title']}'** começa em aproximadamente 15 minutos!\n{link}"
+        if event['voice_channel_id']:
+            vc = guild.get_channel(event['voice_channel_id'])
+            if vc: msg += f"\nCanal de Voz: {vc.mention}"
+
+        attendees = (await adb.db_get_rsvps_for_event(event['event_id'])).get('vou', [])
+        await self.bot.dm_outbox.enqueue(attendees, "lembrete", msg, event_id=event['event_id'])
+        await adb.db_mark_reminder_sent(event['event_id'])
+
+    async def _job_attendance_check(self, event):
+        if event['status'] != 'ativo' or event['attendance_checked']: return
+        guild = self.bot.get_guild(event['guild_id'])
+        if not guild:
+            await adb.db_mark_attendance_checked(event['event_id']); return
+        event_vc_id = event['voice_channel_id']
+        event_vc = guild.get_channel(event_vc_id) if event_vc_id else None
+        if not isinstance(event_vc, discord.VoiceChannel):
+            creator = guild.get_member(event['creator_id'])
+            if creator and creator.voice and creator.voice.channel:
+                event_vc = creator.voice.channel
+        if not isinstance(event_vc, discord.VoiceChannel):
+            await adb.db_mark_attendance_checked(event['event_id']); return
+        members_in_vc_ids = {m.id for m in event_vc.members}
+        rsvps = await adb.db_get_rsvps_for_event(event['event_id'])
+        confirmed_ids = set(rsvps.get('vou', []))
+        for user_id in confirmed_ids:
+            status = 'compareceu' if user_id in members_in_vc_ids else 'ausente'
+            await adb.db_update_rsvp_attendance(event['event_id'], user_id, status)
+        await adb.db_mark_attendance_checked(event['event_id'])
+
+    async def _job_delete_voice_channel(self, event):
+        if not event['voice_channel_id']: return
+        guild = self.bot.get_guild(event['guild_id'])
+        if not guild: return
+        channel = guild.get_channel(event['voice_channel_id'])
+        if isinstance(channel, discord.VoiceChannel):
+            if channel.members:
+                return SCHEDULER_VC_RETRY_SECONDS  # Ainda há gente a jogar; tenta mais tarde.
             try:
-                new_vc = await guild.create_voice_channel(name=vc_name, category=category, reason=f"Canal para evento ID: {event['event_id']}")
-                db.db_update_event_details(event['event_id'], voice_channel_id=new_vc.id)
-            except Exception as e: print(f"ERRO_TASK_VC: Falha ao criar VC para evento {event['event_id']}: {e}")
-
-        events_for_vc_deletion = db.db_get_events_for_vc_deletion()
-        for event in events_for_vc_deletion:
-            guild = self.bot.get_guild(event['guild_id'])
-            if not guild or not event['voice_channel_id']: continue
-            channel = guild.get_channel(event['voice_channel_id'])
-            if isinstance(channel, discord.VoiceChannel) and not channel.members:
-                try:
-                    await channel.delete(reason="Evento concluído.")
-                    db.db_update_event_details(event['event_id'], voice_channel_id=None)
-                except Exception as e: print(f"ERRO_TASK_VC: Falha ao apagar VC {channel.id}: {e}")
-            elif channel is None:
-                db.db_update_event_details(event['event_id'], voice_channel_id=None)
-
-    @tasks.loop(minutes=5.0)
-    async def attendance_check_task(self):
-        events_to_check = db.db_get_events_for_attendance_check()
-        if not events_to_check: return
-        for event in events_to_check:
-            guild = self.bot.get_guild(event['guild_id'])
-            if not guild:
-                db.db_mark_attendance_checked(event['event_id']); continue
-            event_vc_id = event['voice_channel_id']
-            event_vc = guild.get_channel(event_vc_id) if event_vc_id else None
-            if not isinstance(event_vc, discord.VoiceChannel):
-                creator = guild.get_member(event['creator_id'])
-                if creator and creator.voice and creator.voice.channel:
-                    event_vc = creator.voice.channel
-            if not isinstance(event_vc, discord.VoiceChannel):
-                db.db_mark_attendance_checked(event['event_id']); continue
-            members_in_vc_ids = {m.id for m in event_vc.members}
-            rsvps = db.db_get_rsvps_for_event(event['event_id'])
-            confirmed_ids = set(rsvps.get('vou', []))
-            for user_id in confirmed_ids:
-                status = 'compareceu' if user_id in members_in_vc_ids else 'ausente'
-                db.db_update_rsvp_attendance(event['event_id'], user_id, status)
-            db.db_mark_attendance_checked(event['event_id'])
-
-    @tasks.loop(minutes=5.0)
-    async def delete_event_messages_task(self):
-        events_to_process = db.db_get_events_to_delete_message()
-        if not events_to_process: return
-        for row in events_to_process:
+                await channel.delete(reason="Evento concluído.")
+                await adb.db_update_event_details(event['event_id'], voice_channel_id=None)
+            except Exception as e: print(f"ERRO_TASK_VC: Falha ao apagar VC {channel.id}: {e}")
+        elif channel is None:
+            await adb.db_update_event_details(event['event_id'], voice_channel_id=None)
+
+    async def _job_delete_event_message(self, event):
+        if event['status'] not in ('cancelado', 'concluido'): return
+        try:
+            channel = self.bot.get_channel(event['channel_id'])
+            if event['message_id'] and channel and isinstance(channel, discord.TextChannel):
+                msg = await channel.fetch_message(event['message_id'])
+                await msg.delete()
+            await adb.db_clear_message_id_and_update_status_after_delete(event['event_id'], event['status'])
+        except (discord.NotFound, discord.Forbidden):
+            await adb.db_clear_message_id_and_update_status_after_delete(event['event_id'], event['status'])
+        except Exception as e:
+            print(f"Erro ao deletar msg do evento {event['event_id']}: {e}")
+
+    @tasks.loop(minutes=PGCR_CHECK_INTERVAL_MINUTES)
+    async def pgcr_attendance_task(self):
+        # Segunda opinião sobre os 'ausente' da verificação por voz, para servidores que a ativaram.
+        if not bungie_api.is_available():
+            return
+        now_utc = datetime.datetime.now(pytz.utc)
+        events = await adb.db_get_events_for_pgcr_check(
+            (now_utc - datetime.timedelta(hours=PGCR_MAX_AGE_HOURS)).isoformat(),
+            (now_utc - datetime.timedelta(hours=PGCR_VERIFY_DELAY_HOURS)).isoformat()
+        )
+        enabled_by_guild = {}
+        for event in events:
+            guild_id = event['guild_id']
+            if guild_id not in enabled_by_guild:
+                configs = await adb.db_get_server_configs(guild_id)
+                enabled_by_guild[guild_id] = bool(configs and configs.get('pgcr_verification'))
+            if not enabled_by_guild[guild_id]:
+                await adb.db_apply_pgcr_attendance(event['event_id'], [])
+                continue
             try:
-                channel = self.bot.get_channel(row['channel_id'])
-                if channel and isinstance(channel, discord.TextChannel):
-                    msg = await channel.fetch_message(row['message_id'])
-                    await msg.delete()
-                db.db_clear_message_id_and_update_status_after_delete(row['event_id'], row['status'])
-            except (discord.NotFound, discord.Forbidden):
-                db.db_clear_message_id_and_update_status_after_delete(row['event_id'], row['status'])
+                attendance = await adb.db_get_event_attendance(event['event_id'])
+                attended = await pgcr_verifier.verify_event(event, attendance)
             except Exception as e:
-                print(f"Erro ao deletar msg do evento {row['event_id']}: {e}")
-
-    @tasks.loop(minutes=1.0)
-    async def event_reminder_task(self):
-        events = db.db_get_upcoming_events_for_reminder()
-        for event in events:
-            guild = self.bot.get_guild(event['guild_id'])
-            if not guild: continue
-            link = f"https://discord.com/channels/{guild.id}/{event['channel_id']}/{event['message_id']}"
-            msg = f"🔔 **Lembrete:** O evento **'{event['title']}'** começa em aproximadamente 15 minutos!\n{link}"
-            if event['voice_channel_id']:
-                vc = guild.get_channel(event['voice_channel_id'])
-                if vc: msg += f"\nCanal de Voz: {vc.mention}"
-
-            attendees = db.db_get_rsvps_for_event(event['event_id']).get('vou', [])
-            for user_id in attendees:
-                try:
-                    user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
-                    await user.send(msg)
-                    await asyncio.sleep(2)
-                except Exception: pass
-            db.db_mark_reminder_sent(event['event_id'])
-
-    @tasks.loop(minutes=1.0)
-    async def confirmation_reminder_task(self):
-        events = db.db_get_events_for_confirmation_reminder()
-        for event in events:
-            guild = self.bot.get_guild(event['guild_id'])
-            if not guild: continue
-            attendees = db.db_get_rsvps_for_event(event['event_id']).get('vou', [])
-            creator_id = event['creator_id']
-            for user_id in attendees:
-                if user_id == creator_id: continue
-                member = guild.get_member(user_id)
-                if not member: continue
-                try:
-                    view = ConfirmAttendanceView(user_id, event['event_id'], self.bot)
-                    msg = await member.send(f"⏳ Lembrete: Evento **'{event['title']}'** em ~1 hora. Ainda pretende comparecer?", view=view)
-                    view.message = msg
-                    await asyncio.sleep(2)
-                except Exception: pass
-            db.db_mark_reminder_sent(event['event_id'], "confirmation")
+                print(f"ERRO_TASK_PGCR: Falha ao verificar o evento {event['event_id']}: {e}")
+                continue
+            if not bungie_api.is_available():
+                break  # Resultado possivelmente incompleto; o evento é tentado de novo depois.
+            await adb.db_apply_pgcr_attendance(event['event_id'], sorted(attended))
+            if attended:
+                print(f"PRESENCA_PGCR: Evento {event['event_id']}: {len(attended)} ausente(s) confirmados pelo PGCR.")
 
     # Correção: O decorador @tasks.loop agora usa a lista de tempos de constants.py
     @tasks.loop(time=DIGEST_TIMES_BRT)
     async def daily_event_digest_task(self):
         for guild in self.bot.guilds:
-            configs = db.db_get_server_configs(guild.id)
+            configs = await adb.db_get_server_configs(guild.id)
             if configs and configs['digest_channel_id']:
                 channel = guild.get_channel(configs['digest_channel_id'])
                 if channel and isinstance(channel, discord.TextChannel):
@@ -415,29 +457,47 @@ class TasksCog(commands.Cog):
 
     @tasks.loop(hours=1.0)
     async def cleanup_completed_events_task(self):
-        events = db.db_get_events_for_cleanup()
+        events = await adb.db_get_events_for_cleanup()
         for event in events:
-            view = PersistentRsvpView(self.bot)
-            await view._update_event_message_embed(event['event_id'], event['channel_id'], event['message_id'])
             guild = self.bot.get_guild(event['guild_id'])
             if guild and event['temp_role_id']:
                 await role_utils.delete_event_role(guild, event['temp_role_id'], f"Evento {event['event_id']} concluído.")
             delete_at = datetime.datetime.now(pytz.utc) + datetime.timedelta(hours=24)
-            db.db_update_event_status(event['event_id'], 'concluido', delete_after_utc=delete_at.isoformat())
-            db.db_update_event_details(event_id=event['event_id'], temp_role_id=None)
+            await adb.db_update_event_status(event['event_id'], 'concluido', delete_after_utc=delete_at.isoformat())
+            await adb.db_update_event_details(event_id=event['event_id'], temp_role_id=None)
+            # Depois da mudança de estado: a mensagem passa a [CONCLUÍDO] e perde os botões.
+            view = PersistentRsvpView(self.bot)
+            await view._update_event_message_embed(event['event_id'], event['channel_id'], event['message_id'])
+
+    @tasks.loop(time=RETENTION_TIME_BRT)
+    async def data_retention_task(self):
+        try:
+            report = await retention.run_retention()
+            print(f"RETENCAO: {retention.format_retention_report(report)}")
+        except Exception as e:
+            print(f"ERRO_TASK_RETENCAO: Falha ao executar a rotina de retenção: {e}")
+
+    @tasks.loop(minutes=BUNGIE_TOKEN_REFRESH_INTERVAL_MINUTES)
+    async def bungie_token_refresh_task(self):
+        if not bungie_api.is_available():
+            return
+        try:
+            report = await bungie_api.refresh_expiring_tokens()
+            if any(report.values()):
+                print(f"TOKENS_BUNGIE: {report['refreshed']} renovados, {report['failed']} falharam, {report['revoked']} revogados.")
+        except Exception as e:
+            print(f"ERRO_TASK_TOKENS: Falha ao renovar tokens Bungie: {e}")
 
     @clan_invite_check_task.before_loop
     @update_leaderboard_task.before_loop
     @update_ranking_roles_task.before_loop
     @inactivity_check_task.before_loop
-    @delete_event_messages_task.before_loop
-    @event_reminder_task.before_loop
-    @confirmation_reminder_task.before_loop
     @daily_event_digest_task.before_loop
     @cleanup_completed_events_task.before_loop
-    @attendance_check_task.before_loop
-    @manage_event_voice_channels_task.before_loop
     @clan_role_sync_task.before_loop
+    @data_retention_task.before_loop
+    @bungie_token_refresh_task.before_loop
+    @pgcr_attendance_task.before_loop
     async def before_task(self):
         await self.bot.wait_until_ready()
 
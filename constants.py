@@ -9,6 +9,110 @@ BRAZIL_TZ = pytz.timezone(BRAZIL_TZ_STR)
 
 # --- Database Configuration ---
 DB_NAME = 'destiny_events.db'
+DB_POOL_SIZE = 4  # Conexões SQLite mantidas abertas e partilhadas pelas funções db_*
+DB_POOL_TIMEOUT_SECONDS = 10.0
+DB_CACHED_STATEMENTS = 256
+DB_READER_THREADS = DB_POOL_SIZE - 1  # Uma conexão fica livre para a thread do escritor
+EVENT_CACHE_MAX_ENTRIES = 512  # Linhas de eventos mantidas em memória (os ativos são os últimos a sair)
+RSVP_CACHE_MAX_ENTRIES = 512   # Listas de RSVPs por evento mantidas em memória
+
+# --- Data Retention ---
+RETENTION_VOICE_SESSIONS_DAYS = 90   # Sessões de voz mais antigas viram totais mensais
+RETENTION_EVENTS_DAYS = 180          # Eventos encerrados mais antigos viram resumos de presença
+RETENTION_BATCH_SIZE = 500           # Linhas apagadas por transação
+RETENTION_VACUUM_MAX_PAGES = 0       # Páginas devolvidas por execução (0 = todas as livres)
+RETENTION_TIME_BRT = datetime.time(hour=4, minute=30, tzinfo=BRAZIL_TZ)
+
+# --- Inactivity Purge ---
+PURGE_BUNGIE_CONCURRENCY = 2        # Expulsões simultâneas do clã na Bungie
+PURGE_BUNGIE_RATE = (1.0, 2)        # (expulsões por segundo, rajada)
+PURGE_DISCORD_CONCURRENCY = 3       # DMs + expulsões simultâneas no Discord
+PURGE_DISCORD_RATE = (2.0, 3)
+
+# --- Event Job Scheduler ---
+# Tarefas de cada evento, em minutos relativos ao horário do evento (negativo = antes).
+EVENT_JOB_OFFSETS_MINUTES = {
+    "lembrete_confirmacao": -60,
+    "criar_vc": -60,
+    "lembrete": -15,
+    "presenca": 30,
+    "apagar_vc": 180,
+}
+# Atraso máximo com que a tarefa ainda faz sentido (ex.: bot estava desligado); ausente = executa sempre.
+EVENT_JOB_GRACE_MINUTES = {"lembrete_confirmacao": 60, "criar_vc": 60, "lembrete": 15, "presenca": 10}
+SCHEDULER_RESYNC_MINUTES = 30    # Releitura completa da tabela, por precaução
+SCHEDULER_VC_RETRY_SECONDS = 300  # Nova tentativa de apagar um canal de voz ainda ocupado
+
+# --- Event Message Rendering ---
+EMBED_RENDER_DEBOUNCE_SECONDS = 1.5  # Cliques de RSVP nesta janela viram uma única edição da mensagem
+EVENT_EMBED_CACHE_MAX_ENTRIES = 256  # Embeds de eventos já montados, por (evento, versão, versão da lista)
+RSVP_SEND_CONFIRMATION = True        # Mensagem efémera "Sua resposta foi atualizada" após o clique
+RSVP_FAST_PATH_TIMEOUT_SECONDS = 2.0  # Acima disto o clique é confirmado com defer (o Discord dá 3 s) e a edição vai pelo coalescer
+PROFILE_CACHE_TTL_SECONDS = 6 * 3600  # Nome/avatar de utilizadores; atualizados também por on_user_update
+PROFILE_CACHE_MAX_ENTRIES = 2000
+
+# --- DM Outbox ---
+DM_OUTBOX_WORKERS = 3             # DMs enviadas em simultâneo
+DM_OUTBOX_RATE = (1.0, 5)         # (DMs por segundo, rajada), abaixo do limite do Discord para abrir DMs
+DM_OUTBOX_BATCH_SIZE = 20         # Linhas pendentes lidas do banco de cada vez
+DM_OUTBOX_POLL_SECONDS = 60       # Releitura da fila mesmo sem aviso de novas DMs
+DM_OUTBOX_RETENTION_DAYS = 14     # DMs já processadas mantidas para deduplicação/diagnóstico
+
+# --- Event Loop Monitoring ---
+LOOP_LAG_SAMPLE_INTERVAL_SECONDS = 0.5
+LOOP_LAG_WARN_THRESHOLD_SECONDS = 0.25
+
+# --- Bungie HTTP Client ---
+BUNGIE_HTTP_MAX_CONNECTIONS = 10      # Conexões simultâneas abertas para bungie.net
+BUNGIE_HTTP_KEEPALIVE_SECONDS = 30.0  # Tempo que uma conexão ociosa fica aberta para reuso
+BUNGIE_HTTP_DNS_CACHE_SECONDS = 300
+BUNGIE_HTTP_TIMEOUT_SECONDS = 30.0
+BUNGIE_REQUEST_TIMEOUT_SECONDS = 10.0  # Limite por pedido; evita ficar pendurado durante manutenções
+BUNGIE_RETRY_MAX_ATTEMPTS = 3          # Novas tentativas de GET após erro de rede, tempo esgotado ou 5xx
+BUNGIE_RETRY_BASE_SECONDS = 0.5
+BUNGIE_RETRY_MAX_SECONDS = 8.0
+BUNGIE_BREAKER_FAILURE_THRESHOLD = 5   # Falhas seguidas que abrem o disjuntor
+BUNGIE_BREAKER_OPEN_SECONDS = 300.0    # Tempo de espera antes do pedido de teste
+
+# Limites por classe de endpoint: (pedidos por segundo, rajada máxima)
+BUNGIE_RATE_LIMITS = {
+    "oauth": (2.0, 4),        # App/OAuth/Token
+    "user": (4.0, 8),         # User/*
+    "group_read": (4.0, 8),   # GroupV2 leituras (membros, pendentes)
+    "group_admin": (1.0, 2),  # GroupV2 ações de admin (aprovar, recusar, expulsar)
+    "stats": (4.0, 8),        # Destiny2 histórico de atividades e PGCRs
+    "default": (4.0, 8),
+}
+BUNGIE_THROTTLE_MAX_RETRIES = 2     # Novas tentativas após 429 / ThrottleLimitExceeded
+BUNGIE_DEFAULT_RETRY_SECONDS = 5.0  # Espera usada quando o 429 não traz Retry-After
+BUNGIE_CLAN_MEMBERS_CACHE_SECONDS = 900   # Lista de membros do clã partilhada entre tarefas
+BUNGIE_PENDING_INVITES_CACHE_SECONDS = 300
+BUNGIE_CHARACTERS_CACHE_SECONDS = 86400      # IDs dos personagens de cada conta Destiny
+BUNGIE_TOKEN_PROACTIVE_REFRESH_SECONDS = 600  # Renova em segundo plano quando faltar menos que isto
+BUNGIE_TOKEN_EXPIRY_MARGIN_SECONDS = 60       # Abaixo disto o token já é tratado como expirado
+BUNGIE_TOKEN_REFRESH_INTERVAL_MINUTES = 10    # Frequência da renovação em lote
+BUNGIE_TOKEN_REFRESH_LOOKAHEAD_SECONDS = 1200 # Renova em lote os tokens que expiram dentro deste prazo
+BUNGIE_TOKEN_REFRESH_CONCURRENCY = 4
+BUNGIE_TOKEN_REFRESH_BATCH_LIMIT = 200
+
+# --- PGCR Attendance Verification ---
+PGCR_CACHE_DIR = 'pgcr_cache'          # Relatórios pós-jogo nunca mudam; ficam em disco para sempre
+PGCR_CHECK_INTERVAL_MINUTES = 30
+PGCR_VERIFY_DELAY_HOURS = 3            # Espera a atividade acabar antes de consultar o histórico
+PGCR_MAX_AGE_HOURS = 48                # Eventos mais antigos já não são verificados
+PGCR_WINDOW_BEFORE_MINUTES = 30        # Atividades iniciadas até este tempo antes do evento contam
+PGCR_WINDOW_AFTER_HOURS = 4
+PGCR_HISTORY_COUNT = 15                # Atividades lidas por personagem
+PGCR_MAX_ANCHORS = 3                   # Jogadores cujo histórico é consultado por evento
+PGCR_MAX_REQUESTS_PER_EVENT = 20
+PGCR_MIN_FIRETEAM_MATCH = 2            # Confirmados que têm de estar no PGCR para ele ser "do evento"
+
+# --- Destiny Manifest ---
+MANIFEST_DB_NAME = 'destiny_manifest.db'   # Cópia compacta das definições de atividade
+MANIFEST_LANGUAGES = ("pt-br", "en")
+MANIFEST_LOCAL_DIR = 'manifest'            # DestinyActivityDefinition-<idioma>.json aqui dispensa o download
+MANIFEST_REFRESH_DAYS = 7                  # Idade máxima da cópia local antes de verificar uma nova versão
+MANIFEST_DOWNLOAD_TIMEOUT_SECONDS = 300.0
 
 # --- Date/Time Formatting Constants ---
 DIAS_SEMANA_PT_FULL = ["Segunda-feira", "Terça-feira", "Quarta-feira", "Quinta-feira", "Sexta-feira", "Sábado", "Domingo"]
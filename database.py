@@ -3,13 +3,95 @@ import sqlite3
 import datetime
 import pytz
 import json
-from constants import DB_NAME
-from typing import List, Dict, Set, Optional, Tuple
+import db_pool
+from typing import Callable, List, Dict, Set, Optional, Tuple
+from caching import LRUCache
+from constants import EVENT_JOB_OFFSETS_MINUTES, EVENT_CACHE_MAX_ENTRIES, RSVP_CACHE_MAX_ENTRIES
+
+# --- Índices secundários ---
+# Conjunto versionado: ao alterar INDEXES, incremente INDEX_SET_VERSION para que o
+# init_db recrie os índices (e remova os obsoletos) na próxima inicialização.
+INDEX_SET_VERSION = 8
+INDEXES = {
+    "idx_events_status_time": "events (status, event_time_utc)",
+    "idx_events_guild_status_time": "events (guild_id, status, event_time_utc)",
+    "idx_events_status_delete_after": "events (status, delete_message_after_utc)",
+    "idx_rsvps_event_timestamp": "rsvps (event_id, rsvp_timestamp)",
+    "idx_rsvps_user": "rsvps (user_id)",
+    "idx_voice_sessions_guild_start": "voice_sessions (guild_id, session_start_utc)",
+    "idx_voice_sessions_start": "voice_sessions (session_start_utc)",
+    "idx_voice_daily_totals_guild_day": "voice_daily_totals (guild_id, day_utc)",
+    "idx_voice_daily_totals_day": "voice_daily_totals (day_utc)",
+    "idx_bungie_profiles_bnet_id": "bungie_profiles (bungie_membership_id)",
+    "idx_bungie_profiles_token_expires": "bungie_profiles (token_expires_at)",
+    "idx_pending_invites_expires": "pending_clan_invites (expires_at)",
+    "idx_purge_jobs_guild_status": "purge_jobs (guild_id, status)",
+    "idx_events_pgcr_pending": "events (pgcr_checked, event_time_utc)",
+    "idx_scheduled_jobs_status_due": "scheduled_jobs (status, due_at_utc)",
+    "idx_dm_outbox_status_priority": "dm_outbox (status, priority, outbox_id)",
+    "idx_dm_outbox_created": "dm_outbox (created_at_utc)",
+}
+
+# Consultas executadas com frequência pelas tarefas; nenhuma delas pode cair num SCAN completo.
+HOT_QUERIES = {
+    "cleanup": "SELECT * FROM events WHERE status = 'ativo' AND event_time_utc < ?",
+    "digest": "SELECT * FROM events WHERE guild_id = ? AND status = 'ativo' AND event_time_utc BETWEEN ? AND ? ORDER BY event_time_utc ASC",
+    "eventos_futuros": "SELECT * FROM events WHERE guild_id = ? AND status = 'ativo' AND event_time_utc > ? ORDER BY event_time_utc ASC",
+    "rsvps_evento": "SELECT user_id, status FROM rsvps WHERE event_id = ? ORDER BY rsvp_timestamp ASC",
+    "rsvps_ativos_usuario": "SELECT event_id FROM rsvps WHERE user_id = ? AND event_id IN (SELECT event_id FROM events WHERE guild_id = ? AND status = 'ativo')",
+    "voz_semanal_usuario": "SELECT SUM(total_seconds) FROM voice_daily_totals WHERE guild_id = ? AND user_id = ? AND day_utc >= ?",
+    "voz_semanal_todos": "SELECT user_id, SUM(total_seconds) as total_time FROM voice_daily_totals WHERE guild_id = ? AND day_utc >= ? GROUP BY user_id ORDER BY total_time DESC",
+    "ultima_presenca": "SELECT user_id, MAX(last_attended) FROM (SELECT rsvps.user_id AS user_id, MAX(CASE WHEN rsvps.attendance_status = 'compareceu' THEN events.event_time_utc END) AS last_attended FROM rsvps INNER JOIN events ON rsvps.event_id = events.event_id WHERE events.guild_id = ? GROUP BY rsvps.user_id UNION ALL SELECT user_id, last_attended_utc FROM member_attendance_summaries WHERE guild_id = ?) GROUP BY user_id",
+    "perfil_por_bnet_id": "SELECT * FROM bungie_profiles WHERE bungie_membership_id = ?",
+    "tokens_a_expirar": "SELECT discord_id FROM bungie_profiles WHERE refresh_token IS NOT NULL AND token_expires_at <= ? ORDER BY token_expires_at ASC LIMIT ?",
+    "convites_expirados": "DELETE FROM pending_clan_invites WHERE expires_at <= ?",
+    "verificacao_pgcr": "SELECT * FROM events WHERE pgcr_checked = 0 AND attendance_checked = 1 AND event_time_utc BETWEEN ? AND ?",
+    "tarefas_pendentes": "SELECT job_id, event_id, kind, due_at_utc FROM scheduled_jobs WHERE status = 'pendente' ORDER BY due_at_utc ASC",
+    "tarefas_do_evento": "SELECT job_id, event_id, kind, due_at_utc FROM scheduled_jobs WHERE event_id = ? AND status = 'pendente'",
+    "dms_pendentes": "SELECT * FROM dm_outbox WHERE status = 'pendente' ORDER BY priority, outbox_id LIMIT ?",
+    "limpeza_em_andamento": "SELECT * FROM purge_jobs WHERE guild_id = ? AND status = 'em_andamento' ORDER BY job_id ASC LIMIT 1",
+}
+
+def _apply_index_set(cursor: sqlite3.Cursor):
+    cursor.execute("PRAGMA user_version")
+    current_version = cursor.fetchone()[0]
+    if current_version >= INDEX_SET_VERSION:
+        return
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")
+    for (index_name,) in cursor.fetchall():
+        if index_name not in INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+    for index_name, definition in INDEXES.items():
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {definition}")
+    cursor.execute(f"PRAGMA user_version = {INDEX_SET_VERSION}")
+    print(f"DEBUG: init_db - Conjunto de índices atualizado da versão {current_version} para {INDEX_SET_VERSION}.")
+
+def db_check_hot_query_plans() -> Dict[str, List[str]]:
+    """
+    Executa EXPLAIN QUERY PLAN em cada consulta de HOT_QUERIES e devolve, por
+    consulta, os passos do plano que fazem SCAN completo de uma tabela.
+    Um dicionário vazio significa que todas usam índices.
+    """
+    regressions: Dict[str, List[str]] = {}
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        for name, query in HOT_QUERIES.items():
+            params = tuple(None for _ in range(query.count("?")))
+            cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            # "SCAN (subquery-N)" percorre um resultado intermediário já filtrado, não uma tabela.
+            scans = [row['detail'] for row in cursor.fetchall() if row['detail'].startswith("SCAN ") and not row['detail'].startswith(("SCAN (", "SCAN CONSTANT ROW"))]
+            if scans:
+                regressions[name] = scans
+    except sqlite3.Error as e:
+        print(f"Erro DB ao verificar planos de consulta: {e}")
+    finally:
+        db_pool.release(conn)
+    return regressions
 
 def init_db():
     print("DEBUG: init_db - Iniciando")
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
 
     # --- Tabela server_configs ---
@@ -24,7 +106,8 @@ def init_db():
             mod_notification_channel_id INTEGER,
             penalty_role_id INTEGER,
             clan_admin_discord_id INTEGER,
-            clan_role_id INTEGER
+            clan_role_id INTEGER,
+            pgcr_verification INTEGER DEFAULT 0
         )
     ''')
     if 'ranking_channel_id' not in server_configs_columns:
@@ -42,6 +125,9 @@ def init_db():
     if 'clan_role_id' not in server_configs_columns:
         try: cursor.execute("ALTER TABLE server_configs ADD COLUMN clan_role_id INTEGER")
         except sqlite3.OperationalError: pass
+    if 'pgcr_verification' not in server_configs_columns:
+        try: cursor.execute("ALTER TABLE server_configs ADD COLUMN pgcr_verification INTEGER DEFAULT 0")
+        except sqlite3.OperationalError: pass
 
 
     # --- Tabela bungie_profiles ---
@@ -102,12 +188,24 @@ def init_db():
             confirmation_reminder_sent INTEGER DEFAULT 0,
             thread_id INTEGER,
             voice_channel_id INTEGER,
-            attendance_checked INTEGER DEFAULT 0
+            attendance_checked INTEGER DEFAULT 0,
+            pgcr_checked INTEGER DEFAULT 0,
+            version INTEGER DEFAULT 0,
+            roster_version INTEGER DEFAULT 0
         )
     ''')
     if 'attendance_checked' not in events_columns:
         try: cursor.execute("ALTER TABLE events ADD COLUMN attendance_checked INTEGER DEFAULT 0")
         except sqlite3.OperationalError: pass
+    if 'pgcr_checked' not in events_columns:
+        try: cursor.execute("ALTER TABLE events ADD COLUMN pgcr_checked INTEGER DEFAULT 0")
+        except sqlite3.OperationalError: pass
+    if 'version' not in events_columns:
+        try: cursor.execute("ALTER TABLE events ADD COLUMN version INTEGER DEFAULT 0")
+        except sqlite3.OperationalError: pass
+    if 'roster_version' not in events_columns:
+        try: cursor.execute("ALTER TABLE events ADD COLUMN roster_version INTEGER DEFAULT 0")
+        except sqlite3.OperationalError: pass
 
     # --- Tabela rsvps ---
     cursor.execute("PRAGMA table_info(rsvps)")
@@ -141,6 +239,86 @@ def init_db():
         )
     ''')
 
+    # --- Tabela voice_daily_totals ---
+    # Agregado por usuário/guild/dia (UTC), mantido por db_log_voice_session.
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'voice_daily_totals'")
+    voice_daily_totals_exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS voice_daily_totals (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            day_utc TEXT NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, day_utc)
+        )
+    ''')
+    if not voice_daily_totals_exists:
+        _rebuild_voice_daily_totals(cursor)
+
+    # --- Tabelas de arquivo (retenção de dados) ---
+    # Resumos compactos que substituem as linhas antigas apagadas pela rotina de retenção.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS voice_monthly_totals (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            month_utc TEXT NOT NULL,
+            total_seconds INTEGER NOT NULL DEFAULT 0,
+            session_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, month_utc)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_attendance_summaries (
+            event_id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            title TEXT,
+            activity_type TEXT,
+            event_time_utc TEXT NOT NULL,
+            final_status TEXT,
+            confirmed_count INTEGER NOT NULL DEFAULT 0,
+            attended_count INTEGER NOT NULL DEFAULT 0,
+            absent_count INTEGER NOT NULL DEFAULT 0,
+            maybe_count INTEGER NOT NULL DEFAULT 0,
+            declined_count INTEGER NOT NULL DEFAULT 0,
+            archived_at_utc TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS member_attendance_summaries (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            last_attended_utc TEXT,
+            events_attended INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )
+    ''')
+
+    # --- Tabelas de limpeza por inatividade (retomáveis após reinício) ---
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purge_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            reason TEXT,
+            status TEXT NOT NULL DEFAULT 'em_andamento',
+            created_at_utc TEXT NOT NULL,
+            finished_at_utc TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purge_job_items (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            bungie_membership_id TEXT,
+            bungie_membership_type INTEGER,
+            bungie_status TEXT NOT NULL DEFAULT 'pendente',
+            discord_status TEXT NOT NULL DEFAULT 'pendente',
+            error TEXT,
+            updated_at_utc TEXT,
+            PRIMARY KEY (job_id, user_id),
+            FOREIGN KEY (job_id) REFERENCES purge_jobs(job_id) ON DELETE CASCADE
+        )
+    ''')
+
     # --- Tabela ranking_roles ---
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS ranking_roles (
@@ -158,12 +336,61 @@ def init_db():
             guild_id INTEGER NOT NULL, channel_id INTEGER NOT NULL, PRIMARY KEY (guild_id, channel_id)
         )''')
 
+    # --- Tabela guild_clans (vários clãs Bungie por servidor) ---
+    # admin_discord_id é opcional; sem ele usa-se o clan_admin_discord_id de server_configs.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS guild_clans (
+            guild_id INTEGER NOT NULL,
+            clan_id TEXT NOT NULL,
+            admin_discord_id INTEGER,
+            PRIMARY KEY (guild_id, clan_id)
+        )''')
+
+    # --- Tabela scheduled_jobs (tarefas de cada evento, com hora marcada) ---
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'scheduled_jobs'")
+    scheduled_jobs_exists = cursor.fetchone() is not None
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS scheduled_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            due_at_utc TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pendente',
+            UNIQUE (event_id, kind),
+            FOREIGN KEY (event_id) REFERENCES events (event_id) ON DELETE CASCADE
+        )''')
+    if not scheduled_jobs_exists:
+        cursor.execute("SELECT event_id FROM events WHERE status = 'ativo' OR delete_message_after_utc IS NOT NULL")
+        for (event_id,) in cursor.fetchall():
+            _plan_event_jobs(cursor, event_id)
+
+    # --- Tabela dm_outbox (fila persistente de DMs) ---
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dm_outbox (
+            outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedupe_key TEXT NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL,
+            event_id INTEGER,
+            kind TEXT NOT NULL,
+            content TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 1,
+            status TEXT NOT NULL DEFAULT 'pendente',
+            created_at_utc TEXT NOT NULL,
+            sent_at_utc TEXT,
+            error TEXT
+        )''')
+
+    _apply_index_set(cursor)
+
     conn.commit()
-    if conn: conn.close()
+    db_pool.release(conn)
+
+    for query_name, scans in db_check_hot_query_plans().items():
+        print(f"AVISO: init_db - Consulta '{query_name}' faz SCAN completo: {'; '.join(scans)}")
     print("DEBUG: init_db - Concluído, schema verificado/atualizado.")
 
 def db_track_pending_invite(bungie_membership_id: str, guild_id: int, message_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     expires_at = (datetime.datetime.now(pytz.utc) + datetime.timedelta(days=7)).isoformat()
     try:
@@ -175,10 +402,10 @@ def db_track_pending_invite(bungie_membership_id: str, guild_id: int, message_id
     except sqlite3.Error as e:
         print(f"Erro DB ao rastrear convite pendente para {bungie_membership_id}: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_untrack_pending_invite(bungie_membership_id: str):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("DELETE FROM pending_clan_invites WHERE bungie_membership_id = ?", (bungie_membership_id,))
@@ -186,10 +413,10 @@ def db_untrack_pending_invite(bungie_membership_id: str):
     except sqlite3.Error as e:
         print(f"Erro DB ao remover rastreamento de convite para {bungie_membership_id}: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_is_invite_tracked(bungie_membership_id: str) -> bool:
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT 1 FROM pending_clan_invites WHERE bungie_membership_id = ?", (bungie_membership_id,))
@@ -198,10 +425,10 @@ def db_is_invite_tracked(bungie_membership_id: str) -> bool:
         print(f"Erro DB ao verificar se convite é rastreado para {bungie_membership_id}: {e}")
         return False
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_prune_expired_invites():
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     now_utc_iso = datetime.datetime.now(pytz.utc).isoformat()
     try:
@@ -211,27 +438,26 @@ def db_prune_expired_invites():
     except sqlite3.Error as e:
         print(f"Erro DB ao podar convites expirados: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_set_server_config(guild_id: int, **kwargs):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO server_configs (guild_id) VALUES (?)", (guild_id,))
     updates = [f"{key} = ?" for key in kwargs]
     params = list(kwargs.values())
     params.append(guild_id)
     query = f"UPDATE server_configs SET {', '.join(updates)} WHERE guild_id = ?"
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
     try:
+        cursor.execute("INSERT OR IGNORE INTO server_configs (guild_id) VALUES (?)", (guild_id,))
         cursor.execute(query, tuple(params))
         conn.commit()
     except sqlite3.Error as e:
         print(f"Erro DB ao atualizar server_configs: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_server_configs(guild_id: int) -> Optional[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM server_configs WHERE guild_id = ?", (guild_id,))
@@ -240,11 +466,10 @@ def db_get_server_configs(guild_id: int) -> Optional[sqlite3.Row]:
         print(f"Erro DB ao buscar server_configs: {e}")
         return None
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_bungie_profile_by_bnet_id(bungie_membership_id: str) -> Optional[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM bungie_profiles WHERE bungie_membership_id = ?", (bungie_membership_id,))
@@ -253,10 +478,10 @@ def db_get_bungie_profile_by_bnet_id(bungie_membership_id: str) -> Optional[sqli
         print(f"Erro DB ao buscar perfil Bungie pelo bnet_id {bungie_membership_id}: {e}")
         return None
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_set_ranking_roles(guild_id: int, role_ids: Dict[int, int]):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute('''
@@ -270,11 +495,10 @@ def db_set_ranking_roles(guild_id: int, role_ids: Dict[int, int]):
     except sqlite3.Error as e:
         print(f"Erro DB ao definir cargos de ranking: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_ranking_roles(guild_id: int) -> Optional[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM ranking_roles WHERE guild_id = ?", (guild_id,))
@@ -283,10 +507,10 @@ def db_get_ranking_roles(guild_id: int) -> Optional[sqlite3.Row]:
         print(f"Erro DB ao buscar cargos de ranking: {e}")
         return None
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_save_bungie_profile(discord_id: int, bungie_membership_id: str, bungie_membership_type: int, bungie_name: str, access_token: str, refresh_token: str, token_expires_at: str):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute('''
@@ -304,11 +528,71 @@ def db_save_bungie_profile(discord_id: int, bungie_membership_id: str, bungie_me
     except sqlite3.Error as e:
         print(f"Erro DB ao salvar perfil Bungie para user {discord_id}: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+
+def db_update_bungie_tokens(discord_id: int, access_token: str, refresh_token: str, token_expires_at: str) -> bool:
+    """Atualiza só as colunas de token de um perfil já vinculado (usado após cada renovação)."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE bungie_profiles SET access_token = ?, refresh_token = ?, token_expires_at = ? WHERE discord_id = ?",
+            (access_token, refresh_token, token_expires_at, discord_id)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Erro DB ao atualizar tokens Bungie para user {discord_id}: {e}")
+        return False
+    finally:
+        db_pool.release(conn)
+
+def db_get_bungie_profiles_expiring_before(cutoff_utc_iso: str, limit: int) -> List[int]:
+    """discord_ids com refresh token cujo access token expira até `cutoff_utc_iso`, mais urgentes primeiro."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT discord_id FROM bungie_profiles WHERE refresh_token IS NOT NULL AND token_expires_at <= ? ORDER BY token_expires_at ASC LIMIT ?",
+            (cutoff_utc_iso, limit)
+        )
+        return [row['discord_id'] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        print(f"Erro DB ao buscar tokens Bungie a expirar: {e}")
+        return []
+    finally:
+        db_pool.release(conn)
+
+def db_apply_bungie_token_refreshes(updates: List[Tuple[int, str, str, str]], revoked_discord_ids: List[int]) -> bool:
+    """
+    Grava numa única transação o resultado de uma rodada de renovação:
+    `updates` são (discord_id, access_token, refresh_token, token_expires_at) e os
+    perfis em `revoked_discord_ids` ficam sem tokens até serem vinculados de novo.
+    """
+    if not updates and not revoked_discord_ids:
+        return True
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "UPDATE bungie_profiles SET access_token = ?, refresh_token = ?, token_expires_at = ? WHERE discord_id = ?",
+            [(access, refresh, expires_at, discord_id) for discord_id, access, refresh, expires_at in updates]
+        )
+        cursor.executemany(
+            "UPDATE bungie_profiles SET access_token = NULL, refresh_token = NULL, token_expires_at = NULL WHERE discord_id = ?",
+            [(discord_id,) for discord_id in revoked_discord_ids]
+        )
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Erro DB ao gravar renovação de tokens Bungie: {e}")
+        return False
+    finally:
+        db_pool.release(conn)
 
 def db_get_bungie_profile(discord_id: int) -> Optional[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM bungie_profiles WHERE discord_id = ?", (discord_id,))
@@ -317,11 +601,10 @@ def db_get_bungie_profile(discord_id: int) -> Optional[sqlite3.Row]:
         print(f"Erro DB ao buscar perfil Bungie para user {discord_id}: {e}")
         return None
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_all_linked_profiles() -> list[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT discord_id, bungie_membership_id FROM bungie_profiles")
@@ -330,17 +613,99 @@ def db_get_all_linked_profiles() -> list[sqlite3.Row]:
         print(f"Erro DB ao buscar todos os perfis vinculados: {e}")
         return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+
+def db_create_purge_job(guild_id: int, reason: str, user_ids: List[int]) -> Optional[int]:
+    """Cria a limpeza e os seus itens (já com o perfil Bungie de cada membro) numa única transação."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "INSERT INTO purge_jobs (guild_id, reason, status, created_at_utc) VALUES (?, ?, 'em_andamento', ?)",
+            (guild_id, reason, datetime.datetime.now(pytz.utc).isoformat())
+        )
+        job_id = cursor.lastrowid
+        cursor.executemany('''
+            INSERT INTO purge_job_items (job_id, user_id, bungie_membership_id, bungie_membership_type)
+            VALUES (?, ?,
+                (SELECT bungie_membership_id FROM bungie_profiles WHERE discord_id = ?),
+                (SELECT bungie_membership_type FROM bungie_profiles WHERE discord_id = ?))
+        ''', [(job_id, user_id, user_id, user_id) for user_id in user_ids])
+        conn.commit()
+        return job_id
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Erro DB ao criar limpeza de inatividade para guild {guild_id}: {e}")
+        return None
+    finally:
+        db_pool.release(conn)
+
+def db_get_open_purge_job(guild_id: int) -> Optional[sqlite3.Row]:
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT * FROM purge_jobs WHERE guild_id = ? AND status = 'em_andamento' ORDER BY job_id ASC LIMIT 1", (guild_id,))
+        return cursor.fetchone()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao buscar limpeza em andamento para guild {guild_id}: {e}")
+        return None
+    finally:
+        db_pool.release(conn)
+
+def db_get_purge_job_items(job_id: int) -> List[sqlite3.Row]:
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT * FROM purge_job_items WHERE job_id = ? ORDER BY user_id", (job_id,))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao buscar itens da limpeza {job_id}: {e}")
+        return []
+    finally:
+        db_pool.release(conn)
+
+def db_update_purge_job_item(job_id: int, user_id: int, **kwargs):
+    updates = [f"{key} = ?" for key in kwargs]
+    params = list(kwargs.values())
+    if not updates:
+        return
+    updates.append("updated_at_utc = ?")
+    params.extend([datetime.datetime.now(pytz.utc).isoformat(), job_id, user_id])
+    query = f"UPDATE purge_job_items SET {', '.join(updates)} WHERE job_id = ? AND user_id = ?"
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, tuple(params))
+        conn.commit()
+    except sqlite3.Error as e: print(f"Erro DB ao atualizar item {user_id} da limpeza {job_id}: {e}")
+    finally:
+        db_pool.release(conn)
+
+def db_finish_purge_job(job_id: int):
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "UPDATE purge_jobs SET status = 'concluido', finished_at_utc = ? WHERE job_id = ?",
+            (datetime.datetime.now(pytz.utc).isoformat(), job_id)
+        )
+        conn.commit()
+    except sqlite3.Error as e: print(f"Erro DB ao concluir limpeza {job_id}: {e}")
+    finally:
+        db_pool.release(conn)
+
+def _weekly_window_start_day() -> str:
+    # A semana corresponde aos últimos 7 dias UTC, incluindo o dia de hoje.
+    return (datetime.datetime.now(pytz.utc).date() - datetime.timedelta(days=6)).isoformat()
 
 def db_get_user_weekly_voice_time(guild_id: int, user_id: int) -> int:
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     total_seconds = 0
-    seven_days_ago = (datetime.datetime.now(pytz.utc) - datetime.timedelta(days=7)).isoformat()
     try:
         cursor.execute(
-            "SELECT SUM(duration_seconds) FROM voice_sessions WHERE guild_id = ? AND user_id = ? AND session_start_utc >= ?",
-            (guild_id, user_id, seven_days_ago)
+            "SELECT SUM(total_seconds) FROM voice_daily_totals WHERE guild_id = ? AND user_id = ? AND day_utc >= ?",
+            (guild_id, user_id, _weekly_window_start_day())
         )
         result = cursor.fetchone()
         if result and result[0] is not None:
@@ -348,70 +713,138 @@ def db_get_user_weekly_voice_time(guild_id: int, user_id: int) -> int:
     except sqlite3.Error as e:
         print(f"Erro DB ao calcular tempo de voz semanal para user {user_id}: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
     return total_seconds
 
 def db_get_all_users_weekly_voice_time(guild_id: int) -> List[Tuple[int, int]]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     results = []
-    seven_days_ago = (datetime.datetime.now(pytz.utc) - datetime.timedelta(days=7)).isoformat()
     try:
         cursor.execute(
-            "SELECT user_id, SUM(duration_seconds) as total_time FROM voice_sessions WHERE guild_id = ? AND session_start_utc >= ? GROUP BY user_id ORDER BY total_time DESC",
-            (guild_id, seven_days_ago)
+            "SELECT user_id, SUM(total_seconds) as total_time FROM voice_daily_totals WHERE guild_id = ? AND day_utc >= ? GROUP BY user_id ORDER BY total_time DESC",
+            (guild_id, _weekly_window_start_day())
         )
         results = [tuple(row) for row in cursor.fetchall()]
     except sqlite3.Error as e:
         print(f"Erro DB ao buscar tempo de voz semanal de todos os users: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
     return results
 
-def db_get_inactive_members(guild_id: int, weeks_inactive: int) -> List[int]:
-    conn = sqlite3.connect(DB_NAME)
+def db_get_last_attendance_by_user(guild_id: int) -> Dict[int, Optional[str]]:
+    """
+    Devolve, numa única consulta agrupada, a data do último evento com presença de cada
+    usuário com RSVP na guild (None se nunca compareceu). Inclui o histórico já arquivado
+    pela rotina de retenção em member_attendance_summaries.
+    """
+    conn = db_pool.acquire()
     cursor = conn.cursor()
-    inactive_users = []
-    cutoff_date = (datetime.datetime.now(pytz.utc) - datetime.timedelta(weeks=weeks_inactive)).isoformat()
+    last_attendance: Dict[int, Optional[str]] = {}
     try:
-        cursor.execute("SELECT DISTINCT user_id FROM rsvps INNER JOIN events ON rsvps.event_id = events.event_id WHERE events.guild_id = ?", (guild_id,))
-        all_rsvpd_users = [row[0] for row in cursor.fetchall()]
+        cursor.execute('''
+            SELECT user_id, MAX(last_attended) FROM (
+                SELECT rsvps.user_id AS user_id, MAX(CASE WHEN rsvps.attendance_status = 'compareceu' THEN events.event_time_utc END) AS last_attended
+                FROM rsvps
+                INNER JOIN events ON rsvps.event_id = events.event_id
+                WHERE events.guild_id = ?
+                GROUP BY rsvps.user_id
+                UNION ALL
+                SELECT user_id, last_attended_utc FROM member_attendance_summaries WHERE guild_id = ?
+            )
+            GROUP BY user_id
+        ''', (guild_id, guild_id))
+        for user_id, last_attended in cursor.fetchall():
+            last_attendance[user_id] = last_attended
+    except sqlite3.Error as e:
+        print(f"Erro DB ao buscar última presença dos membros: {e}")
+    finally:
+        db_pool.release(conn)
+    return last_attendance
 
-        for user_id in all_rsvpd_users:
-            cursor.execute('''
-                SELECT MAX(events.event_time_utc) 
-                FROM rsvps 
-                INNER JOIN events ON rsvps.event_id = events.event_id 
-                WHERE rsvps.user_id = ? AND events.guild_id = ? AND rsvps.attendance_status = 'compareceu'
-            ''', (user_id, guild_id))
-            last_attended_row = cursor.fetchone()
+def filter_inactive_members(last_attendance: Dict[int, Optional[str]], weeks_inactive: int, now_utc: Optional[datetime.datetime] = None) -> List[int]:
+    cutoff_date = ((now_utc or datetime.datetime.now(pytz.utc)) - datetime.timedelta(weeks=weeks_inactive)).isoformat()
+    return [user_id for user_id, last_attended in last_attendance.items() if last_attended is None or last_attended < cutoff_date]
 
-            if last_attended_row is None or last_attended_row[0] is None or last_attended_row[0] < cutoff_date:
-                inactive_users.append(user_id)
+def db_get_inactive_members(guild_id: int, weeks_inactive: int) -> List[int]:
+    return filter_inactive_members(db_get_last_attendance_by_user(guild_id), weeks_inactive)
+
+def split_voice_session_by_day(session_start_utc: str, session_end_utc: str, duration_seconds: int) -> List[Tuple[str, int]]:
+    """Divide uma sessão de voz pelos dias UTC que ela atravessa, devolvendo (dia, segundos)."""
+    start = datetime.datetime.fromisoformat(session_start_utc).astimezone(pytz.utc)
+    end = datetime.datetime.fromisoformat(session_end_utc).astimezone(pytz.utc)
+    if end <= start or start.date() == end.date():
+        return [(start.date().isoformat(), duration_seconds)]
+
+    parts = []
+    cursor_dt = start
+    while cursor_dt.date() < end.date():
+        next_midnight = datetime.datetime.combine(cursor_dt.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=pytz.utc)
+        parts.append((cursor_dt.date().isoformat(), int((next_midnight - cursor_dt).total_seconds())))
+        cursor_dt = next_midnight
+    # O último dia recebe o restante, para que a soma seja sempre igual a duration_seconds.
+    parts.append((end.date().isoformat(), max(0, duration_seconds - sum(seconds for _, seconds in parts))))
+    return parts
+
+def _add_voice_session_to_daily_totals(cursor: sqlite3.Cursor, user_id: int, guild_id: int, session_start_utc: str, session_end_utc: str, duration_seconds: int):
+    cursor.executemany('''
+        INSERT INTO voice_daily_totals (guild_id, user_id, day_utc, total_seconds) VALUES (?, ?, ?, ?)
+        ON CONFLICT(guild_id, user_id, day_utc) DO UPDATE SET total_seconds = total_seconds + excluded.total_seconds
+    ''', [(guild_id, user_id, day, seconds) for day, seconds in split_voice_session_by_day(session_start_utc, session_end_utc, duration_seconds)])
+
+def _rebuild_voice_daily_totals(cursor: sqlite3.Cursor, guild_id: Optional[int] = None) -> int:
+    if guild_id is None:
+        cursor.execute("DELETE FROM voice_daily_totals")
+        cursor.execute("SELECT user_id, guild_id, session_start_utc, session_end_utc, duration_seconds FROM voice_sessions WHERE session_end_utc IS NOT NULL")
+    else:
+        cursor.execute("DELETE FROM voice_daily_totals WHERE guild_id = ?", (guild_id,))
+        cursor.execute("SELECT user_id, guild_id, session_start_utc, session_end_utc, duration_seconds FROM voice_sessions WHERE guild_id = ? AND session_end_utc IS NOT NULL", (guild_id,))
+    totals: Dict[Tuple[int, int, str], int] = {}
+    sessions = 0
+    for user_id, session_guild_id, start_utc, end_utc, duration_seconds in cursor.fetchall():
+        sessions += 1
+        for day, seconds in split_voice_session_by_day(start_utc, end_utc, duration_seconds or 0):
+            key = (session_guild_id, user_id, day)
+            totals[key] = totals.get(key, 0) + seconds
+    cursor.executemany(
+        "INSERT INTO voice_daily_totals (guild_id, user_id, day_utc, total_seconds) VALUES (?, ?, ?, ?)",
+        [(g, u, d, seconds) for (g, u, d), seconds in totals.items()]
+    )
+    return sessions
+
+def db_rebuild_voice_daily_totals(guild_id: Optional[int] = None) -> int:
+    """Reconstrói o agregado diário a partir do histórico de voice_sessions. Devolve o número de sessões processadas."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    sessions = 0
+    try:
+        sessions = _rebuild_voice_daily_totals(cursor, guild_id)
+        conn.commit()
+        print(f"DB: Agregado de tempo de voz reconstruído a partir de {sessions} sessões.")
     except sqlite3.Error as e:
-        print(f"Erro DB ao buscar membros inativos: {e}")
+        print(f"Erro DB ao reconstruir agregado de tempo de voz: {e}")
     finally:
-        if conn: conn.close()
-    return inactive_users
+        db_pool.release(conn)
+    return sessions
 
 def db_log_voice_session(user_id: int, guild_id: int, session_start_utc: str, session_end_utc: str, duration_seconds: int):
     conn = None
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = db_pool.acquire()
         cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO voice_sessions (user_id, guild_id, session_start_utc, session_end_utc, duration_seconds) VALUES (?, ?, ?, ?, ?)",
             (user_id, guild_id, session_start_utc, session_end_utc, duration_seconds)
         )
+        _add_voice_session_to_daily_totals(cursor, user_id, guild_id, session_start_utc, session_end_utc, duration_seconds)
         conn.commit()
     except sqlite3.Error as e:
         print(f"Erro DB ao registar sessão de voz para user {user_id}: {e}")
     finally:
-        if conn:
-            conn.close()
+        db_pool.release(conn)
 
 def db_add_event_permission(guild_id: int, role_id: int, permission: str):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT OR IGNORE INTO event_permissions (guild_id, role_id, permission) VALUES (?, ?, ?)", (guild_id, role_id, permission))
@@ -419,10 +852,10 @@ def db_add_event_permission(guild_id: int, role_id: int, permission: str):
     except sqlite3.Error as e:
         print(f"Erro DB ao adicionar permissão de evento: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_remove_event_permission(guild_id: int, role_id: int, permission: str):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("DELETE FROM event_permissions WHERE guild_id = ? AND role_id = ? AND permission = ?", (guild_id, role_id, permission))
@@ -430,10 +863,10 @@ def db_remove_event_permission(guild_id: int, role_id: int, permission: str):
     except sqlite3.Error as e:
         print(f"Erro DB ao remover permissão de evento: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_roles_with_permission(guild_id: int, permission: str) -> List[int]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT role_id FROM event_permissions WHERE guild_id = ? AND permission = ?", (guild_id, permission))
@@ -442,12 +875,11 @@ def db_get_roles_with_permission(guild_id: int, permission: str) -> List[int]:
         print(f"Erro DB ao buscar cargos com permissão '{permission}': {e}")
         return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_all_event_permissions(guild_id: int) -> Dict[int, List[str]]:
     permissions_by_role: Dict[int, List[str]] = {}
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT role_id, permission FROM event_permissions WHERE guild_id = ?", (guild_id,))
@@ -458,7 +890,7 @@ def db_get_all_event_permissions(guild_id: int) -> Dict[int, List[str]]:
     except sqlite3.Error as e:
         print(f"Erro DB ao buscar todas as permissões de evento: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
     return permissions_by_role
 
 def db_check_user_permission(guild_id: int, user_roles_ids: Set[int], permission: str) -> bool:
@@ -468,38 +900,108 @@ def db_check_user_permission(guild_id: int, user_roles_ids: Set[int], permission
     return not user_roles_ids.isdisjoint(roles_with_perm)
 
 def db_add_designated_event_channel(guild_id: int, channel_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("INSERT OR IGNORE INTO designated_event_channels (guild_id, channel_id) VALUES (?, ?)", (guild_id, channel_id))
         conn.commit()
     except sqlite3.Error as e: print(f"Erro DB ao adicionar canal designado: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_remove_designated_event_channel(guild_id: int, channel_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("DELETE FROM designated_event_channels WHERE guild_id = ? AND channel_id = ?", (guild_id, channel_id))
         conn.commit()
     except sqlite3.Error as e: print(f"Erro DB ao remover canal designado: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_designated_event_channels(guild_id: int) -> list[int]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT channel_id FROM designated_event_channels WHERE guild_id = ?", (guild_id,))
         return [row[0] for row in cursor.fetchall()]
     except sqlite3.Error as e: print(f"Erro DB ao buscar canais designados: {e}"); return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+
+def db_add_guild_clan(guild_id: int, clan_id: str, admin_discord_id: Optional[int] = None):
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            INSERT INTO guild_clans (guild_id, clan_id, admin_discord_id) VALUES (?, ?, ?)
+            ON CONFLICT(guild_id, clan_id) DO UPDATE SET admin_discord_id = excluded.admin_discord_id
+        ''', (guild_id, str(clan_id), admin_discord_id))
+        conn.commit()
+    except sqlite3.Error as e: print(f"Erro DB ao adicionar clã {clan_id} à guild {guild_id}: {e}")
+    finally:
+        db_pool.release(conn)
+
+def db_remove_guild_clan(guild_id: int, clan_id: str) -> bool:
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM guild_clans WHERE guild_id = ? AND clan_id = ?", (guild_id, str(clan_id)))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e: print(f"Erro DB ao remover clã {clan_id} da guild {guild_id}: {e}"); return False
+    finally:
+        db_pool.release(conn)
+
+def db_get_guild_clans(guild_id: int) -> List[sqlite3.Row]:
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT clan_id, admin_discord_id FROM guild_clans WHERE guild_id = ? ORDER BY clan_id", (guild_id,))
+        return cursor.fetchall()
+    except sqlite3.Error as e: print(f"Erro DB ao buscar clãs da guild {guild_id}: {e}"); return []
+    finally:
+        db_pool.release(conn)
+
+# --- Cache de eventos e RSVPs ---
+# Linhas de `events` e listas de RSVPs por event_id, lidas muitas vezes seguidas pelo
+# clique de RSVP, pelo embed e pelas tarefas. Cada função que altera essas tabelas
+# invalida o event_id depois do commit; os eventos ativos são os últimos a sair.
+_event_cache = LRUCache(EVENT_CACHE_MAX_ENTRIES, pinned=lambda row: row['status'] == 'ativo')
+_rsvp_cache = LRUCache(RSVP_CACHE_MAX_ENTRIES)
+
+def _invalidate_events(*event_ids: int):
+    _event_cache.invalidate_many(event_ids)
+
+def _invalidate_rsvps(*event_ids: int):
+    _rsvp_cache.invalidate_many(event_ids)
+
+# events.version conta as alterações das colunas que aparecem no embed do evento e
+# events.roster_version as da lista de RSVPs; o embed montado é reaproveitado
+# enquanto as duas não mudarem (ver utils.render_event_embed).
+_RENDERED_EVENT_COLUMNS = {'creator_id', 'title', 'description', 'event_time_utc', 'activity_type', 'max_attendees', 'status'}
+
+def _bump_roster_version(cursor: sqlite3.Cursor, event_id: int):
+    cursor.execute("UPDATE events SET roster_version = roster_version + 1 WHERE event_id = ?", (event_id,))
+
+def _rsvps_from_cache(cached: Optional[dict]) -> Optional[dict]:
+    # O cache guarda tuplos; cada chamador recebe listas novas que pode alterar à vontade.
+    return {status: list(user_ids) for status, user_ids in cached.items()} if cached is not None else None
+
+# Os peek_* servem o atalho do db_async: uma falha não entra nas estatísticas, porque
+# a seguir vem a chamada ao db_get_* correspondente, que a conta.
+def peek_event_details(event_id: int) -> Optional[sqlite3.Row]:
+    """Linha do evento se estiver no cache (None caso contrário), sem tocar no banco."""
+    return _event_cache.peek(event_id)
+
+def peek_rsvps_for_event(event_id: int) -> Optional[dict]:
+    return _rsvps_from_cache(_rsvp_cache.peek(event_id))
+
+def get_cache_stats() -> Dict[str, Dict[str, float]]:
+    return {"eventos": _event_cache.get_stats(), "rsvps": _rsvp_cache.get_stats()}
 
 def db_add_or_update_rsvp(event_id: int, user_id: int, status: str):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     timestamp_utc = datetime.datetime.now(pytz.utc).isoformat()
     try:
@@ -510,37 +1012,167 @@ def db_add_or_update_rsvp(event_id: int, user_id: int, status: str):
             status = excluded.status, 
             rsvp_timestamp = excluded.rsvp_timestamp
         ''', (event_id, user_id, status, timestamp_utc))
+        _bump_roster_version(cursor, event_id)
         conn.commit()
     except sqlite3.Error as e: print(f"Erro DB ao adicionar/atualizar RSVP: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_rsvps(event_id)
+        _invalidate_events(event_id)
 
 def db_remove_rsvp(event_id: int, user_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("DELETE FROM rsvps WHERE event_id = ? AND user_id = ?", (event_id, user_id))
+        if cursor.rowcount:
+            _bump_roster_version(cursor, event_id)
         conn.commit()
     except sqlite3.Error as e: print(f"Erro DB ao remover RSVP: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_rsvps(event_id)
+        _invalidate_events(event_id)
+
+def _promote_waitlist(cursor: sqlite3.Cursor, event_id: int, max_attendees: int) -> List[int]:
+    """Passa a 'vou' os primeiros da lista de espera enquanto houver vagas. Devolve quem subiu."""
+    cursor.execute("SELECT COUNT(*) FROM rsvps WHERE event_id = ? AND status = 'vou'", (event_id,))
+    free_spots = max_attendees - cursor.fetchone()[0]
+    if free_spots <= 0:
+        return []
+    cursor.execute(
+        "SELECT user_id FROM rsvps WHERE event_id = ? AND status = 'lista_espera' ORDER BY rsvp_timestamp ASC LIMIT ?",
+        (event_id, free_spots)
+    )
+    promoted = [row[0] for row in cursor.fetchall()]
+    cursor.executemany("UPDATE rsvps SET status = 'vou' WHERE event_id = ? AND user_id = ?", [(event_id, user_id) for user_id in promoted])
+    return promoted
+
+def _read_rsvps(cursor: sqlite3.Cursor, event_id: int) -> dict:
+    rsvps = {'vou': [], 'nao_vou': [], 'talvez': [], 'lista_espera': []}
+    cursor.execute("SELECT user_id, status FROM rsvps WHERE event_id = ? ORDER BY rsvp_timestamp ASC", (event_id,))
+    for row in cursor.fetchall():
+        if row['status'] in rsvps: rsvps[row['status']].append(row['user_id'])
+    return rsvps
+
+def _store_rsvps_in_cache(event_id: int, rsvps: dict, event: Optional[sqlite3.Row] = None):
+    """
+    Depois do commit (na thread do escritor): invalida e já deixa a lista nova no cache,
+    e também a linha do evento quando o roster_version mudou. A lista entra antes do
+    evento, para que quem veja a versão nova no cache leia também os RSVPs novos.
+    """
+    _invalidate_rsvps(event_id)
+    _rsvp_cache.put(event_id, {status: tuple(user_ids) for status, user_ids in rsvps.items()}, _rsvp_cache.generation(event_id))
+    if event is not None:
+        _invalidate_events(event_id)
+        _event_cache.put(event_id, event, _event_cache.generation(event_id))
+
+def db_apply_rsvp(event_id: int, user_id: int, status: Optional[str], force: bool = False) -> Optional[dict]:
+    """
+    Aplica um RSVP numa única transação (BEGIN IMMEDIATE, por isso cliques simultâneos
+    são serializados): com o evento cheio, 'vou' vira 'lista_espera'; quando alguém
+    deixa uma vaga, o primeiro da lista de espera sobe. `status=None` remove o RSVP e
+    `force=True` (gestores) grava o estado pedido mesmo acima da capacidade.
+    Repetir o estado atual não mexe no horário do RSVP (não se perde o lugar).
+
+    Devolve {'status', 'previous', 'changed', 'promoted', 'rsvps', 'event'} ou None se o
+    evento não existir; 'event' é a linha do evento já com o roster_version desta alteração.
+    """
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT * FROM events WHERE event_id = ?", (event_id,))
+        event = cursor.fetchone()
+        if not event:
+            conn.rollback()
+            return None
+        cursor.execute("SELECT status FROM rsvps WHERE event_id = ? AND user_id = ?", (event_id, user_id))
+        row = cursor.fetchone()
+        previous = row['status'] if row else None
+
+        target = status
+        if status == 'vou' and not force and previous != 'vou':
+            if previous == 'lista_espera':
+                target = 'lista_espera'  # Continua na fila; sobe quando abrir vaga.
+            else:
+                cursor.execute("SELECT COUNT(*) FROM rsvps WHERE event_id = ? AND status = 'vou'", (event_id,))
+                if cursor.fetchone()[0] >= event['max_attendees']:
+                    target = 'lista_espera'
+
+        changed = target != previous
+        if changed and target is None:
+            cursor.execute("DELETE FROM rsvps WHERE event_id = ? AND user_id = ?", (event_id, user_id))
+        elif changed:
+            cursor.execute('''
+                INSERT INTO rsvps (event_id, user_id, status, rsvp_timestamp, attendance_status)
+                VALUES (?, ?, ?, ?, 'pendente')
+                ON CONFLICT(event_id, user_id) DO UPDATE SET
+                status = excluded.status,
+                rsvp_timestamp = excluded.rsvp_timestamp
+            ''', (event_id, user_id, target, datetime.datetime.now(pytz.utc).isoformat()))
+
+        freed_spot = previous == 'vou' and target != 'vou'
+        promoted = _promote_waitlist(cursor, event_id, event['max_attendees']) if freed_spot and event['status'] == 'ativo' else []
+        roster_changed = changed or bool(promoted)
+        if roster_changed:
+            _bump_roster_version(cursor, event_id)
+            cursor.execute("SELECT * FROM events WHERE event_id = ?", (event_id,))
+            event = cursor.fetchone()
+        rsvps = _read_rsvps(cursor, event_id)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao aplicar RSVP do usuário {user_id} no evento {event_id}: {e}")
+        conn.rollback()
+        return None
+    finally:
+        db_pool.release(conn)
+    _store_rsvps_in_cache(event_id, rsvps, event if roster_changed else None)
+    return {"status": target, "previous": previous, "changed": changed, "promoted": promoted, "rsvps": rsvps, "event": event}
+
+def db_rebalance_waitlist(event_id: int) -> List[int]:
+    """Preenche vagas novas (ex.: aumento de max_attendees) com a lista de espera. Devolve quem subiu."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT max_attendees FROM events WHERE event_id = ? AND status = 'ativo'", (event_id,))
+        event = cursor.fetchone()
+        promoted = _promote_waitlist(cursor, event_id, event['max_attendees']) if event else []
+        if promoted:
+            _bump_roster_version(cursor, event_id)
+            cursor.execute("SELECT * FROM events WHERE event_id = ?", (event_id,))
+            event = cursor.fetchone()
+        rsvps = _read_rsvps(cursor, event_id)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao atualizar lista de espera do evento {event_id}: {e}")
+        conn.rollback()
+        return []
+    finally:
+        db_pool.release(conn)
+    _store_rsvps_in_cache(event_id, rsvps, event if promoted else None)
+    return promoted
 
 def db_get_rsvps_for_event(event_id: int) -> dict:
-    rsvps = {'vou': [], 'nao_vou': [], 'talvez': [], 'lista_espera': []}
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    cached = _rsvps_from_cache(_rsvp_cache.get(event_id))
+    if cached is not None:
+        return cached
+    generation = _rsvp_cache.generation(event_id)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT user_id, status FROM rsvps WHERE event_id = ? ORDER BY rsvp_timestamp ASC", (event_id,))
-        for row in cursor.fetchall():
-            if row['status'] in rsvps: rsvps[row['status']].append(row['user_id'])
-    except sqlite3.Error as e: print(f"Erro DB ao buscar RSVPs: {e}")
+        rsvps = _read_rsvps(cursor, event_id)
+    except sqlite3.Error as e:
+        print(f"Erro DB ao buscar RSVPs: {e}")
+        return {'vou': [], 'nao_vou': [], 'talvez': [], 'lista_espera': []}
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+    _rsvp_cache.put(event_id, {status: tuple(user_ids) for status, user_ids in rsvps.items()}, generation)
     return rsvps
 
 def db_get_user_active_rsvps_in_guild(user_id: int, guild_id: int) -> list[int]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute('''
@@ -553,51 +1185,74 @@ def db_get_user_active_rsvps_in_guild(user_id: int, guild_id: int) -> list[int]:
         print(f"Erro DB ao buscar RSVPs ativos do usuário na guild: {e}")
         return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_event_details(event_id: int) -> Optional[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    event = _event_cache.get(event_id)
+    if event is not None:
+        return event
+    generation = _event_cache.generation(event_id)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM events WHERE event_id = ?", (event_id,))
-        return cursor.fetchone()
+        event = cursor.fetchone()
     except sqlite3.Error as e: print(f"Erro DB ao buscar detalhes do evento {event_id}: {e}"); return None
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+    if event is not None:
+        _event_cache.put(event_id, event, generation)
+    return event
 
 def db_update_event_status(event_id: int, status: str, delete_after_utc: Optional[str] = None):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         if delete_after_utc:
-            cursor.execute("UPDATE events SET status = ?, delete_message_after_utc = ? WHERE event_id = ?", (status, delete_after_utc, event_id))
+            cursor.execute("UPDATE events SET status = ?, delete_message_after_utc = ?, version = version + 1 WHERE event_id = ?", (status, delete_after_utc, event_id))
         else:
-            cursor.execute("UPDATE events SET status = ?, delete_message_after_utc = NULL WHERE event_id = ?", (status, event_id))
+            cursor.execute("UPDATE events SET status = ?, delete_message_after_utc = NULL, version = version + 1 WHERE event_id = ?", (status, event_id))
+        if status == 'cancelado':
+            # O canal de voz (apagar_vc) ainda pode existir; o resto deixa de fazer sentido.
+            cursor.execute("UPDATE scheduled_jobs SET status = 'cancelado' WHERE event_id = ? AND status = 'pendente' AND kind NOT IN ('apagar_vc', 'apagar_mensagem')", (event_id,))
+        _plan_event_jobs(cursor, event_id)
         conn.commit()
-    except sqlite3.Error as e: print(f"Erro DB ao atualizar status do evento {event_id}: {e}")
+    except sqlite3.Error as e:
+        print(f"Erro DB ao atualizar status do evento {event_id}: {e}")
+        return
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_events(event_id)
+    _notify_scheduled_jobs_changed(event_id)
 
 def db_update_event_details(event_id: int, **kwargs):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
     updates = [f"{key} = ?" for key in kwargs]
     params = list(kwargs.values())
     if not updates:
         return
+    if _RENDERED_EVENT_COLUMNS.intersection(kwargs):
+        updates.append("version = version + 1")
     params.append(event_id)
     query = f"UPDATE events SET {', '.join(updates)} WHERE event_id = ?"
+    replan = 'event_time_utc' in kwargs
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
     try:
         cursor.execute(query, tuple(params))
+        if replan:
+            _plan_event_jobs(cursor, event_id)
         conn.commit()
-    except sqlite3.Error as e: print(f"Erro no DB ao atualizar detalhes do evento {event_id}: {e}")
+    except sqlite3.Error as e:
+        print(f"Erro no DB ao atualizar detalhes do evento {event_id}: {e}")
+        replan = False
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_events(event_id)
+    if replan:
+        _notify_scheduled_jobs_changed(event_id)
 
 def db_get_events_for_cleanup() -> list[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     two_hours_ago = datetime.datetime.now(pytz.utc) - datetime.timedelta(hours=2)
     try:
@@ -605,47 +1260,22 @@ def db_get_events_for_cleanup() -> list[sqlite3.Row]:
         return cursor.fetchall()
     except sqlite3.Error as e: print(f"Erro DB ao buscar eventos para cleanup: {e}"); return []
     finally:
-        if conn: conn.close()
-
-def db_get_events_to_delete_message() -> list[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    now_utc = datetime.datetime.now(pytz.utc).isoformat()
-    try:
-        cursor.execute("SELECT event_id, guild_id, channel_id, message_id, status FROM events WHERE (status = 'cancelado' OR status = 'concluido') AND delete_message_after_utc IS NOT NULL AND delete_message_after_utc <= ?", (now_utc,))
-        return cursor.fetchall()
-    except sqlite3.Error as e: print(f"Erro DB ao buscar eventos para deletar msg: {e}"); return []
-    finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_clear_message_id_and_update_status_after_delete(event_id: int, original_status: str):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     new_status = f"msg_{original_status}_deletada"
     try:
-        cursor.execute("UPDATE events SET message_id = NULL, status = ?, delete_message_after_utc = NULL WHERE event_id = ?", (new_status, event_id))
+        cursor.execute("UPDATE events SET message_id = NULL, status = ?, delete_message_after_utc = NULL, version = version + 1 WHERE event_id = ?", (new_status, event_id))
         conn.commit()
     except sqlite3.Error as e: print(f"Erro DB ao limpar message_id e status do evento {event_id}: {e}")
     finally:
-        if conn: conn.close()
-
-def db_get_upcoming_events_for_reminder() -> list[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    now_utc = datetime.datetime.now(pytz.utc)
-    start_window = (now_utc + datetime.timedelta(minutes=14)).isoformat()
-    end_window = (now_utc + datetime.timedelta(minutes=16)).isoformat()
-    try:
-        cursor.execute("SELECT * FROM events WHERE status = 'ativo' AND reminder_sent = 0 AND event_time_utc > ? AND event_time_utc <= ?", (start_window, end_window ))
-        return cursor.fetchall()
-    except sqlite3.Error as e: print(f"Erro DB ao buscar eventos para lembrete: {e}"); return []
-    finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_events(event_id)
 
 def db_mark_reminder_sent(event_id: int, reminder_type: str = "standard"):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     column_to_update = "reminder_sent"
     if reminder_type == "confirmation":
@@ -655,24 +1285,11 @@ def db_mark_reminder_sent(event_id: int, reminder_type: str = "standard"):
         conn.commit()
     except sqlite3.Error as e: print(f"Erro DB ao marcar {reminder_type} lembrete como enviado para evento {event_id}: {e}")
     finally:
-        if conn: conn.close()
-
-def db_get_events_for_confirmation_reminder() -> list[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    now_utc = datetime.datetime.now(pytz.utc)
-    start_window = (now_utc + datetime.timedelta(minutes=59)).isoformat()
-    end_window = (now_utc + datetime.timedelta(minutes=61)).isoformat()
-    try:
-        cursor.execute("SELECT * FROM events WHERE status = 'ativo' AND confirmation_reminder_sent = 0 AND event_time_utc > ? AND event_time_utc <= ?", (start_window, end_window ))
-        return cursor.fetchall()
-    except sqlite3.Error as e: print(f"Erro DB ao buscar eventos para lembrete de confirmação: {e}"); return []
-    finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_events(event_id)
 
 def db_create_event(**kwargs) -> Optional[int]:
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     event_id = None
     columns = [
@@ -685,25 +1302,31 @@ def db_create_event(**kwargs) -> Optional[int]:
     try:
         cursor.execute(f"INSERT INTO events ({columns_str}) VALUES ({placeholders})", values)
         event_id = cursor.lastrowid
+        _plan_event_jobs(cursor, event_id)
         conn.commit()
-    except sqlite3.Error as e: print(f"Erro DB ao criar evento: {e}")
+    except sqlite3.Error as e:
+        print(f"Erro DB ao criar evento: {e}")
+        conn.rollback()
+        event_id = None
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+    if event_id:
+        _notify_scheduled_jobs_changed(event_id)
     return event_id
 
 def db_update_event_message_id(event_id: int, message_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("UPDATE events SET message_id = ? WHERE event_id = ?", (message_id, event_id))
         conn.commit()
     except sqlite3.Error as e: print(f"Erro DB ao atualizar message_id do evento {event_id}: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_events(event_id)
 
 def db_get_event_temp_role_id(event_id: int) -> Optional[int]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT temp_role_id FROM events WHERE event_id = ?", (event_id,))
@@ -711,104 +1334,446 @@ def db_get_event_temp_role_id(event_id: int) -> Optional[int]:
         return row['temp_role_id'] if row else None
     except sqlite3.Error as e: print(f"Erro DB ao buscar temp_role_id para evento {event_id}: {e}"); return None
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_digest_channel(guild_id: int) -> Optional[int]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    try:
-        configs = db_get_server_configs(guild_id)
-        return configs['digest_channel_id'] if configs and configs.get('digest_channel_id') else None
-    finally:
-        if conn: conn.close()
+    configs = db_get_server_configs(guild_id)
+    return configs['digest_channel_id'] if configs and configs.get('digest_channel_id') else None
 
 def db_get_events_for_digest_list(guild_id: int, start_utc: datetime.datetime, end_utc: datetime.datetime) -> list[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM events WHERE guild_id = ? AND status = 'ativo' AND event_time_utc BETWEEN ? AND ? ORDER BY event_time_utc ASC", (guild_id, start_utc.isoformat(), end_utc.isoformat()))
         return cursor.fetchall()
     except sqlite3.Error as e: print(f"Erro DB ao buscar eventos para digest: {e}"); return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
 def db_get_far_future_events(guild_id: int, after_utc: datetime.datetime) -> list[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT * FROM events WHERE guild_id = ? AND status = 'ativo' AND event_time_utc > ? ORDER BY event_time_utc ASC", (guild_id, after_utc.isoformat()))
         return cursor.fetchall()
     except sqlite3.Error as e: print(f"Erro DB ao buscar eventos futuros (distantes): {e}"); return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+
+def db_update_rsvp_attendance(event_id: int, user_id: int, attendance_status: str):
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE rsvps SET attendance_status = ? WHERE event_id = ? AND user_id = ?", (attendance_status, event_id, user_id))
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao atualizar presença para evento {event_id}, user {user_id}: {e}")
+    finally:
+        db_pool.release(conn)
 
-def db_get_events_for_attendance_check() -> List[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+def db_mark_attendance_checked(event_id: int):
+    conn = db_pool.acquire()
     cursor = conn.cursor()
-    now_utc = datetime.datetime.now(pytz.utc)
-    start_window = (now_utc - datetime.timedelta(minutes=40)).isoformat()
-    end_window = (now_utc - datetime.timedelta(minutes=30)).isoformat()
     try:
-        cursor.execute("SELECT * FROM events WHERE status = 'ativo' AND attendance_checked = 0 AND event_time_utc BETWEEN ? AND ?", (start_window, end_window))
+        cursor.execute("UPDATE events SET attendance_checked = 1 WHERE event_id = ?", (event_id,))
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao marcar verificação de presença para evento {event_id}: {e}")
+    finally:
+        db_pool.release(conn)
+        _invalidate_events(event_id)
+
+def db_get_events_for_pgcr_check(not_before_iso: str, not_after_iso: str) -> List[sqlite3.Row]:
+    """Eventos com a presença por voz já registada e ainda não confrontados com os PGCRs."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "SELECT * FROM events WHERE pgcr_checked = 0 AND attendance_checked = 1 AND event_time_utc BETWEEN ? AND ?",
+            (not_before_iso, not_after_iso)
+        )
         return cursor.fetchall()
     except sqlite3.Error as e:
-        print(f"Erro DB ao buscar eventos para verificação de presença: {e}")
+        print(f"Erro DB ao buscar eventos para verificação por PGCR: {e}")
         return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
-def db_update_rsvp_attendance(event_id: int, user_id: int, attendance_status: str):
-    conn = sqlite3.connect(DB_NAME)
+def db_get_event_attendance(event_id: int) -> List[sqlite3.Row]:
+    """Confirmados ('vou') do evento com o estado de presença e o perfil Bungie, se vinculado."""
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE rsvps SET attendance_status = ? WHERE event_id = ? AND user_id = ?", (attendance_status, event_id, user_id))
+        cursor.execute('''
+            SELECT r.user_id, r.attendance_status, bp.bungie_membership_id, bp.bungie_membership_type
+            FROM rsvps r
+            LEFT JOIN bungie_profiles bp ON bp.discord_id = r.user_id
+            WHERE r.event_id = ? AND r.status = 'vou'
+        ''', (event_id,))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao buscar presenças do evento {event_id}: {e}")
+        return []
+    finally:
+        db_pool.release(conn)
+
+def db_apply_pgcr_attendance(event_id: int, attended_user_ids: List[int]):
+    """Marca como 'compareceu' os ausentes confirmados pelos PGCRs e fecha a verificação do evento."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "UPDATE rsvps SET attendance_status = 'compareceu' WHERE event_id = ? AND user_id = ? AND attendance_status = 'ausente'",
+            [(event_id, user_id) for user_id in attended_user_ids]
+        )
+        cursor.execute("UPDATE events SET pgcr_checked = 1 WHERE event_id = ?", (event_id,))
         conn.commit()
     except sqlite3.Error as e:
-        print(f"Erro DB ao atualizar presença para evento {event_id}, user {user_id}: {e}")
+        print(f"Erro DB ao aplicar presenças por PGCR do evento {event_id}: {e}")
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
+        _invalidate_events(event_id)
+
+# --- Fila de DMs (dm_outbox) ---
+# Estados: pendente -> enviando -> enviado | bloqueado | falhou | ignorado.
+# Uma linha só passa a 'enviando' imediatamente antes do send; as que ficarem assim
+# por um reinício viram 'incerto' e não são reenviadas (no máximo uma entrega).
+# As que ainda esperavam pelo limitador continuam 'pendente' e voltam a sair.
+def db_enqueue_dms(messages: List[Tuple[str, int, Optional[int], str, str, int]]) -> int:
+    """`messages` = [(dedupe_key, user_id, event_id, kind, content, priority)]. Devolve quantas entraram (as repetidas são ignoradas)."""
+    if not messages:
+        return 0
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    created_at = datetime.datetime.now(pytz.utc).isoformat()
+    try:
+        before = conn.total_changes
+        cursor.executemany(
+            "INSERT OR IGNORE INTO dm_outbox (dedupe_key, user_id, event_id, kind, content, priority, created_at_utc) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(*message, created_at) for message in messages]
+        )
+        conn.commit()
+        return conn.total_changes - before
+    except sqlite3.Error as e:
+        print(f"Erro DB ao enfileirar DMs: {e}")
+        return 0
+    finally:
+        db_pool.release(conn)
 
-def db_mark_attendance_checked(event_id: int):
-    conn = sqlite3.connect(DB_NAME)
+def db_get_pending_dms(limit: int) -> List[sqlite3.Row]:
+    """Até `limit` DMs pendentes, por prioridade e ordem de chegada. Não as reserva: ver db_mark_dm_sending."""
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     try:
-        cursor.execute("UPDATE events SET attendance_checked = 1 WHERE event_id = ?", (event_id,))
+        cursor.execute("SELECT * FROM dm_outbox WHERE status = 'pendente' ORDER BY priority, outbox_id LIMIT ?", (limit,))
+        return cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao buscar DMs da fila: {e}")
+        return []
+    finally:
+        db_pool.release(conn)
+
+def db_mark_dm_sending(outbox_id: int) -> bool:
+    """Passa a DM a 'enviando' logo antes do envio. Devolve False se já não estava pendente."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE dm_outbox SET status = 'enviando' WHERE outbox_id = ? AND status = 'pendente'", (outbox_id,))
         conn.commit()
+        return cursor.rowcount > 0
     except sqlite3.Error as e:
-        print(f"Erro DB ao marcar verificação de presença para evento {event_id}: {e}")
+        print(f"Erro DB ao reservar a DM {outbox_id}: {e}")
+        return False
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
-def db_get_events_for_vc_creation() -> List[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+def db_finish_dm(outbox_id: int, status: str, error: Optional[str] = None):
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    sent_at = datetime.datetime.now(pytz.utc).isoformat()
+    try:
+        cursor.execute("UPDATE dm_outbox SET status = ?, sent_at_utc = ?, error = ? WHERE outbox_id = ?", (status, sent_at, error, outbox_id))
+        conn.commit()
+    except sqlite3.Error as e: print(f"Erro DB ao finalizar DM {outbox_id}: {e}")
+    finally:
+        db_pool.release(conn)
+
+def db_recover_dm_outbox() -> int:
+    """Marca como 'incerto' as DMs que estavam a ser enviadas quando o bot parou."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE dm_outbox SET status = 'incerto' WHERE status = 'enviando'")
+        conn.commit()
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Erro DB ao recuperar a fila de DMs: {e}")
+        return 0
+    finally:
+        db_pool.release(conn)
+
+def db_get_dm_outbox_counts() -> Dict[str, int]:
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT status, COUNT(*) FROM dm_outbox GROUP BY status")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    except sqlite3.Error as e:
+        print(f"Erro DB ao contar DMs da fila: {e}")
+        return {}
+    finally:
+        db_pool.release(conn)
+
+def db_prune_dm_outbox_batch(cutoff_utc: str, batch_size: int) -> int:
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "DELETE FROM dm_outbox WHERE outbox_id IN (SELECT outbox_id FROM dm_outbox WHERE created_at_utc < ? AND status NOT IN ('pendente', 'enviando') LIMIT ?)",
+            (cutoff_utc, batch_size)
+        )
+        conn.commit()
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Erro DB ao apagar DMs antigas da fila: {e}")
+        return 0
+    finally:
+        db_pool.release(conn)
+
+# --- Tarefas agendadas por evento ---
+# Cada evento ativo tem uma linha por tipo de tarefa (EVENT_JOB_OFFSETS_MINUTES), com a
+# hora em que deve correr. As funções que criam eventos ou mudam o horário/estado
+# replanejam as linhas na mesma transação e avisam os ouvintes (o agendador do bot).
+_scheduled_jobs_listeners: List[Callable[[int], None]] = []
+
+def add_scheduled_jobs_listener(callback: Callable[[int], None]):
+    """`callback(event_id)` é chamado (na thread que fez a escrita) após cada mudança nas tarefas do evento."""
+    if callback not in _scheduled_jobs_listeners:
+        _scheduled_jobs_listeners.append(callback)
+
+def remove_scheduled_jobs_listener(callback: Callable[[int], None]):
+    if callback in _scheduled_jobs_listeners:
+        _scheduled_jobs_listeners.remove(callback)
+
+def _notify_scheduled_jobs_changed(event_id: int):
+    for callback in list(_scheduled_jobs_listeners):
+        try:
+            callback(event_id)
+        except Exception as e:
+            print(f"AVISO: Ouvinte de tarefas agendadas falhou para o evento {event_id}: {e}")
+
+def _plan_event_jobs(cursor: sqlite3.Cursor, event_id: int):
+    """(Re)calcula as tarefas pendentes do evento a partir do horário, estado e exclusão da mensagem."""
+    cursor.execute("SELECT event_time_utc, status, delete_message_after_utc FROM events WHERE event_id = ?", (event_id,))
+    event = cursor.fetchone()
+    if not event:
+        return
+    jobs = []
+    if event['status'] == 'ativo':
+        event_time = datetime.datetime.fromisoformat(event['event_time_utc'])
+        for kind, offset_minutes in EVENT_JOB_OFFSETS_MINUTES.items():
+            jobs.append((event_id, kind, (event_time + datetime.timedelta(minutes=offset_minutes)).isoformat()))
+    if event['delete_message_after_utc']:
+        jobs.append((event_id, 'apagar_mensagem', event['delete_message_after_utc']))
+    else:
+        cursor.execute("UPDATE scheduled_jobs SET status = 'cancelado' WHERE event_id = ? AND kind = 'apagar_mensagem' AND status = 'pendente'", (event_id,))
+    # Só volta a 'pendente' o que mudou de hora; as já feitas para a mesma hora ficam como estão.
+    cursor.executemany('''
+        INSERT INTO scheduled_jobs (event_id, kind, due_at_utc, status) VALUES (?, ?, ?, 'pendente')
+        ON CONFLICT (event_id, kind) DO UPDATE SET due_at_utc = excluded.due_at_utc, status = 'pendente'
+        WHERE scheduled_jobs.due_at_utc != excluded.due_at_utc
+    ''', jobs)
+
+def db_get_pending_scheduled_jobs() -> List[sqlite3.Row]:
+    conn = db_pool.acquire()
     cursor = conn.cursor()
-    now_utc = datetime.datetime.now(pytz.utc)
-    start_window = (now_utc + datetime.timedelta(minutes=59)).isoformat()
-    end_window = (now_utc + datetime.timedelta(minutes=61)).isoformat()
     try:
-        cursor.execute("SELECT * FROM events WHERE status = 'ativo' AND voice_channel_id IS NULL AND event_time_utc BETWEEN ? AND ?", (start_window, end_window))
+        cursor.execute("SELECT job_id, event_id, kind, due_at_utc FROM scheduled_jobs WHERE status = 'pendente' ORDER BY due_at_utc ASC")
         return cursor.fetchall()
     except sqlite3.Error as e:
-        print(f"Erro DB ao buscar eventos para criação de VC: {e}")
+        print(f"Erro DB ao buscar tarefas agendadas pendentes: {e}")
         return []
     finally:
-        if conn: conn.close()
+        db_pool.release(conn)
 
-def db_get_events_for_vc_deletion() -> List[sqlite3.Row]:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+def db_get_scheduled_jobs_for_event(event_id: int) -> List[sqlite3.Row]:
+    conn = db_pool.acquire()
     cursor = conn.cursor()
-    three_hours_ago = (datetime.datetime.now(pytz.utc) - datetime.timedelta(hours=3)).isoformat()
     try:
-        cursor.execute("SELECT event_id, guild_id, voice_channel_id FROM events WHERE status = 'ativo' AND voice_channel_id IS NOT NULL AND event_time_utc <= ?", (three_hours_ago,))
+        cursor.execute("SELECT job_id, event_id, kind, due_at_utc FROM scheduled_jobs WHERE event_id = ? AND status = 'pendente'", (event_id,))
         return cursor.fetchall()
     except sqlite3.Error as e:
-        print(f"Erro DB ao buscar eventos para deleção de VC: {e}")
+        print(f"Erro DB ao buscar tarefas agendadas do evento {event_id}: {e}")
         return []
     finally:
-        if conn: conn.close()
\ No newline at end of file
+        db_pool.release(conn)
+
+def db_finish_scheduled_job(job_id: int, due_at_utc: str, status: str = 'feito') -> bool:
+    """
+    Fecha a tarefa ('feito', 'expirado' ou 'falhou') que correu para o prazo `due_at_utc`.
+    Se entretanto o evento foi replanejado, a nova ocorrência fica pendente e devolve False.
+    """
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE scheduled_jobs SET status = ? WHERE job_id = ? AND due_at_utc = ? AND status = 'pendente'", (status, job_id, due_at_utc))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Erro DB ao fechar a tarefa agendada {job_id}: {e}")
+        return False
+    finally:
+        db_pool.release(conn)
+
+def db_reschedule_job(job_id: int, due_at_utc: str, new_due_at_utc: str) -> bool:
+    """Adia a tarefa que correu para `due_at_utc`; devolve False se o evento foi replanejado entretanto."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE scheduled_jobs SET due_at_utc = ? WHERE job_id = ? AND due_at_utc = ? AND status = 'pendente'", (new_due_at_utc, job_id, due_at_utc))
+        conn.commit()
+        return cursor.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"Erro DB ao reagendar a tarefa {job_id}: {e}")
+        return False
+    finally:
+        db_pool.release(conn)
+
+# --- Retenção de dados ---
+# Estados finais de eventos que podem ser arquivados (a mensagem já foi apagada ou não há exclusão pendente).
+RETENTION_EVENT_STATUSES = ('concluido', 'cancelado', 'msg_concluido_deletada', 'msg_cancelado_deletada')
+
+def db_archive_voice_sessions_batch(cutoff_utc: str, batch_size: int) -> int:
+    """Move até `batch_size` sessões de voz anteriores ao corte para voice_monthly_totals e apaga-as. Devolve quantas foram apagadas."""
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    deleted = 0
+    try:
+        cursor.execute("SELECT session_id FROM voice_sessions WHERE session_start_utc < ? ORDER BY session_start_utc LIMIT ?", (cutoff_utc, batch_size))
+        session_ids = [row[0] for row in cursor.fetchall()]
+        if not session_ids:
+            return 0
+        placeholders = ", ".join("?" * len(session_ids))
+        cursor.execute(f'''
+            INSERT INTO voice_monthly_totals (guild_id, user_id, month_utc, total_seconds, session_count)
+            SELECT guild_id, user_id, substr(session_start_utc, 1, 7), COALESCE(SUM(duration_seconds), 0), COUNT(*)
+            FROM voice_sessions WHERE session_id IN ({placeholders})
+            GROUP BY guild_id, user_id, substr(session_start_utc, 1, 7)
+            ON CONFLICT(guild_id, user_id, month_utc) DO UPDATE SET
+                total_seconds = total_seconds + excluded.total_seconds,
+                session_count = session_count + excluded.session_count
+        ''', session_ids)
+        cursor.execute(f"DELETE FROM voice_sessions WHERE session_id IN ({placeholders})", session_ids)
+        deleted = cursor.rowcount
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao arquivar sessões de voz: {e}")
+    finally:
+        db_pool.release(conn)
+    return deleted
+
+def db_prune_voice_daily_totals_batch(cutoff_day: str, batch_size: int) -> int:
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    deleted = 0
+    try:
+        cursor.execute("DELETE FROM voice_daily_totals WHERE rowid IN (SELECT rowid FROM voice_daily_totals WHERE day_utc < ? LIMIT ?)", (cutoff_day, batch_size))
+        deleted = cursor.rowcount
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao podar agregado diário de voz: {e}")
+    finally:
+        db_pool.release(conn)
+    return deleted
+
+def db_archive_events_batch(cutoff_utc: str, batch_size: int) -> Tuple[int, int]:
+    """
+    Arquiva até `batch_size` eventos encerrados anteriores ao corte: grava a contagem de presenças
+    em event_attendance_summaries, atualiza member_attendance_summaries e apaga o evento e os seus RSVPs.
+    Devolve (eventos apagados, rsvps apagados).
+    """
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    events_deleted, rsvps_deleted = 0, 0
+    event_ids: List[int] = []
+    status_placeholders = ", ".join("?" * len(RETENTION_EVENT_STATUSES))
+    try:
+        cursor.execute(
+            f"SELECT event_id FROM events WHERE status IN ({status_placeholders}) AND event_time_utc < ? AND delete_message_after_utc IS NULL ORDER BY event_time_utc LIMIT ?",
+            (*RETENTION_EVENT_STATUSES, cutoff_utc, batch_size)
+        )
+        event_ids = [row[0] for row in cursor.fetchall()]
+        if not event_ids:
+            return 0, 0
+        placeholders = ", ".join("?" * len(event_ids))
+        archived_at = datetime.datetime.now(pytz.utc).isoformat()
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO event_attendance_summaries (
+                event_id, guild_id, title, activity_type, event_time_utc, final_status,
+                confirmed_count, attended_count, absent_count, maybe_count, declined_count, archived_at_utc
+            )
+            SELECT e.event_id, e.guild_id, e.title, e.activity_type, e.event_time_utc, e.status,
+                COUNT(CASE WHEN r.status = 'vou' THEN 1 END),
+                COUNT(CASE WHEN r.attendance_status = 'compareceu' THEN 1 END),
+                COUNT(CASE WHEN r.attendance_status = 'ausente' THEN 1 END),
+                COUNT(CASE WHEN r.status = 'talvez' THEN 1 END),
+                COUNT(CASE WHEN r.status = 'nao_vou' THEN 1 END),
+                ?
+            FROM events e LEFT JOIN rsvps r ON r.event_id = e.event_id
+            WHERE e.event_id IN ({placeholders})
+            GROUP BY e.event_id
+        ''', (archived_at, *event_ids))
+        cursor.execute(f'''
+            INSERT INTO member_attendance_summaries (guild_id, user_id, last_attended_utc, events_attended)
+            SELECT e.guild_id, r.user_id,
+                MAX(CASE WHEN r.attendance_status = 'compareceu' THEN e.event_time_utc END),
+                COUNT(CASE WHEN r.attendance_status = 'compareceu' THEN 1 END)
+            FROM rsvps r INNER JOIN events e ON r.event_id = e.event_id
+            WHERE e.event_id IN ({placeholders})
+            GROUP BY e.guild_id, r.user_id
+            ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                last_attended_utc = CASE
+                    WHEN last_attended_utc IS NULL OR excluded.last_attended_utc > last_attended_utc THEN excluded.last_attended_utc
+                    ELSE last_attended_utc
+                END,
+                events_attended = events_attended + excluded.events_attended
+        ''', event_ids)
+        cursor.execute(f"DELETE FROM rsvps WHERE event_id IN ({placeholders})", event_ids)
+        rsvps_deleted = cursor.rowcount
+        cursor.execute(f"DELETE FROM events WHERE event_id IN ({placeholders})", event_ids)
+        events_deleted = cursor.rowcount
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Erro DB ao arquivar eventos antigos: {e}")
+        events_deleted, rsvps_deleted = 0, 0
+    finally:
+        db_pool.release(conn)
+        _invalidate_events(*event_ids)
+        _invalidate_rsvps(*event_ids)
+    return events_deleted, rsvps_deleted
+
+def db_incremental_vacuum(max_pages: int) -> int:
+    """
+    Devolve ao sistema de ficheiros até `max_pages` páginas livres (0 = todas) e retorna os bytes recuperados.
+    Na primeira execução converte a base para auto_vacuum=INCREMENTAL, o que exige um VACUUM completo.
+    """
+    conn = db_pool.acquire()
+    cursor = conn.cursor()
+    reclaimed = 0
+    try:
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        pages_before = cursor.execute("PRAGMA page_count").fetchone()[0]
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("DB: Convertendo a base de dados para auto_vacuum=INCREMENTAL (VACUUM completo, apenas uma vez).")
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+        else:
+            cursor.execute(f"PRAGMA incremental_vacuum({int(max_pages)})")
+            cursor.fetchall()
+        pages_after = cursor.execute("PRAGMA page_count").fetchone()[0]
+        reclaimed = max(0, pages_before - pages_after) * page_size
+    except sqlite3.Error as e:
+        print(f"Erro DB ao executar vacuum incremental: {e}")
+    finally:
+        db_pool.release(conn)
+    return reclaimed
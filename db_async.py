@@ -0,0 +1,109 @@
+# db_async.py
+"""
+Fachada assíncrona para as funções db_* de database.py.
+
+As escritas são serializadas numa única thread dedicada (o SQLite só aceita um
+escritor de cada vez) e as leituras correm num pequeno executor próprio, de
+forma que nenhuma consulta bloqueia o event loop do discord.py.
+
+Uso nos cogs:
+    import db_async as adb
+    event = await adb.db_get_event_details(event_id)
+    await adb.db_add_or_update_rsvp(event_id, user_id, 'vou')
+"""
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import database
+from constants import DB_READER_THREADS
+
+# Funções db_* com estes prefixos apenas leem; todas as outras são tratadas como escrita.
+READ_PREFIXES = ("db_get_", "db_is_", "db_check_")
+
+# Leituras com cache em memória no database: um acerto é devolvido direto, sem passar pelo executor.
+CACHED_READS: Dict[str, Callable[[int], Any]] = {
+    "db_get_event_details": database.peek_event_details,
+    "db_get_rsvps_for_event": database.peek_rsvps_for_event,
+}
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_readers = ThreadPoolExecutor(max_workers=DB_READER_THREADS, thread_name_prefix="db-reader")
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {
+    kind: {"calls": 0, "pending": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+    for kind in ("read", "write")
+}
+
+def _timed(kind: str, func: Callable, *args, **kwargs) -> Any:
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - start
+        with _stats_lock:
+            s = _stats[kind]
+            s["calls"] += 1
+            s["pending"] -= 1
+            s["total_seconds"] += elapsed
+            s["max_seconds"] = max(s["max_seconds"], elapsed)
+
+async def _submit(kind: str, executor: ThreadPoolExecutor, func: Callable, *args, **kwargs) -> Any:
+    with _stats_lock:
+        _stats[kind]["pending"] += 1
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(_timed, kind, func, *args, **kwargs))
+
+async def run_read(func: Callable, *args, **kwargs) -> Any:
+    """Executa uma função de leitura no executor de leitores."""
+    return await _submit("read", _readers, func, *args, **kwargs)
+
+async def run_write(func: Callable, *args, **kwargs) -> Any:
+    """Executa uma função de escrita na thread única do escritor."""
+    return await _submit("write", _writer, func, *args, **kwargs)
+
+def is_read_function(name: str) -> bool:
+    return name.startswith(READ_PREFIXES)
+
+_wrappers: Dict[str, Callable] = {}
+
+def __getattr__(name: str):
+    # Expõe automaticamente `await db_async.db_xxx(...)` para cada database.db_xxx.
+    if not name.startswith("db_"):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    wrapper = _wrappers.get(name)
+    if wrapper is not None:
+        return wrapper
+    func = getattr(database, name, None)
+    if func is None or not callable(func):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    runner = run_read if is_read_function(name) else run_write
+    peek = CACHED_READS.get(name)
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if peek is not None and len(args) == 1 and not kwargs:
+            cached = peek(args[0])
+            if cached is not None:
+                return cached
+        return await runner(func, *args, **kwargs)
+
+    _wrappers[name] = wrapper
+    return wrapper
+
+def get_stats() -> Dict[str, Dict[str, float]]:
+    with _stats_lock:
+        snapshot = {kind: dict(values) for kind, values in _stats.items()}
+    for values in snapshot.values():
+        values["avg_ms"] = (values["total_seconds"] / values["calls"] * 1000) if values["calls"] else 0.0
+        values["max_ms"] = values["max_seconds"] * 1000
+    return snapshot
+
+def shutdown():
+    """Aguarda as escritas pendentes e encerra as threads do executor."""
+    _writer.shutdown(wait=True)
+    _readers.shutdown(wait=True)
@@ -0,0 +1,122 @@
+# db_pool.py
+import sqlite3
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from constants import DB_NAME, DB_POOL_SIZE, DB_POOL_TIMEOUT_SECONDS, DB_CACHED_STATEMENTS
+
+
+class PoolRow(sqlite3.Row):
+    """sqlite3.Row com suporte a .get(), como os cogs já esperam das configurações."""
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except (IndexError, KeyError):
+            return default
+
+
+class ConnectionPool:
+    """
+    Pool pequeno de conexões SQLite de longa duração.
+
+    As conexões são criadas sob demanda (até `max_size`) e reaproveitadas entre
+    chamadas, evitando o custo de abrir o ficheiro e configurar PRAGMAs em cada
+    função db_*. Podem ser usadas por qualquer thread, mas apenas uma de cada vez.
+    """
+    def __init__(self, db_name: str, max_size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT_SECONDS):
+        self.db_name = db_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _create_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=DB_CACHED_STATEMENTS)
+        conn.row_factory = PoolRow
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("O pool de conexões já foi fechado.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_size:
+                self._created += 1
+                try:
+                    return self._create_connection()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Tempo esgotado ({self.timeout}s) à espera de uma conexão livre do pool.")
+
+    def release(self, conn: sqlite3.Connection):
+        # Garante que nenhuma transação pendente passa para o próximo utilizador.
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_NAME)
+    return _pool
+
+def connection():
+    """Empresta uma conexão do pool global: `with db_pool.connection() as conn: ...`"""
+    return get_pool().connection()
+
+def acquire() -> sqlite3.Connection:
+    return get_pool().acquire()
+
+def release(conn: Optional[sqlite3.Connection]):
+    if conn is not None:
+        get_pool().release(conn)
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
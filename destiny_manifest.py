@@ -0,0 +1,365 @@
+# destiny_manifest.py
+"""
+Cópia local das definições de atividade do manifesto do Destiny 2.
+
+As DestinyActivityDefinition (pt-BR e inglês) são descarregadas da Bungie, ou lidas
+de MANIFEST_LOCAL_DIR, reduzidas às atividades que o bot agenda (raids, masmorras,
+PvP, Gambit, Anoitecer) e guardadas numa base SQLite própria (MANIFEST_DB_NAME).
+A partir dela monta-se em memória um índice de nomes e apelidos, consultado por
+`utils.detect_activity_details`.
+
+Os dicionários de constants.py continuam a ser a base do índice: servem de
+apelidos extra (ex.: "kf", "vog") e são o único conteúdo enquanto a cópia local
+ainda não foi carregada. O carregamento corre em segundo plano, sem atrasar o
+arranque do bot.
+"""
+import asyncio
+import datetime
+import json
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pytz
+
+import bungie_api
+from constants import (
+    MANIFEST_DB_NAME, MANIFEST_LANGUAGES, MANIFEST_LOCAL_DIR,
+    MANIFEST_REFRESH_DAYS, MANIFEST_DOWNLOAD_TIMEOUT_SECONDS,
+    RAID_INFO_PT, MASMORRA_INFO_PT, PVP_ACTIVITY_INFO_PT, SIMILARITY_THRESHOLD
+)
+
+MANIFEST_COMPONENT = "DestinyActivityDefinition"
+
+# DestinyActivityModeType -> tipo de evento do bot (ver EVENT_TYPE_COLORS)
+MODE_TYPE_TO_EVENT_TYPE = {
+    4: "Raid",
+    82: "Dungeon",
+    84: "PvP",        # Desafios de Osíris
+    63: "Gambit",
+    46: "Anoitecer",  # Anoitecer pontuado
+    16: "Anoitecer",
+}
+DEFAULT_SPOTS = {"Raid": 6, "Dungeon": 3, "PvP": 3, "Gambit": 4, "Anoitecer": 3}
+STATIC_ACTIVITIES = ((RAID_INFO_PT, "Raid"), (MASMORRA_INFO_PT, "Dungeon"), (PVP_ACTIVITY_INFO_PT, "PvP"))
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_name(text: str) -> str:
+    """Minúsculas, sem acentos nem pontuação: "Salvation's Edge" -> "salvations edge"."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _SPACES.sub(" ", _NON_WORD.sub("", text)).strip()
+
+
+def _base_name(name: str) -> str:
+    """Tira o sufixo de dificuldade/variante: "Último Desejo: Nível 55" -> "Último Desejo"."""
+    return name.split(":", 1)[0].strip()
+
+
+class ActivityEntry:
+    __slots__ = ("name", "event_type", "spots", "aliases")
+
+    def __init__(self, name: str, event_type: str, spots: int):
+        self.name = name
+        self.event_type = event_type
+        self.spots = spots
+        self.aliases: List[str] = []
+
+    def add_alias(self, alias: str):
+        normalized = normalize_name(alias)
+        if normalized and normalized not in self.aliases:
+            self.aliases.append(normalized)
+
+
+class ActivityIndex:
+    """
+    Índice imutável de atividades. A procura exata é um acesso a dicionário; a
+    aproximada só corre SequenceMatcher sobre os apelidos que passam pelos filtros
+    baratos (real_quick_ratio / quick_ratio), o que a mantém abaixo do milissegundo.
+    """
+    def __init__(self, entries: Iterable[ActivityEntry], source: str, version: Optional[str] = None):
+        self.entries = list(entries)
+        self.source = source
+        self.version = version
+        self._exact: Dict[str, ActivityEntry] = {}
+        self._aliases: List[Tuple[str, ActivityEntry]] = []
+        for entry in self.entries:
+            for alias in entry.aliases:
+                self._exact.setdefault(alias, entry)
+                self._aliases.append((alias, entry))
+
+    @property
+    def alias_count(self) -> int:
+        return len(self._aliases)
+
+    def lookup(self, text: str) -> Tuple[Optional[ActivityEntry], float]:
+        query = normalize_name(text)
+        if not query:
+            return None, 0.0
+        entry = self._exact.get(query)
+        if entry:
+            return entry, 1.0
+        # A consulta fica como seq2, cuja tabela interna o SequenceMatcher calcula uma só vez.
+        matcher = SequenceMatcher(None, b=query)
+        best, best_score = None, 0.0
+        for alias, entry in self._aliases:
+            matcher.set_seq1(alias)
+            floor = max(best_score, SIMILARITY_THRESHOLD)
+            if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+                continue
+            score = matcher.ratio()
+            if score > best_score:
+                best, best_score = entry, score
+        return best, best_score
+
+
+def _static_entries() -> Dict[str, ActivityEntry]:
+    entries: Dict[str, ActivityEntry] = {}
+    for activities, event_type in STATIC_ACTIVITIES:
+        for official, keywords in activities.items():
+            entry = ActivityEntry(official, event_type, DEFAULT_SPOTS[event_type])
+            entry.add_alias(official)
+            for keyword in keywords:
+                entry.add_alias(keyword)
+            entries[normalize_name(official)] = entry
+    return entries
+
+
+def build_index(rows: Iterable[Tuple[Any, ...]], version: Optional[str] = None) -> ActivityIndex:
+    """
+    Junta as linhas da base do manifesto (hash, name_pt, name_en, event_type, max_players)
+    por nome base e acrescenta-as aos apelidos estáticos.
+    """
+    entries = _static_entries()
+    by_alias = {alias: entry for entry in entries.values() for alias in entry.aliases}
+    for _, name_pt, name_en, event_type, max_players in rows:
+        display = _base_name(name_pt or name_en or "")
+        key = normalize_name(display)
+        if not key:
+            continue
+        en_key = normalize_name(_base_name(name_en or ""))
+        entry = entries.get(key) or by_alias.get(key) or by_alias.get(en_key)
+        if entry is None:
+            entry = ActivityEntry(display, event_type, max_players or DEFAULT_SPOTS.get(event_type, 6))
+            entries[key] = entry
+        for name in (display, _base_name(name_en or "")):
+            entry.add_alias(name)
+            by_alias.setdefault(normalize_name(name), entry)
+    return ActivityIndex(entries.values(), "manifesto" if version else "estático", version)
+
+
+def _event_type_for(definition: Dict[str, Any]) -> Optional[str]:
+    event_type = MODE_TYPE_TO_EVENT_TYPE.get(definition.get("directActivityModeType"))
+    if event_type:
+        return event_type
+    for mode in definition.get("activityModeTypes") or ():
+        if mode in MODE_TYPE_TO_EVENT_TYPE:
+            return MODE_TYPE_TO_EVENT_TYPE[mode]
+    return None
+
+
+def _extract_activities(raw: bytes) -> Dict[int, Tuple[str, Optional[str], int]]:
+    """hash -> (nome, tipo de evento, máximo de jogadores) para as atividades agendáveis."""
+    definitions = json.loads(raw)
+    activities = {}
+    for definition in definitions.values():
+        if definition.get("redacted"):
+            continue
+        event_type = _event_type_for(definition)
+        name = (definition.get("displayProperties") or {}).get("name") or ""
+        if not event_type or not name.strip():
+            continue
+        max_players = (definition.get("matchmaking") or {}).get("maxParty") or 0
+        activities[definition["hash"]] = (name.strip(), event_type, max_players)
+    return activities
+
+
+def _merge_languages(by_language: Dict[str, Dict[int, Tuple[str, Optional[str], int]]]) -> List[Tuple[Any, ...]]:
+    pt = by_language.get("pt-br", {})
+    en = by_language.get("en", {})
+    rows = []
+    for activity_hash in set(pt) | set(en):
+        pt_row, en_row = pt.get(activity_hash), en.get(activity_hash)
+        base = pt_row or en_row
+        rows.append((activity_hash, pt_row[0] if pt_row else None, en_row[0] if en_row else None, base[1], base[2]))
+    return rows
+
+
+# --- Base local ---
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA mmap_size = 16777216")
+    return conn
+
+
+def _read_store(path: str = MANIFEST_DB_NAME) -> Optional[Tuple[List[Tuple[Any, ...]], Dict[str, str]]]:
+    if not os.path.exists(path):
+        return None
+    conn = _connect(path)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        rows = conn.execute("SELECT hash, name_pt, name_en, event_type, max_players FROM activities").fetchall()
+        return rows, meta
+    except sqlite3.Error as e:
+        print(f"Erro DB ao ler a cópia local do manifesto: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def _write_store(rows: List[Tuple[Any, ...]], meta: Dict[str, str], path: str = MANIFEST_DB_NAME):
+    """Escreve numa base temporária e troca de uma vez, para nunca deixar uma cópia a meio."""
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = _connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("""
+            CREATE TABLE activities (
+                hash INTEGER PRIMARY KEY,
+                name_pt TEXT,
+                name_en TEXT,
+                event_type TEXT NOT NULL,
+                max_players INTEGER
+            )
+        """)
+        conn.executemany("INSERT INTO activities VALUES (?, ?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+def _touch_store(checked_at: str, path: str = MANIFEST_DB_NAME):
+    conn = _connect(path)
+    try:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('checked_at', ?)", (checked_at,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _local_files() -> Optional[Dict[str, str]]:
+    paths = {lang: os.path.join(MANIFEST_LOCAL_DIR, f"{MANIFEST_COMPONENT}-{lang}.json") for lang in MANIFEST_LANGUAGES}
+    return paths if all(os.path.exists(p) for p in paths.values()) else None
+
+
+def _ingest(contents: Dict[str, bytes], version: str) -> ActivityIndex:
+    """Corre numa thread: interpreta os JSON, grava a base local e monta o índice."""
+    rows = _merge_languages({lang: _extract_activities(raw) for lang, raw in contents.items()})
+    now = datetime.datetime.now(pytz.utc).isoformat()
+    _write_store(rows, {"version": version, "checked_at": now})
+    return build_index(rows, version)
+
+
+# --- Estado do módulo ---
+_index = build_index(())
+_refresh_lock = asyncio.Lock()
+_startup_task: Optional[asyncio.Task] = None
+_lookups = 0
+_lookup_seconds = 0.0
+
+
+def lookup_activity(name: str) -> Optional[Tuple[str, str, int]]:
+    """(nome oficial, tipo, vagas) da atividade mais parecida, ou None abaixo de SIMILARITY_THRESHOLD."""
+    global _lookups, _lookup_seconds
+    started = time.perf_counter()
+    entry, score = _index.lookup(name)
+    _lookups += 1
+    _lookup_seconds += time.perf_counter() - started
+    if entry and score >= SIMILARITY_THRESHOLD:
+        return entry.name, entry.event_type, entry.spots
+    return None
+
+
+def _is_stale(meta: Dict[str, str]) -> bool:
+    try:
+        checked_at = datetime.datetime.fromisoformat(meta["checked_at"])
+    except (KeyError, ValueError):
+        return True
+    return datetime.datetime.now(pytz.utc) - checked_at > datetime.timedelta(days=MANIFEST_REFRESH_DAYS)
+
+
+async def refresh(force: bool = False) -> str:
+    """
+    Atualiza a cópia local a partir de MANIFEST_LOCAL_DIR ou da Bungie. Sem `force`,
+    não descarrega nada se a versão publicada for a que já temos. Devolve um resumo.
+    """
+    global _index
+    async with _refresh_lock:
+        local = _local_files()
+        if local:
+            contents = {}
+            for lang, path in local.items():
+                contents[lang] = await asyncio.to_thread(_read_file, path)
+            version = f"local-{int(max(os.path.getmtime(p) for p in local.values()))}"
+        else:
+            manifest = await bungie_api.get_destiny_manifest()
+            if not manifest:
+                return "API da Bungie indisponível; mantida a cópia atual."
+            version = manifest.get("version") or ""
+            if not force and version and version == _index.version:
+                await asyncio.to_thread(_touch_store, datetime.datetime.now(pytz.utc).isoformat())
+                return f"Manifesto já atualizado (versão {version})."
+            paths = manifest.get("jsonWorldComponentContentPaths") or {}
+            contents = {}
+            for lang in MANIFEST_LANGUAGES:
+                path = (paths.get(lang) or {}).get(MANIFEST_COMPONENT)
+                content = await bungie_api.download_manifest_content(path, MANIFEST_DOWNLOAD_TIMEOUT_SECONDS) if path else None
+                if content is None:
+                    return f"Falha ao descarregar o manifesto ({lang}); mantida a cópia atual."
+                contents[lang] = content
+
+        try:
+            _index = await asyncio.to_thread(_ingest, contents, version)
+        except (ValueError, KeyError, sqlite3.Error, OSError) as e:
+            print(f"MANIFEST_ERROR: Falha ao processar o manifesto: {e}")
+            return "Falha ao processar o manifesto; mantida a cópia atual."
+        print(f"DEBUG: Manifesto {version} carregado: {len(_index.entries)} atividades, {_index.alias_count} nomes.")
+        return f"Manifesto atualizado para a versão {version}: {len(_index.entries)} atividades."
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def _load_in_background():
+    global _index
+    try:
+        stored = await asyncio.to_thread(_read_store)
+        if stored:
+            rows, meta = stored
+            _index = await asyncio.to_thread(build_index, rows, meta.get("version") or "desconhecida")
+            print(f"DEBUG: Cópia local do manifesto carregada ({len(_index.entries)} atividades).")
+        if not stored or _is_stale(stored[1]):
+            await refresh()
+    except Exception as e:
+        print(f"MANIFEST_ERROR: Falha ao carregar o manifesto: {e}")
+
+
+def start():
+    """Agenda o carregamento; até terminar, a deteção usa apenas os dicionários estáticos."""
+    global _startup_task
+    if _startup_task is None or _startup_task.done():
+        _startup_task = asyncio.get_running_loop().create_task(_load_in_background(), name="destiny-manifest")
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        "source": _index.source,
+        "version": _index.version,
+        "activities": len(_index.entries),
+        "aliases": _index.alias_count,
+        "lookups": _lookups,
+        "avg_lookup_us": (_lookup_seconds / _lookups * 1e6) if _lookups else 0.0,
+    }
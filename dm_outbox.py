@@ -0,0 +1,161 @@
+# dm_outbox.py
+"""
+Fila persistente de DMs (lembretes, avisos de cancelamento, avisos de inatividade).
+
+Quem quer avisar alguém chama `enqueue`, que grava as mensagens em dm_outbox e
+volta logo; um despachante lê as linhas pendentes por prioridade e vários
+trabalhadores enviam-nas, ao ritmo de um PriorityRateLimiter em vez de pausas
+fixas entre DMs. Assim os lembretes de um evento não ficam atrás dos do anterior.
+
+Cada mensagem tem uma chave de deduplicação (por omissão: tipo, evento e
+utilizador), por isso repetir o `enqueue` depois de um reinício não gera DMs em
+duplicado. Uma linha só é marcada 'enviando' imediatamente antes do send: se o
+bot parar a meio desse envio, fica 'incerto' e não é reenviada; as que ainda
+esperavam vez continuam 'pendente' e saem no próximo arranque.
+"""
+import asyncio
+import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+import discord
+import pytz
+from discord.ext import commands
+
+import db_async as adb
+from rate_limit import PriorityRateLimiter, PRIORITY_NORMAL
+from constants import (
+    DM_OUTBOX_WORKERS, DM_OUTBOX_RATE, DM_OUTBOX_BATCH_SIZE, DM_OUTBOX_POLL_SECONDS
+)
+
+# Recebe (linha da fila, bot) e devolve a View a anexar à DM.
+ViewFactory = Callable[[Any, commands.Bot], discord.ui.View]
+
+
+def dedupe_key(kind: str, user_id: int, event_id: Optional[int] = None, scope: Optional[str] = None) -> str:
+    return f"{kind}:{event_id if event_id is not None else '-'}:{user_id}" + (f":{scope}" if scope else "")
+
+
+class DMOutbox:
+    def __init__(self, bot: commands.Bot, workers: int = DM_OUTBOX_WORKERS):
+        self.bot = bot
+        self.workers = workers
+        self.limiter = PriorityRateLimiter({"default": DM_OUTBOX_RATE})
+        self._views: Dict[str, ViewFactory] = {}
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(workers)
+        self._tasks: Set[asyncio.Task] = set()
+        self._in_flight: Set[int] = set()  # outbox_id entregues a um trabalhador e ainda por fechar
+        self._runner: Optional[asyncio.Task] = None
+        self._stats = {"queued": 0, "duplicates": 0, "sent": 0, "blocked": 0, "failed": 0, "skipped": 0, "total_latency": 0.0, "max_latency": 0.0}
+
+    def register_view(self, kind: str, factory: ViewFactory):
+        """Associa uma View (ex.: botões de confirmação) às DMs de um tipo."""
+        self._views[kind] = factory
+
+    async def start(self):
+        if self._runner and not self._runner.done():
+            return
+        uncertain = await adb.db_recover_dm_outbox()
+        if uncertain:
+            print(f"AVISO: {uncertain} DM(s) interrompidas no último encerramento ficaram como 'incerto' e não serão reenviadas.")
+        self._runner = asyncio.create_task(self._run(), name="dm-outbox")
+
+    async def stop(self):
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        # Quem ainda espera pelo limitador desiste (a linha continua 'pendente'); os envios já iniciados terminam.
+        self.limiter.close()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def enqueue(self, user_ids: Iterable[int], kind: str, content: str, event_id: Optional[int] = None,
+                      priority: int = PRIORITY_NORMAL, scope: Optional[str] = None) -> int:
+        """
+        Põe na fila a mesma mensagem para cada utilizador. `scope` entra na chave de
+        deduplicação quando o mesmo aviso pode repetir-se (ex.: um por dia).
+        Devolve quantas DMs novas entraram na fila.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        messages = [(dedupe_key(kind, user_id, event_id, scope), user_id, event_id, kind, content, priority) for user_id in user_ids]
+        queued = await adb.db_enqueue_dms(messages)
+        self._stats["queued"] += queued
+        self._stats["duplicates"] += len(messages) - queued
+        if queued:
+            self._wakeup.set()
+        return queued
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            # As linhas só deixam de ser 'pendente' no envio: salta as que já estão com um trabalhador.
+            rows = await adb.db_get_pending_dms(DM_OUTBOX_BATCH_SIZE + len(self._in_flight))
+            rows = [row for row in rows if row['outbox_id'] not in self._in_flight][:DM_OUTBOX_BATCH_SIZE]
+            if not rows:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), DM_OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for row in rows:
+                await self._slots.acquire()
+                self._in_flight.add(row['outbox_id'])
+                task = asyncio.create_task(self._deliver(row))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, row):
+        try:
+            await self._deliver_row(row)
+        finally:
+            self._in_flight.discard(row['outbox_id'])
+
+    async def _deliver_row(self, row):
+        status, error = 'enviado', None
+        try:
+            await self.limiter.acquire(priority=row['priority'])
+            user = await self.bot.profile_cache.fetch_user(row['user_id'])
+            if user.bot:
+                status = 'ignorado'
+            else:
+                factory = self._views.get(row['kind'])
+                view = factory(row, self.bot) if factory else None
+                if not await adb.db_mark_dm_sending(row['outbox_id']):
+                    return
+                message = await user.send(row['content'], view=view) if view else await user.send(row['content'])
+                if view is not None and hasattr(view, 'message'):
+                    view.message = message
+        except discord.Forbidden:
+            status = 'bloqueado'  # DMs fechadas ou sem servidor em comum
+        except discord.NotFound:
+            status, error = 'ignorado', "Utilizador não encontrado."
+        except Exception as e:
+            status, error = 'falhou', str(e)[:500]
+            print(f"AVISO: Falha ao enviar DM '{row['kind']}' para {row['user_id']}: {e}")
+        finally:
+            self._slots.release()
+        self._record(row, status)
+        await adb.db_finish_dm(row['outbox_id'], status, error)
+
+    def _record(self, row, status: str):
+        key = {"enviado": "sent", "bloqueado": "blocked", "falhou": "failed", "ignorado": "skipped"}[status]
+        self._stats[key] += 1
+        if status == 'enviado':
+            created_at = datetime.datetime.fromisoformat(row['created_at_utc'])
+            latency = (datetime.datetime.now(pytz.utc) - created_at).total_seconds()
+            self._stats["total_latency"] += latency
+            self._stats["max_latency"] = max(self._stats["max_latency"], latency)
+
+    def get_stats(self) -> Dict[str, float]:
+        sent = self._stats["sent"]
+        return {
+            "queued": self._stats["queued"],
+            "duplicates": self._stats["duplicates"],
+            "sent": sent,
+            "blocked": self._stats["blocked"],
+            "failed": self._stats["failed"],
+            "skipped": self._stats["skipped"],
+            "in_flight": len(self._tasks),
+            "avg_latency_s": (self._stats["total_latency"] / sent) if sent else 0.0,
+            "max_latency_s": self._stats["max_latency"],
+        }
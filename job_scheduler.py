@@ -0,0 +1,200 @@
+# job_scheduler.py
+"""
+Agendador por prazo para as tarefas de cada evento (lembretes, canais de voz,
+presença, exclusão da mensagem).
+
+As tarefas ficam em scheduled_jobs (ver database._plan_event_jobs) e, em memória,
+num heap ordenado pela hora. O laço dorme exatamente até ao prazo mais próximo e
+acorda mais cedo quando o database avisa que as tarefas de um evento mudaram.
+Cada tarefa corre na sua própria asyncio.Task, de forma que uma tarefa lenta
+(ex.: DMs para 12 pessoas) não atrasa as seguintes.
+
+Entradas antigas no heap não são removidas: `_queued` guarda o prazo válido de
+cada tarefa e o que não coincidir é descartado ao sair do heap.
+"""
+import asyncio
+import datetime
+import heapq
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import pytz
+
+import database
+import db_async as adb
+from constants import EVENT_JOB_GRACE_MINUTES, SCHEDULER_RESYNC_MINUTES
+
+# Recebe a linha do evento; devolve None quando terminou ou N segundos para tentar de novo.
+JobHandler = Callable[[dict], Awaitable[Optional[float]]]
+
+
+def _parse_due(due_at_utc: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(due_at_utc)
+
+
+class JobScheduler:
+    def __init__(self, handlers: Dict[str, JobHandler], resync_minutes: float = SCHEDULER_RESYNC_MINUTES):
+        self.handlers = handlers
+        self.resync_seconds = resync_minutes * 60
+        self._heap: List[Tuple[datetime.datetime, int]] = []
+        self._queued: Dict[int, Tuple[datetime.datetime, int, str, str]] = {}  # job_id -> (prazo, event_id, kind, due_at_utc)
+        self._running: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._last_resync = 0.0
+        self._stats = {"executed": 0, "expired": 0, "failed": 0, "retried": 0, "started": 0, "total_delay": 0.0, "max_delay": 0.0}
+
+    async def start(self):
+        """Carrega as tarefas pendentes (incluindo as que venceram com o bot desligado) e começa o laço."""
+        if self._runner and not self._runner.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        database.add_scheduled_jobs_listener(self._on_jobs_changed)
+        await self._resync()
+        self._runner = self._loop.create_task(self._run(), name="event-job-scheduler")
+        print(f"DEBUG: Agendador de eventos iniciado com {len(self._queued)} tarefas pendentes.")
+
+    async def stop(self):
+        database.remove_scheduled_jobs_listener(self._on_jobs_changed)
+        if self._runner:
+            self._runner.cancel()
+        # Tarefas interrompidas continuam 'pendente' no banco e voltam a correr no próximo arranque.
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._runner = None
+
+    # --- Sincronização com o banco ---
+    def _on_jobs_changed(self, event_id: int):
+        """Chamado na thread do escritor do banco."""
+        loop = self._loop
+        if loop and not loop.is_closed():
+            loop.call_soon_threadsafe(self._spawn, self._reload_event(event_id))
+
+    def _spawn(self, coro: Awaitable) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _push(self, job_id: int, event_id: int, kind: str, due_at_utc: str):
+        if job_id in self._running:
+            return
+        due = _parse_due(due_at_utc)
+        queued = self._queued.get(job_id)
+        if queued and queued[0] == due:
+            return
+        self._queued[job_id] = (due, event_id, kind, due_at_utc)
+        heapq.heappush(self._heap, (due, job_id))
+
+    async def _reload_event(self, event_id: int):
+        rows = await adb.db_get_scheduled_jobs_for_event(event_id)
+        pending = {row['job_id'] for row in rows}
+        for job_id in [j for j, (_, ev, _, _) in self._queued.items() if ev == event_id and j not in pending]:
+            del self._queued[job_id]
+        for row in rows:
+            self._push(row['job_id'], row['event_id'], row['kind'], row['due_at_utc'])
+        self._wakeup.set()
+
+    async def _resync(self):
+        rows = await adb.db_get_pending_scheduled_jobs()
+        self._queued = {
+            row['job_id']: (_parse_due(row['due_at_utc']), row['event_id'], row['kind'], row['due_at_utc'])
+            for row in rows if row['job_id'] not in self._running
+        }
+        self._heap = [(due, job_id) for job_id, (due, _, _, _) in self._queued.items()]
+        heapq.heapify(self._heap)
+        self._last_resync = asyncio.get_running_loop().time()
+
+    # --- Laço principal ---
+    def _drop_stale(self):
+        while self._heap:
+            due, job_id = self._heap[0]
+            queued = self._queued.get(job_id)
+            if queued and queued[0] == due:
+                return
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            resync_in = self.resync_seconds - (loop.time() - self._last_resync)
+            if resync_in <= 0:
+                await self._resync()
+                continue
+            self._drop_stale()
+            now = datetime.datetime.now(pytz.utc)
+            # Só sai do heap o que já venceu; de resto dorme até ao próximo prazo ou à releitura.
+            if not self._heap or self._heap[0][0] > now:
+                timeout = min(resync_in, (self._heap[0][0] - now).total_seconds()) if self._heap else resync_in
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            due, job_id = heapq.heappop(self._heap)
+            _, event_id, kind, due_at_utc = self._queued.pop(job_id)
+            self._running.add(job_id)
+            self._spawn(self._execute(job_id, event_id, kind, due, due_at_utc))
+
+    async def _execute(self, job_id: int, event_id: int, kind: str, due: datetime.datetime, due_at_utc: str):
+        # As escritas levam `due_at_utc`: se o evento for replanejado enquanto a tarefa corre,
+        # a nova ocorrência não é fechada nem adiada por esta execução.
+        status = 'feito'
+        try:
+            delay = (datetime.datetime.now(pytz.utc) - due).total_seconds()
+            grace = EVENT_JOB_GRACE_MINUTES.get(kind)
+            handler = self.handlers.get(kind)
+            if handler is None:
+                print(f"AVISO: Tarefa agendada {job_id} com tipo desconhecido '{kind}'.")
+                status = 'falhou'
+            elif grace is not None and delay > grace * 60:
+                status = 'expirado'
+            else:
+                self._stats["started"] += 1
+                self._stats["total_delay"] += max(0.0, delay)
+                self._stats["max_delay"] = max(self._stats["max_delay"], delay)
+                event = await adb.db_get_event_details(event_id)
+                retry_seconds = await handler(event) if event else None
+                if retry_seconds:
+                    new_due_at_utc = (datetime.datetime.now(pytz.utc) + datetime.timedelta(seconds=retry_seconds)).isoformat()
+                    rescheduled = await adb.db_reschedule_job(job_id, due_at_utc, new_due_at_utc)
+                    self._running.discard(job_id)
+                    if rescheduled:
+                        self._push(job_id, event_id, kind, new_due_at_utc)
+                        self._wakeup.set()
+                        self._stats["retried"] += 1
+                    else:
+                        await self._reload_event(event_id)
+                    return
+        except asyncio.CancelledError:
+            self._running.discard(job_id)
+            raise
+        except Exception as e:
+            print(f"ERRO_AGENDADOR: Falha na tarefa '{kind}' do evento {event_id}: {e}")
+            status = 'falhou'
+        self._stats[{"feito": "executed", "expirado": "expired", "falhou": "failed"}[status]] += 1
+        try:
+            finished = await adb.db_finish_scheduled_job(job_id, due_at_utc, status)
+        finally:
+            self._running.discard(job_id)
+        if not finished:
+            # Replanejada enquanto corria: o _push foi ignorado nessa altura, por isso recarrega agora.
+            await self._reload_event(event_id)
+
+    def get_stats(self) -> Dict[str, float]:
+        started = self._stats["started"]
+        next_due = self._heap[0][0] if self._heap else None
+        return {
+            "pending": len(self._queued),
+            "running": len(self._running),
+            "executed": self._stats["executed"],
+            "expired": self._stats["expired"],
+            "failed": self._stats["failed"],
+            "retried": self._stats["retried"],
+            "avg_delay_ms": (self._stats["total_delay"] / started * 1000) if started else 0.0,
+            "max_delay_ms": self._stats["max_delay"] * 1000,
+            "next_due_in_seconds": max(0.0, (next_due - datetime.datetime.now(pytz.utc)).total_seconds()) if next_due else None,
+        }
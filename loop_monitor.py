@@ -0,0 +1,55 @@
+# loop_monitor.py
+import asyncio
+import collections
+from typing import Deque, Dict, Optional
+
+from constants import LOOP_LAG_SAMPLE_INTERVAL_SECONDS, LOOP_LAG_WARN_THRESHOLD_SECONDS
+
+
+class LoopLagMonitor:
+    """
+    Mede o atraso do event loop: agenda um sleep curto e compara quanto tempo
+    passou de facto. Qualquer atraso acima do intervalo é tempo em que o loop
+    esteve bloqueado (ex.: uma consulta síncrona ao SQLite).
+    """
+    def __init__(self, interval: float = LOOP_LAG_SAMPLE_INTERVAL_SECONDS,
+                 warn_threshold: float = LOOP_LAG_WARN_THRESHOLD_SECONDS, window: int = 600):
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._samples: Deque[float] = collections.deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="loop-lag-monitor")
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.warn_threshold:
+                self.stalls += 1
+                print(f"AVISO_LOOP: Event loop bloqueado por {lag * 1000:.0f} ms.")
+
+    def get_stats(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"last_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "stalls": self.stalls}
+        return {
+            "last_ms": self._samples[-1] * 1000,
+            "p50_ms": samples[len(samples) // 2] * 1000,
+            "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+            "max_ms": self.max_lag * 1000,
+            "stalls": self.stalls,
+        }
@@ -4,6 +4,7 @@ from discord.ext import commands
 import os
 from dotenv import load_dotenv
 import sys
+import asyncio
 import traceback
 import datetime
 
@@ -15,6 +16,14 @@ GUILD_ID = int(GUILD_ID_STR) if GUILD_ID_STR and GUILD_ID_STR.isdigit() else Non
 
 # --- Importações de Módulos do Projeto ---
 import database as db
+import db_pool
+import db_async
+import bungie_api
+import destiny_manifest
+from dm_outbox import DMOutbox
+from render_coalescer import RenderCoalescer
+from profile_cache import ProfileCache
+from loop_monitor import LoopLagMonitor
 from constants import DB_NAME
 from cogs.event_cog import PersistentRsvpView
 
@@ -31,6 +40,10 @@ class ColaAIBot(commands.Bot):
         super().__init__(command_prefix="!", intents=intents)
 
         self.persistent_views_added = False
+        self.loop_lag = LoopLagMonitor()
+        self.dm_outbox = DMOutbox(self)
+        self.render_coalescer = RenderCoalescer()
+        self.profile_cache = ProfileCache(self)
         self.initial_cogs = [
             'cogs.admin_cog',
             'cogs.event_cog',
@@ -43,6 +56,10 @@ class ColaAIBot(commands.Bot):
     async def setup_hook(self):
         db.init_db()
         print(f"DEBUG: Banco de dados '{DB_NAME}' inicializado/verificado.")
+        self.loop_lag.start()
+        await bungie_api.start_client()
+        destiny_manifest.start()
+        await self.dm_outbox.start()
 
         for cog in self.initial_cogs:
             try:
@@ -60,6 +77,14 @@ class ColaAIBot(commands.Bot):
         else:
             print("AVISO: GUILD_ID não definido no .env. Comandos podem levar tempo para aparecer globalmente.")
 
+    async def close(self):
+        await super().close()
+        self.loop_lag.stop()
+        await self.dm_outbox.stop()
+        await bungie_api.close_client()
+        await asyncio.to_thread(db_async.shutdown)
+        db_pool.close_pool()
+
     async def on_ready(self):
         if not self.persistent_views_added:
             self.add_view(PersistentRsvpView(self))
@@ -0,0 +1,190 @@
+# pgcr_verifier.py
+"""
+Verificação de presença pelos relatórios pós-jogo (PGCR) da Bungie.
+
+A tarefa de presença decide 'compareceu'/'ausente' por quem está no canal de voz
+naquele instante; quem jogou com o microfone noutro canal fica 'ausente'. Horas
+depois do evento, este módulo lê o histórico de atividades de alguns confirmados
+("âncoras"), abre os PGCRs das atividades dentro da janela do evento e, quando
+um deles tem a equipa do evento, passa os ausentes que lá aparecem a 'compareceu'.
+
+Os PGCRs são imutáveis, por isso ficam em PGCR_CACHE_DIR para sempre: âncoras
+diferentes, e eventos diferentes da mesma noite, reutilizam os mesmos ficheiros.
+"""
+import asyncio
+import datetime
+import gzip
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import bungie_api
+from rate_limit import PRIORITY_BACKGROUND
+from constants import (
+    PGCR_CACHE_DIR, PGCR_WINDOW_BEFORE_MINUTES, PGCR_WINDOW_AFTER_HOURS,
+    PGCR_HISTORY_COUNT, PGCR_MAX_ANCHORS, PGCR_MAX_REQUESTS_PER_EVENT, PGCR_MIN_FIRETEAM_MATCH
+)
+
+# Tipo de evento do bot -> DestinyActivityModeType usado para filtrar o histórico
+EVENT_TYPE_TO_MODE = {
+    "Raid": 4,
+    "Dungeon": 82,
+    "PvP": 5,
+    "Gambit": 63,
+    "Anoitecer": 46,
+}
+
+
+class PGCRCache:
+    """Um ficheiro .json.gz por PGCR, repartido por subpastas para não encher um único diretório."""
+    def __init__(self, directory: str = PGCR_CACHE_DIR):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, instance_id: str) -> str:
+        return os.path.join(self.directory, instance_id[-2:], f"{instance_id}.json.gz")
+
+    def _read(self, instance_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(instance_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"AVISO: PGCR {instance_id} corrompido no cache, será descarregado de novo: {e}")
+            return None
+
+    def _write(self, instance_id: str, report: Dict[str, Any]):
+        path = self._path(instance_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(report, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    async def get(self, instance_id: str, counter: "RequestBudget") -> Optional[Dict[str, Any]]:
+        report = await asyncio.to_thread(self._read, instance_id)
+        if report is not None:
+            self.hits += 1
+            return report
+        if not counter.take():
+            return None
+        self.misses += 1
+        report = await bungie_api.get_post_game_carnage_report(instance_id, PRIORITY_BACKGROUND)
+        if report:
+            try:
+                await asyncio.to_thread(self._write, instance_id, report)
+            except OSError as e:
+                print(f"AVISO: Falha ao guardar PGCR {instance_id} no cache: {e}")
+        return report
+
+
+class RequestBudget:
+    """Limite de pedidos à Bungie por evento."""
+    def __init__(self, limit: int = PGCR_MAX_REQUESTS_PER_EVENT):
+        self.limit = limit
+        self.used = 0
+
+    def take(self, count: int = 1) -> bool:
+        if self.used + count > self.limit:
+            return False
+        self.used += count
+        return True
+
+
+cache = PGCRCache()
+
+
+def _parse_period(period: str) -> Optional[datetime.datetime]:
+    try:
+        return datetime.datetime.fromisoformat(period.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return None
+
+
+def instances_in_window(activities: Iterable[Dict[str, Any]], start: datetime.datetime, end: datetime.datetime) -> List[str]:
+    """IDs das atividades do histórico iniciadas entre `start` e `end`."""
+    instance_ids = []
+    for activity in activities:
+        started_at = _parse_period(activity.get('period'))
+        instance_id = activity.get('activityDetails', {}).get('instanceId')
+        if started_at and instance_id and start <= started_at <= end:
+            instance_ids.append(str(instance_id))
+    return instance_ids
+
+
+def pgcr_players(report: Dict[str, Any]) -> Set[str]:
+    return {
+        str(entry['player']['destinyUserInfo']['membershipId'])
+        for entry in report.get('entries', [])
+        if entry.get('player', {}).get('destinyUserInfo', {}).get('membershipId')
+    }
+
+
+def match_attendance(reports: Iterable[Dict[str, Any]], confirmed: Dict[str, int], absent: Set[int]) -> Set[int]:
+    """
+    Discord IDs dos ausentes que aparecem num PGCR "do evento", isto é, com pelo menos
+    PGCR_MIN_FIRETEAM_MATCH confirmados (ou todos, se forem menos). `confirmed` mapeia
+    membershipId Destiny -> discord_id.
+    """
+    required = min(PGCR_MIN_FIRETEAM_MATCH, len(confirmed))
+    attended: Set[int] = set()
+    for report in reports:
+        players = pgcr_players(report)
+        fireteam = [confirmed[membership_id] for membership_id in players if membership_id in confirmed]
+        if len(fireteam) >= required:
+            attended.update(user_id for user_id in fireteam if user_id in absent)
+    return attended
+
+
+async def _anchor_instances(membership_type: int, membership_id: str, mode: Optional[int],
+                            start: datetime.datetime, end: datetime.datetime, budget: RequestBudget) -> List[str]:
+    if not budget.take():
+        return []
+    character_ids = await bungie_api.get_character_ids(membership_type, membership_id, PRIORITY_BACKGROUND)
+    character_ids = [c for c in character_ids if budget.take()]
+    histories = await asyncio.gather(*(
+        bungie_api.get_activity_history(membership_type, membership_id, character_id, mode, PGCR_HISTORY_COUNT, PRIORITY_BACKGROUND)
+        for character_id in character_ids
+    ))
+    return [instance_id for history in histories if history for instance_id in instances_in_window(history, start, end)]
+
+
+async def verify_event(event: Dict[str, Any], attendance: List[Dict[str, Any]]) -> Set[int]:
+    """
+    Devolve os discord_id dos confirmados marcados 'ausente' que os PGCRs mostram ter
+    jogado a atividade do evento. Só considera quem tem perfil Bungie vinculado.
+    """
+    linked = [row for row in attendance if row['bungie_membership_id']]
+    confirmed = {str(row['bungie_membership_id']): row['user_id'] for row in linked}
+    absent = {row['user_id'] for row in linked if row['attendance_status'] == 'ausente'}
+    if not absent:
+        return set()
+
+    event_time = datetime.datetime.fromisoformat(event['event_time_utc'])
+    start = event_time - datetime.timedelta(minutes=PGCR_WINDOW_BEFORE_MINUTES)
+    end = event_time + datetime.timedelta(hours=PGCR_WINDOW_AFTER_HOURS)
+    mode = EVENT_TYPE_TO_MODE.get(event['activity_type'])
+
+    # Quem esteve na voz quase de certeza jogou; o histórico dele é o que mais cobre.
+    anchors = sorted(linked, key=lambda row: row['attendance_status'] != 'compareceu')[:PGCR_MAX_ANCHORS]
+    budget = RequestBudget()
+    attended: Set[int] = set()
+    seen_instances: Set[str] = set()
+    for anchor in anchors:
+        if attended >= absent or not bungie_api.is_available():
+            break
+        instance_ids = await _anchor_instances(
+            anchor['bungie_membership_type'], str(anchor['bungie_membership_id']), mode, start, end, budget
+        )
+        new_ids = [i for i in dict.fromkeys(instance_ids) if i not in seen_instances]
+        seen_instances.update(new_ids)
+        reports = await asyncio.gather(*(cache.get(instance_id, budget) for instance_id in new_ids))
+        attended |= match_attendance([r for r in reports if r], confirmed, absent)
+    return attended
+
+
+def get_stats() -> Dict[str, int]:
+    return {"hits": cache.hits, "misses": cache.misses}
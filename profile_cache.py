@@ -0,0 +1,99 @@
+# profile_cache.py
+"""
+Cache de perfis de utilizador (nome, nome global, avatar) usado ao montar embeds
+e ao enviar notificações.
+
+Montar o embed de um evento fazia `bot.fetch_user(creator_id)`, um pedido REST por
+render. Os perfis vêm agora, por esta ordem, do cache, do cache de membros do
+gateway (`bot.get_user`) e, só em último caso, de `fetch_user`, com um único
+pedido em voo por utilizador. O cache é semeado com os membros das guilds no
+arranque e atualizado pelos eventos on_user_update/on_member_update
+(ver cogs/listeners_cog.py).
+"""
+import itertools
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import discord
+from discord.ext import commands
+
+from caching import AsyncTTLCache
+from constants import PROFILE_CACHE_TTL_SECONDS, PROFILE_CACHE_MAX_ENTRIES
+
+
+class Profile(NamedTuple):
+    user_id: int
+    name: str
+    global_name: Optional[str]
+    avatar_url: Optional[str]
+    is_bot: bool
+
+    @property
+    def display_name(self) -> str:
+        return self.global_name or self.name
+
+
+def profile_from_user(user: discord.abc.User) -> Profile:
+    # Para um Member, name/global_name/avatar são os do utilizador (sem apelido nem avatar da guild).
+    return Profile(user.id, user.name, getattr(user, 'global_name', None), user.avatar.url if user.avatar else None, user.bot)
+
+
+class ProfileCache:
+    def __init__(self, bot: commands.Bot, ttl: float = PROFILE_CACHE_TTL_SECONDS, max_entries: int = PROFILE_CACHE_MAX_ENTRIES):
+        self.bot = bot
+        self._cache = AsyncTTLCache(ttl, max_entries)
+        self.lookups = 0
+        self.from_gateway = 0
+        self.rest_fetches = 0
+        self.seeded = 0
+
+    def remember(self, user: discord.abc.User):
+        self._cache.set(user.id, profile_from_user(user))
+
+    def seed(self, members: Iterable[discord.abc.User]):
+        """Preenche o cache a partir do gateway, até à capacidade (sem provocar despejos em massa)."""
+        room = max(0, self._cache.max_entries - self._cache.get_stats()["entries"])
+        for member in itertools.islice(members, room):
+            if self._cache.peek(member.id) is None:
+                self.remember(member)
+                self.seeded += 1
+
+    async def get(self, user_id: int) -> Optional[Profile]:
+        """Perfil do utilizador, ou None se ele não existir. Pode levantar discord.HTTPException."""
+        self.lookups += 1
+        return await self._cache.get_or_load(user_id, lambda: self._load(user_id))
+
+    async def _load(self, user_id: int) -> Optional[Profile]:
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self.from_gateway += 1
+            return profile_from_user(user)
+        self.rest_fetches += 1
+        try:
+            return profile_from_user(await self.bot.fetch_user(user_id))
+        except discord.NotFound:
+            return None  # Também fica no cache, para não repetir o pedido até ao fim do TTL.
+
+    async def fetch_user(self, user_id: int) -> discord.User:
+        """Objeto User (para enviar DMs): gateway primeiro; o fetch_user também alimenta o cache."""
+        self.lookups += 1
+        user = self.bot.get_user(user_id)
+        if user is not None:
+            self.from_gateway += 1
+            return user
+        self.rest_fetches += 1
+        user = await self.bot.fetch_user(user_id)
+        self.remember(user)
+        return user
+
+    def get_stats(self) -> Dict[str, float]:
+        st = self._cache.get_stats()
+        cache_lookups = st["hits"] + st["misses"] + st["joins"]
+        return {
+            "entries": st["entries"],
+            "lookups": self.lookups,
+            "hit_rate": (st["hits"] + st["joins"]) / cache_lookups if cache_lookups else 0.0,
+            "from_gateway": self.from_gateway,
+            "rest_fetches": self.rest_fetches,
+            "rest_avoided": self.lookups - self.rest_fetches,
+            "seeded": self.seeded,
+        }
@@ -0,0 +1,157 @@
+# purge_pipeline.py
+"""
+Limpeza de membros inativos em duas etapas concorrentes:
+
+    itens da limpeza -> [etapa Bungie: expulsar do clã] -> [etapa Discord: DM + expulsar do servidor]
+
+Cada etapa tem os seus próprios trabalhadores e o seu próprio limite de ritmo, de
+forma que as expulsões na Bungie e no Discord avançam em paralelo. O estado de
+cada membro fica em purge_job_items, por isso uma limpeza interrompida por um
+reinício continua de onde parou na execução seguinte.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+
+import bungie_api
+import db_async as adb
+from rate_limit import PriorityRateLimiter, PRIORITY_BACKGROUND
+from constants import (
+    PURGE_BUNGIE_CONCURRENCY, PURGE_BUNGIE_RATE,
+    PURGE_DISCORD_CONCURRENCY, PURGE_DISCORD_RATE
+)
+
+FINAL_STATUSES = ("ok", "falhou", "ignorado")
+
+
+async def _bungie_stage(items: List[Dict[str, Any]], clan_admins: Dict[str, int], membership_index: Optional[Dict[str, str]],
+                        limiter: PriorityRateLimiter, discord_queue: asyncio.Queue, report: Dict[str, Any]):
+    while items:
+        item = items.pop()
+        if item['bungie_status'] not in FINAL_STATUSES:
+            bnet_id = item['bungie_membership_id']
+            if not clan_admins or not bnet_id:
+                item['bungie_status'] = 'ignorado'
+            elif membership_index is None or not bungie_api.is_available():
+                # Fica pendente (e sem expulsão do Discord) até a Bungie voltar.
+                report['postponed'] += 1
+                continue
+            elif bnet_id not in membership_index:
+                item['bungie_status'] = 'ignorado'
+            else:
+                clan_id = membership_index[bnet_id]
+                await limiter.acquire(priority=PRIORITY_BACKGROUND)
+                kicked = await bungie_api.kick_clan_member(
+                    admin_discord_id=clan_admins[clan_id],
+                    member_to_kick_bnet_id=bnet_id,
+                    member_to_kick_membership_type=item['bungie_membership_type'],
+                    priority=PRIORITY_BACKGROUND,
+                    clan_id=clan_id
+                )
+                item['bungie_status'] = 'ok' if kicked else 'falhou'
+                if not kicked:
+                    item['error'] = "Falha ao remover do clã na Bungie.net."
+            await adb.db_update_purge_job_item(item['job_id'], item['user_id'], bungie_status=item['bungie_status'], error=item['error'])
+        await discord_queue.put(item)
+
+
+async def _discord_stage(guild: discord.Guild, dm_message: str, kick_reason: str,
+                         limiter: PriorityRateLimiter, discord_queue: asyncio.Queue):
+    while True:
+        item = await discord_queue.get()
+        if item is None:
+            return
+        if item['discord_status'] in FINAL_STATUSES:
+            continue
+        member = guild.get_member(item['user_id'])
+        if not member:
+            item['discord_status'] = 'ignorado'
+        else:
+            await limiter.acquire(priority=PRIORITY_BACKGROUND)
+            try:
+                await member.send(dm_message)
+            except discord.Forbidden:
+                pass
+            except Exception as e:
+                print(f"INACTIVITY_LOG: Erro ao enviar DM para membro inativo {member.id}: {e}")
+            try:
+                reason = kick_reason + (" Removido também do clã Bungie." if item['bungie_status'] == 'ok' else "")
+                await member.kick(reason=reason)
+                item['discord_status'] = 'ok'
+            except Exception as e:
+                item['discord_status'] = 'falhou'
+                item['error'] = f"Discord: {e}"
+        await adb.db_update_purge_job_item(item['job_id'], item['user_id'], discord_status=item['discord_status'], error=item['error'])
+
+
+async def run_purge_job(guild: discord.Guild, job_id: int, clans: List[Tuple[str, int]],
+                        dm_message: str, kick_reason: str, resumed: bool = False) -> Dict[str, Any]:
+    """Executa (ou retoma) a limpeza `job_id` e devolve um relatório consolidado."""
+    items = [dict(row) for row in await adb.db_get_purge_job_items(job_id)]
+    report: Dict[str, Any] = {"job_id": job_id, "resumed": resumed, "total": len(items), "postponed": 0}
+
+    # `clans` são os (clan_id, admin_discord_id) da guild. None = listas dos clãs
+    # indisponíveis; os itens que dependem delas ficam adiados.
+    clan_admins = dict(clans)
+    membership_index: Optional[Dict[str, str]] = None
+    if clans and bungie_api.is_available() and any(i['bungie_status'] not in FINAL_STATUSES for i in items):
+        rosters = await bungie_api.get_clan_rosters(clans, priority=PRIORITY_BACKGROUND)
+        if all(roster is not None for roster in rosters.values()):
+            membership_index = bungie_api.build_membership_index(rosters)
+
+    bungie_limiter = PriorityRateLimiter({"default": PURGE_BUNGIE_RATE})
+    discord_limiter = PriorityRateLimiter({"default": PURGE_DISCORD_RATE})
+    discord_queue: asyncio.Queue = asyncio.Queue()
+    pending = list(reversed(items))  # pop() do fim mantém a ordem original
+    discord_workers = [
+        asyncio.create_task(_discord_stage(guild, dm_message, kick_reason, discord_limiter, discord_queue))
+        for _ in range(PURGE_DISCORD_CONCURRENCY)
+    ]
+    try:
+        await asyncio.gather(*(
+            _bungie_stage(pending, clan_admins, membership_index, bungie_limiter, discord_queue, report)
+            for _ in range(PURGE_BUNGIE_CONCURRENCY)
+        ))
+        for _ in discord_workers:
+            await discord_queue.put(None)
+        await asyncio.gather(*discord_workers)
+    finally:
+        for worker in discord_workers:
+            if not worker.done():
+                worker.cancel()
+        bungie_limiter.close()
+        discord_limiter.close()
+
+    report["discord_removed"] = [i['user_id'] for i in items if i['discord_status'] == 'ok']
+    report["bungie_removed"] = [i['user_id'] for i in items if i['bungie_status'] == 'ok']
+    report["failures"] = [(i['user_id'], i['error']) for i in items if 'falhou' in (i['bungie_status'], i['discord_status'])]
+    if not report["postponed"]:
+        await adb.db_finish_purge_job(job_id)
+    return report
+
+
+def _mention_list(user_ids: List[int], limit: int = 1000) -> str:
+    text = ""
+    for index, user_id in enumerate(user_ids):
+        mention = f"<@{user_id}> "
+        if len(text) + len(mention) > limit:
+            return text + f"... (+{len(user_ids) - index})"
+        text += mention
+    return text or "Nenhum"
+
+
+def build_purge_report_embed(report: Dict[str, Any]) -> discord.Embed:
+    title = "🚨 Limpeza por Inatividade" + (" (retomada)" if report['resumed'] else "")
+    embed = discord.Embed(title=title, description=f"{report['total']} membro(s) inativo(s) há mais de 3 semanas.", color=discord.Color.red())
+    embed.add_field(name=f"Removidos do Discord ({len(report['discord_removed'])})", value=_mention_list(report['discord_removed']), inline=False)
+    embed.add_field(name=f"Removidos do clã Bungie ({len(report['bungie_removed'])})", value=_mention_list(report['bungie_removed']), inline=False)
+    if report['failures']:
+        lines = [f"<@{user_id}>: {error}" for user_id, error in report['failures'][:10]]
+        if len(report['failures']) > 10:
+            lines.append(f"... (+{len(report['failures']) - 10})")
+        embed.add_field(name=f"⚠️ Falhas ({len(report['failures'])})", value="\n".join(lines)[:1024], inline=False)
+    if report['postponed']:
+        embed.add_field(name="⏸️ Adiados", value=f"{report['postponed']} membro(s) aguardam a API da Bungie; a limpeza continua na próxima execução.", inline=False)
+    embed.set_footer(text=f"Limpeza #{report['job_id']}")
+    return embed
@@ -0,0 +1,134 @@
+# rate_limit.py
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Prioridades: menor número = atendido primeiro.
+PRIORITY_INTERACTIVE = 0  # Alguém está à espera da resposta (botões, comandos)
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2   # Tarefas periódicas de sincronização
+
+
+class TokenBucket:
+    """
+    Balde de fichas clássico: `rate` fichas por segundo, até `capacity` acumuladas.
+    `penalize` bloqueia o balde por completo durante um tempo (ThrottleSeconds / 429).
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self) -> float:
+        """Segundos até haver uma ficha disponível (0 se já houver)."""
+        now = time.monotonic()
+        if self._blocked_until > now:
+            return self._blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def try_acquire(self) -> bool:
+        if self.wait_time() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def penalize(self, seconds: float):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class PriorityRateLimiter:
+    """
+    Fila por classe de endpoint, à frente de um TokenBucket próprio.
+
+    Quem chama `acquire` fica em espera até o balde da sua classe libertar uma
+    ficha; os pedidos são atendidos por prioridade e, dentro da mesma prioridade,
+    por ordem de chegada. Cada classe tem uma tarefa que esvazia a fila e termina
+    quando ela fica vazia.
+    """
+    def __init__(self, limits: Dict[str, Tuple[float, float]], default_class: str = "default"):
+        self.default_class = default_class
+        self.buckets: Dict[str, TokenBucket] = {name: TokenBucket(rate, burst) for name, (rate, burst) in limits.items()}
+        if default_class not in self.buckets:
+            raise ValueError(f"Classe de endpoint padrão '{default_class}' sem limite configurado.")
+        self._queues: Dict[str, List[tuple]] = {name: [] for name in self.buckets}
+        self._pumps: Dict[str, asyncio.Task] = {}
+        self._seq = itertools.count()
+        self._stats: Dict[str, Dict[str, float]] = {
+            name: {"granted": 0, "throttled": 0, "total_wait": 0.0, "max_wait": 0.0} for name in self.buckets
+        }
+
+    def _resolve(self, endpoint_class: Optional[str]) -> str:
+        return endpoint_class if endpoint_class in self.buckets else self.default_class
+
+    async def acquire(self, endpoint_class: Optional[str] = None, priority: int = PRIORITY_NORMAL):
+        name = self._resolve(endpoint_class)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._queues[name], (priority, next(self._seq), loop.time(), future))
+        pump = self._pumps.get(name)
+        if pump is None or pump.done():
+            self._pumps[name] = loop.create_task(self._pump(name), name=f"bungie-rate-{name}")
+        await future
+
+    async def _pump(self, name: str):
+        queue = self._queues[name]
+        bucket = self.buckets[name]
+        loop = asyncio.get_running_loop()
+        while queue:
+            wait = bucket.wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, enqueued_at, future = heapq.heappop(queue)
+            if future.done():  # Quem pediu desistiu (cancelado) enquanto esperava
+                continue
+            bucket.try_acquire()
+            future.set_result(None)
+            waited = loop.time() - enqueued_at
+            stats = self._stats[name]
+            stats["granted"] += 1
+            stats["total_wait"] += waited
+            stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def throttle(self, endpoint_class: Optional[str], seconds: float):
+        """Suspende a classe durante `seconds` (pedido explícito do servidor)."""
+        if seconds <= 0:
+            return
+        name = self._resolve(endpoint_class)
+        self.buckets[name].penalize(seconds)
+        self._stats[name]["throttled"] += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        snapshot = {}
+        for name, stats in self._stats.items():
+            granted = stats["granted"]
+            snapshot[name] = {
+                "queued": len(self._queues[name]),
+                "granted": granted,
+                "throttled": stats["throttled"],
+                "avg_wait_ms": (stats["total_wait"] / granted * 1000) if granted else 0.0,
+                "max_wait_ms": stats["max_wait"] * 1000,
+            }
+        return snapshot
+
+    def close(self):
+        for pump in self._pumps.values():
+            pump.cancel()
+        self._pumps.clear()
+        for queue in self._queues.values():
+            for *_, future in queue:
+                if not future.done():
+                    future.cancel()
+            queue.clear()
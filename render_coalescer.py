@@ -0,0 +1,134 @@
+# render_coalescer.py
+"""
+Agrupa as re-renderizações da mensagem de um evento.
+
+Quando um evento abre, uma dúzia de pessoas clica nos botões de RSVP em poucos
+segundos e cada clique pedia o seu próprio `message.edit`. Aqui cada mensagem tem
+no máximo uma edição em curso: os pedidos que chegam durante a janela de espera
+(ou durante a edição) juntam-se num único novo render, feito com os dados lidos
+do banco nesse momento, isto é, sempre com a lista mais recente.
+
+Quem edita a mensagem por outro caminho (a resposta direta ao clique de RSVP)
+usa `bump`/`is_latest`: se outra alteração chegou entretanto, a sua edição pode
+ter ficado por cima de uma mais nova e é preciso agendar um render.
+
+Depois de uma edição que ninguém ultrapassou, `mark_applied` guarda a chave de
+conteúdo do embed (ver utils.render_event_embed); `is_applied` permite então
+saltar edições que não mudariam nada (ex.: a limpeza de eventos logo a seguir a
+um clique de RSVP).
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+
+from constants import EMBED_RENDER_DEBOUNCE_SECONDS
+
+# Devolve False quando não foi preciso editar a mensagem (conteúdo igual).
+Renderer = Callable[[], Awaitable[Optional[bool]]]
+
+
+class _PendingRender:
+    __slots__ = ("renderer", "dirty", "waiters", "task")
+
+    def __init__(self, renderer: Renderer):
+        self.renderer = renderer
+        self.dirty = True
+        self.waiters: List[asyncio.Future] = []
+        self.task: Optional[asyncio.Task] = None
+
+
+class RenderCoalescer:
+    def __init__(self, window: float = EMBED_RENDER_DEBOUNCE_SECONDS):
+        self.window = window
+        self._pending: Dict[Hashable, _PendingRender] = {}
+        self._stats = {"requests": 0, "served": 0, "renders": 0, "failures": 0, "skipped": 0}
+        self._sequence: Dict[Hashable, int] = {}
+        self._applied: Dict[Hashable, Hashable] = {}
+
+    def bump(self, key: Hashable) -> int:
+        """Regista uma alteração no conteúdo de `key` e devolve o seu número de sequência."""
+        if len(self._sequence) > 4096:
+            self._sequence.clear()  # No pior caso, um render a mais.
+        seq = self._sequence.get(key, 0) + 1
+        self._sequence[key] = seq
+        return seq
+
+    def is_latest(self, key: Hashable, seq: int) -> bool:
+        return self._sequence.get(key) == seq
+
+    def is_applied(self, key: Hashable, content_key: Hashable) -> bool:
+        """True se a mensagem `key` já mostra `content_key`; conta a edição como evitada."""
+        if self._applied.get(key) == content_key:
+            self._stats["skipped"] += 1
+            return True
+        return False
+
+    def mark_applied(self, key: Hashable, content_key: Hashable, seq: int):
+        """Regista o conteúdo de uma edição concluída, se nenhuma alteração chegou depois de `seq`."""
+        if not self.is_latest(key, seq):
+            self._applied.pop(key, None)
+            return
+        if len(self._applied) > 4096:
+            self._applied.clear()  # No pior caso, uma edição a mais.
+        self._applied[key] = content_key
+
+    def schedule(self, key: Hashable, renderer: Renderer, delay: Optional[float] = None) -> asyncio.Future:
+        """
+        Pede um render para `key` (o message_id). Devolve um Future resolvido quando
+        um render que inclui este pedido termina; quem não precisa de esperar pode ignorá-lo.
+        `delay=0` salta a janela de espera (ex.: cancelamento do evento).
+        """
+        loop = asyncio.get_running_loop()
+        self._stats["requests"] += 1
+        self.bump(key)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _PendingRender(renderer)
+        else:
+            pending.renderer = renderer
+            pending.dirty = True
+        waiter = loop.create_future()
+        pending.waiters.append(waiter)
+        if pending.task is None:
+            pending.task = loop.create_task(self._drain(key, pending, self.window if delay is None else delay))
+        return waiter
+
+    async def render_now(self, key: Hashable, renderer: Renderer):
+        """Render sem janela de espera; se já houver um pendente para `key`, junta-se a ele."""
+        await self.schedule(key, renderer, delay=0)
+
+    async def _drain(self, key: Hashable, pending: _PendingRender, delay: float):
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            while pending.dirty:
+                pending.dirty = False
+                waiters, pending.waiters = pending.waiters, []
+                try:
+                    if await pending.renderer() is not False:
+                        self._stats["renders"] += 1
+                except Exception as e:
+                    self._stats["failures"] += 1
+                    print(f"ERRO ao renderizar mensagem {key}: {e}")
+                self._stats["served"] += len(waiters)
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+                if pending.dirty and self.window > 0:
+                    # Houve cliques durante a edição: espera mais um pouco para juntá-los.
+                    await asyncio.sleep(self.window)
+        finally:
+            for waiter in pending.waiters:
+                if not waiter.done():
+                    waiter.cancel()
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "requests": self._stats["requests"],
+            "renders": self._stats["renders"],
+            "saved": self._stats["served"] - self._stats["renders"] - self._stats["failures"],
+            "skipped": self._stats["skipped"],
+            "failures": self._stats["failures"],
+            "pending": len(self._pending),
+        }
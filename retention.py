@@ -0,0 +1,63 @@
+# retention.py
+import asyncio
+import datetime
+import pytz
+from typing import Dict, Optional
+
+import db_async as adb
+from constants import (
+    RETENTION_VOICE_SESSIONS_DAYS, RETENTION_EVENTS_DAYS,
+    RETENTION_BATCH_SIZE, RETENTION_VACUUM_MAX_PAGES, DM_OUTBOX_RETENTION_DAYS
+)
+
+async def run_retention(now_utc: Optional[datetime.datetime] = None,
+                        voice_days: int = RETENTION_VOICE_SESSIONS_DAYS,
+                        event_days: int = RETENTION_EVENTS_DAYS,
+                        batch_size: int = RETENTION_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Arquiva e apaga dados antigos em lotes limitados e, no fim, executa um VACUUM incremental.
+
+    Cada lote é uma transação curta na thread do escritor; entre lotes o controlo volta ao
+    event loop, de forma que RSVPs e sessões de voz continuam a ser gravados durante a limpeza.
+    Devolve quantas linhas de cada tabela foram removidas e quantos bytes foram recuperados.
+    """
+    now_utc = now_utc or datetime.datetime.now(pytz.utc)
+    voice_cutoff = now_utc - datetime.timedelta(days=voice_days)
+    event_cutoff = (now_utc - datetime.timedelta(days=event_days)).isoformat()
+    dm_cutoff = (now_utc - datetime.timedelta(days=DM_OUTBOX_RETENTION_DAYS)).isoformat()
+    report = {"voice_sessions": 0, "voice_daily_totals": 0, "events": 0, "rsvps": 0, "dm_outbox": 0, "bytes_reclaimed": 0}
+
+    while True:
+        deleted = await adb.db_archive_voice_sessions_batch(voice_cutoff.isoformat(), batch_size)
+        report["voice_sessions"] += deleted
+        if deleted < batch_size: break
+        await asyncio.sleep(0)
+
+    while True:
+        deleted = await adb.db_prune_voice_daily_totals_batch(voice_cutoff.date().isoformat(), batch_size)
+        report["voice_daily_totals"] += deleted
+        if deleted < batch_size: break
+        await asyncio.sleep(0)
+
+    while True:
+        events_deleted, rsvps_deleted = await adb.db_archive_events_batch(event_cutoff, batch_size)
+        report["events"] += events_deleted
+        report["rsvps"] += rsvps_deleted
+        if events_deleted < batch_size: break
+        await asyncio.sleep(0)
+
+    while True:
+        deleted = await adb.db_prune_dm_outbox_batch(dm_cutoff, batch_size)
+        report["dm_outbox"] += deleted
+        if deleted < batch_size: break
+        await asyncio.sleep(0)
+
+    report["bytes_reclaimed"] = await adb.db_incremental_vacuum(RETENTION_VACUUM_MAX_PAGES)
+    return report
+
+def format_retention_report(report: Dict[str, int]) -> str:
+    rows = report["voice_sessions"] + report["voice_daily_totals"] + report["events"] + report["rsvps"] + report["dm_outbox"]
+    return (
+        f"{rows} linhas removidas (sessões de voz: {report['voice_sessions']}, agregados diários: {report['voice_daily_totals']}, "
+        f"eventos: {report['events']}, RSVPs: {report['rsvps']}, DMs: {report['dm_outbox']}); {report['bytes_reclaimed'] / 1024:.1f} KiB recuperados."
+    )
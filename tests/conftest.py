@@ -0,0 +1,33 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# config.py exige o token do bot; os testes nunca falam com o Discord nem com a Bungie.
+os.environ.setdefault("DISCORD_BOT_TOKEN", "token-de-teste")
+os.environ.setdefault("BUNGIE_API_KEY", "chave-de-teste")
+os.environ.setdefault("BUNGIE_CLAN_ID", "1")
+os.environ.setdefault("BUNGIE_CLIENT_ID", "1")
+os.environ.setdefault("BUNGIE_CLIENT_SECRET", "segredo-de-teste")
+os.environ.setdefault("GUILD_ID", "1")
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Banco novo (init_db) num diretório temporário, com pool e caches de eventos limpos."""
+    import database
+    import db_pool
+    from caching import LRUCache
+    from constants import EVENT_CACHE_MAX_ENTRIES, RSVP_CACHE_MAX_ENTRIES
+
+    db_pool.close_pool()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "_event_cache", LRUCache(EVENT_CACHE_MAX_ENTRIES, pinned=lambda row: row['status'] == 'ativo'))
+    monkeypatch.setattr(database, "_rsvp_cache", LRUCache(RSVP_CACHE_MAX_ENTRIES))
+    database.init_db()
+    yield database
+    db_pool.close_pool()
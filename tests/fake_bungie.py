@@ -0,0 +1,92 @@
+# tests/fake_bungie.py
+"""
+Servidor aiohttp local que faz de bungie.net nos testes.
+
+`async with FakeBungie(monkeypatch) as fake:` sobe o servidor numa porta livre,
+aponta BUNGIE_API_ROOT/TOKEN_URL/STATS_API_ROOT para ele e troca o cliente, o
+TokenStore e os caches do bungie_api por instâncias novas. As rotas são
+registadas com `fake.on(método, trecho_do_caminho, handler)`; o handler recebe o
+pedido e devolve um dict (JSON 200) ou uma web.Response. `fake.mode` simula
+falhas globais: "manutencao" (SystemDisabled) ou "erro_500"; `fake.delay` atrasa
+todas as respostas.
+"""
+import asyncio
+import inspect
+from collections import Counter
+from typing import Any, Callable, List, Optional, Tuple
+
+from aiohttp import web
+
+import bungie_api
+from caching import AsyncTTLCache
+
+
+def success(response: Any) -> dict:
+    return {"ErrorCode": 1, "ErrorStatus": "Success", "Message": "Ok", "Response": response}
+
+
+SYSTEM_DISABLED = {"ErrorCode": 5, "ErrorStatus": "SystemDisabled", "Message": "This system is temporarily disabled for maintenance."}
+
+
+class FakeBungie:
+    def __init__(self, monkeypatch):
+        self.monkeypatch = monkeypatch
+        self.mode: Optional[str] = None
+        self.delay = 0.0
+        self.hits: Counter = Counter()
+        self.client_ports: set = set()
+        self._routes: List[Tuple[str, str, Callable]] = []
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    def on(self, method: str, fragment: str, handler: Callable):
+        self._routes.append((method.upper(), fragment, handler))
+
+    def count(self, fragment: str) -> int:
+        return sum(hits for key, hits in self.hits.items() if fragment in key)
+
+    async def _dispatch(self, request: web.Request) -> web.StreamResponse:
+        self.hits[f"{request.method} {request.path}"] += 1
+        peer = request.transport.get_extra_info("peername") if request.transport else None
+        if peer:
+            self.client_ports.add(peer[1])
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.mode == "manutencao":
+            return web.json_response(SYSTEM_DISABLED, status=503)
+        if self.mode == "erro_500":
+            return web.Response(status=500, text="Internal Server Error")
+        for method, fragment, handler in self._routes:
+            if request.method == method and fragment in request.path:
+                result = handler(request)
+                if inspect.isawaitable(result):
+                    result = await result
+                return web.json_response(result) if isinstance(result, dict) else result
+        return web.Response(status=404, text="Not Found")
+
+    async def __aenter__(self) -> "FakeBungie":
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._dispatch)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+        mp = self.monkeypatch
+        mp.setattr(bungie_api, "BUNGIE_API_ROOT", f"{self.base_url}/Platform")
+        mp.setattr(bungie_api, "TOKEN_URL", f"{self.base_url}/Platform/App/OAuth/Token/")
+        mp.setattr(bungie_api, "STATS_API_ROOT", f"{self.base_url}/stats/Platform")
+        mp.setattr(bungie_api, "backoff_delay", lambda attempt: 0.01)
+        self.client = bungie_api.BungieClient()
+        mp.setattr(bungie_api, "client", self.client)
+        mp.setattr(bungie_api, "tokens", bungie_api.TokenStore())
+        mp.setattr(bungie_api, "_clan_members_cache", AsyncTTLCache(60))
+        mp.setattr(bungie_api, "_pending_invites_cache", AsyncTTLCache(60))
+        mp.setattr(bungie_api, "_character_ids_cache", AsyncTTLCache(60))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.close()
+        await self._runner.cleanup()
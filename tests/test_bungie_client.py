@@ -0,0 +1,104 @@
+# tests/test_bungie_client.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytz
+from aiohttp import web
+
+import bungie_api
+from fake_bungie import FakeBungie, success
+
+ADMIN_ID = 111
+CLAN_ID = "4242"
+
+
+def _remember_admin_token(expires_in: timedelta = timedelta(hours=1)):
+    bungie_api.remember_tokens(ADMIN_ID, "token-antigo", "refresh-antigo", datetime.now(pytz.utc) + expires_in)
+
+
+def _token_handler(fake: FakeBungie, fail_first: int = 0):
+    async def handler(request):
+        await asyncio.sleep(0.05)  # Janela para os pedidos concorrentes se sobreporem.
+        if fake.count("/App/OAuth/Token/") <= fail_first:
+            return web.Response(status=500, text="erro")
+        return {"access_token": f"token-{fake.count('/App/OAuth/Token/')}", "refresh_token": "refresh-novo", "expires_in": 3600}
+    return handler
+
+
+def _members_handler(fake: FakeBungie, fail_first: int = 0):
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        if fake.count("/Members/") <= fail_first:
+            return {"ErrorCode": 99, "ErrorStatus": "UnhandledException", "Message": "falha"}
+        return success({"results": [{"destinyUserInfo": {"membershipId": "m1"}}, {"destinyUserInfo": {"membershipId": "m2"}}]})
+    return handler
+
+
+def test_concurrent_refreshes_share_one_token_request(temp_db, monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            fake.on("POST", "/App/OAuth/Token/", _token_handler(fake))
+            _remember_admin_token(expires_in=timedelta(seconds=10))  # Já dentro da margem: renovação obrigatória.
+            tokens = await asyncio.gather(*(bungie_api._get_access_token(ADMIN_ID) for _ in range(20)))
+            return fake, tokens
+
+    fake, tokens = asyncio.run(scenario())
+    assert fake.count("/App/OAuth/Token/") == 1
+    assert set(tokens) == {"token-1"}
+
+
+def test_failed_refresh_is_not_cached(temp_db, monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            fake.on("POST", "/App/OAuth/Token/", _token_handler(fake, fail_first=1))
+            _remember_admin_token(expires_in=timedelta(seconds=10))
+            first = await asyncio.gather(*(bungie_api._get_access_token(ADMIN_ID) for _ in range(5)))
+            second = await bungie_api._get_access_token(ADMIN_ID)
+            return fake, first, second
+
+    fake, first, second = asyncio.run(scenario())
+    assert first == [None] * 5
+    assert second == "token-2"
+    assert fake.count("/App/OAuth/Token/") == 2
+
+
+def test_concurrent_clan_lookups_share_one_fetch(monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            fake.on("GET", f"/GroupV2/{CLAN_ID}/Members/", _members_handler(fake))
+            _remember_admin_token()
+            results = await asyncio.gather(*(bungie_api.get_clan_members(ADMIN_ID, clan_id=CLAN_ID) for _ in range(20)))
+            return fake, results
+
+    fake, results = asyncio.run(scenario())
+    assert fake.count("/Members/") == 1
+    assert all(result == {"m1", "m2"} for result in results)
+
+
+def test_failed_clan_fetch_is_not_cached(monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            fake.on("GET", f"/GroupV2/{CLAN_ID}/Members/", _members_handler(fake, fail_first=1))
+            _remember_admin_token()
+            first = await asyncio.gather(*(bungie_api.get_clan_members(ADMIN_ID, clan_id=CLAN_ID) for _ in range(5)))
+            second = await bungie_api.get_clan_members(ADMIN_ID, clan_id=CLAN_ID)
+            third = await bungie_api.get_clan_members(ADMIN_ID, clan_id=CLAN_ID)
+            return fake, first, second, third
+
+    fake, first, second, third = asyncio.run(scenario())
+    assert first == [set()] * 5
+    assert second == third == {"m1", "m2"}
+    assert fake.count("/Members/") == 2  # Uma falha partilhada, uma busca boa e depois o cache.
+
+
+def test_sequential_calls_reuse_one_connection(monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            fake.on("GET", "/Destiny2/Manifest/", lambda request: success({"version": "1"}))
+            for _ in range(10):
+                assert await bungie_api.get_destiny_manifest() == {"version": "1"}
+            return fake
+
+    fake = asyncio.run(scenario())
+    assert fake.count("/Destiny2/Manifest/") == 10
+    assert len(fake.client_ports) == 1
@@ -0,0 +1,146 @@
+# tests/test_bungie_resilience.py
+import asyncio
+import socket
+from datetime import datetime, timedelta
+
+import pytz
+
+import bungie_api
+import purge_pipeline
+from fake_bungie import FakeBungie, success
+from rate_limit import PriorityRateLimiter
+
+ADMIN_ID = 111
+CLAN_ID = "4242"
+KICK_PATH = "/Kick/"
+
+
+def _remember_admin_token():
+    bungie_api.remember_tokens(ADMIN_ID, "token", "refresh", datetime.now(pytz.utc) + timedelta(hours=1))
+
+
+async def _kick(bnet_id: str = "m1") -> bool:
+    return await bungie_api.kick_clan_member(ADMIN_ID, bnet_id, 3, clan_id=CLAN_ID)
+
+
+def test_system_disabled_opens_breaker_and_stops_traffic(monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            fake.mode = "manutencao"
+            _remember_admin_token()
+            first = await _kick()
+            hits_after_trip = sum(fake.hits.values())
+            later = [await _kick(), await bungie_api.get_clan_members(ADMIN_ID, clan_id=CLAN_ID)]
+            return fake, first, hits_after_trip, later
+
+    fake, first, hits_after_trip, later = asyncio.run(scenario())
+    assert first is False
+    assert hits_after_trip == 1
+    assert later == [False, set()]
+    assert sum(fake.hits.values()) == 1  # Com o disjuntor aberto nada chega ao servidor.
+    assert fake.client.breaker.times_opened == 1
+
+
+def test_half_open_probe_closes_breaker_after_recovery(monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            fake.client.breaker.open_seconds = 0.1
+            fake.on("POST", KICK_PATH, lambda request: success(1))
+            _remember_admin_token()
+            fake.mode = "manutencao"
+            assert await _kick() is False
+            assert not bungie_api.is_available()
+            fake.mode = None
+            await asyncio.sleep(0.15)
+            recovered = await _kick()
+            return fake, recovered
+
+    fake, recovered = asyncio.run(scenario())
+    assert recovered is True
+    assert bungie_api.is_available()
+    assert fake.count(KICK_PATH) == 2
+
+
+def test_get_is_retried_on_5xx(monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            def members(request):
+                if fake.count("/Members/") < 3:
+                    from aiohttp import web
+                    return web.Response(status=502, text="Bad Gateway")
+                return success({"results": [{"destinyUserInfo": {"membershipId": "m1"}}]})
+            fake.on("GET", "/Members/", members)
+            _remember_admin_token()
+            return fake, await bungie_api.get_clan_members(ADMIN_ID, clan_id=CLAN_ID)
+
+    fake, members = asyncio.run(scenario())
+    assert members == {"m1"}
+    assert fake.count("/Members/") == 3
+    assert fake.client.breaker.state == fake.client.breaker.CLOSED
+
+
+def test_timeouts_return_failure_without_retrying_posts(monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            monkeypatch.setattr(bungie_api, "BUNGIE_REQUEST_TIMEOUT_SECONDS", 0.1)
+            fake.delay = 0.5
+            fake.on("POST", KICK_PATH, lambda request: success(1))
+            fake.on("POST", "/App/OAuth/Token/", lambda request: {"access_token": "a"})
+            _remember_admin_token()
+            kicked = await _kick()
+            approved = await bungie_api.approve_pending_invitation(ADMIN_ID, "m2", 3, clan_id=CLAN_ID)
+            exchanged = await bungie_api.exchange_code_for_token("codigo")
+            profile = await bungie_api.get_bungie_memberships_for_current_user("token")
+            return fake, (kicked, approved, exchanged, profile)
+
+    fake, results = asyncio.run(scenario())
+    assert results == (False, False, None, None)
+    assert fake.count(KICK_PATH) == 1  # POST não é idempotente: sem nova tentativa.
+    assert fake.count("/Approve/") == 1
+    assert fake.count("/App/OAuth/Token/") == 1
+
+
+def test_connection_refused_returns_failure(monkeypatch):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        closed_port = sock.getsockname()[1]
+
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            base = f"http://127.0.0.1:{closed_port}"
+            monkeypatch.setattr(bungie_api, "BUNGIE_API_ROOT", f"{base}/Platform")
+            monkeypatch.setattr(bungie_api, "TOKEN_URL", f"{base}/Platform/App/OAuth/Token/")
+            _remember_admin_token()
+            return (
+                await _kick(),
+                await bungie_api.deny_pending_invitation(ADMIN_ID, "m2", 3, clan_id=CLAN_ID),
+                await bungie_api.exchange_code_for_token("codigo"),
+                await bungie_api.get_bungie_memberships_for_current_user("token"),
+            )
+
+    assert asyncio.run(scenario()) == (False, False, None, None)
+
+
+def test_purge_bungie_stage_survives_timeouts(temp_db, monkeypatch):
+    async def scenario():
+        async with FakeBungie(monkeypatch) as fake:
+            monkeypatch.setattr(bungie_api, "BUNGIE_REQUEST_TIMEOUT_SECONDS", 0.1)
+            fake.delay = 0.5
+            _remember_admin_token()
+            items = [
+                {'job_id': 1, 'user_id': user_id, 'bungie_membership_id': f"m{user_id}", 'bungie_membership_type': 3,
+                 'bungie_status': 'pendente', 'discord_status': 'pendente', 'error': None}
+                for user_id in (1, 2)
+            ]
+            limiter = PriorityRateLimiter({"default": (100, 100)})
+            queue = asyncio.Queue()
+            report = {'postponed': 0}
+            try:
+                await purge_pipeline._bungie_stage(list(items), {CLAN_ID: ADMIN_ID}, {"m1": CLAN_ID, "m2": CLAN_ID}, limiter, queue, report)
+            finally:
+                limiter.close()
+            return items, queue.qsize()
+
+    items, queued = asyncio.run(scenario())
+    assert [item['bungie_status'] for item in items] == ['falhou', 'falhou']
+    assert queued == 2
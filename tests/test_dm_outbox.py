@@ -0,0 +1,80 @@
+# tests/test_dm_outbox.py
+import asyncio
+import types
+
+import db_async as adb
+from dm_outbox import DMOutbox
+from rate_limit import PriorityRateLimiter
+
+
+class _User:
+    bot = False
+
+    def __init__(self, user_id: int, gate: asyncio.Event, sent: list):
+        self.id = user_id
+        self._gate = gate
+        self._sent = sent
+
+    async def send(self, content, view=None):
+        self._sent.append(self.id)
+        await self._gate.wait()
+
+
+def _bot(gate: asyncio.Event, sent: list):
+    async def fetch_user(user_id):
+        return _User(user_id, gate, sent)
+    return types.SimpleNamespace(profile_cache=types.SimpleNamespace(fetch_user=fetch_user))
+
+
+def _statuses(database) -> dict:
+    with database.db_pool.connection() as conn:
+        return dict(conn.execute("SELECT user_id, status FROM dm_outbox").fetchall())
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+def test_only_rows_being_sent_are_lost_on_restart(temp_db):
+    """Com 2 trabalhadores e 6 DMs, um reinício a meio só deixa 'incerto' as 2 que estavam no send."""
+    async def scenario():
+        gate, sent = asyncio.Event(), []
+        outbox = DMOutbox(_bot(gate, sent), workers=2)
+        outbox.limiter = PriorityRateLimiter({"default": (100.0, 100)})
+        await outbox.enqueue(range(1, 7), "lembrete", "Olá", event_id=1)
+        await outbox.start()
+        await _wait_for(lambda: len(sent) == 2)
+        during = _statuses(temp_db)
+        # "Queda": o despachante e os envios morrem sem fechar nada.
+        outbox._runner.cancel()
+        for task in list(outbox._tasks):
+            task.cancel()
+        await asyncio.gather(outbox._runner, *outbox._tasks, return_exceptions=True)
+        outbox.limiter.close()
+        uncertain = await adb.db_recover_dm_outbox()
+        return during, uncertain, _statuses(temp_db)
+
+    during, uncertain, after = asyncio.run(scenario())
+    assert sorted(during.values()) == ['enviando'] * 2 + ['pendente'] * 4
+    assert uncertain == 2
+    assert sorted(after.values()) == ['incerto'] * 2 + ['pendente'] * 4
+
+
+def test_every_dm_is_sent_once(temp_db):
+    async def scenario():
+        gate, sent = asyncio.Event(), []
+        gate.set()
+        outbox = DMOutbox(_bot(gate, sent), workers=3)
+        outbox.limiter = PriorityRateLimiter({"default": (100.0, 100)})
+        await outbox.enqueue(range(1, 31), "lembrete", "Olá", event_id=1)
+        await outbox.start()
+        await _wait_for(lambda: outbox.get_stats()["sent"] == 30)
+        await outbox.stop()
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert sorted(sent) == list(range(1, 31))
+    assert set(_statuses(temp_db).values()) == {'enviado'}
@@ -0,0 +1,74 @@
+# tests/test_job_scheduler.py
+import asyncio
+import datetime
+
+import pytz
+
+import db_async as adb
+from job_scheduler import JobScheduler
+
+
+def _create_event(database, starts_in: datetime.timedelta) -> int:
+    now = datetime.datetime.now(pytz.utc)
+    return database.db_create_event(
+        guild_id=1, channel_id=1, creator_id=1, title="Raid", description="", event_time_utc=(now + starts_in).isoformat(),
+        activity_type="Raid", max_attendees=6, created_at_utc=now.isoformat()
+    )
+
+
+def _jobs(database, event_id: int) -> dict:
+    with database.db_pool.connection() as conn:
+        rows = conn.execute("SELECT kind, due_at_utc, status FROM scheduled_jobs WHERE event_id = ?", (event_id,)).fetchall()
+    return {row['kind']: (row['due_at_utc'], row['status']) for row in rows}
+
+
+async def _run_until(scheduler: JobScheduler, condition, timeout: float = 5.0):
+    await scheduler.start()
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not condition():
+            assert asyncio.get_running_loop().time() < deadline, "o agendador não terminou a tempo"
+            await asyncio.sleep(0.02)
+        while scheduler._running:
+            await asyncio.sleep(0.02)
+    finally:
+        await scheduler.stop()
+
+
+def test_job_replanned_while_running_stays_pending(temp_db):
+    # Evento daqui a ~1 h: 'criar_vc' e 'lembrete_confirmacao' (-60 min) já venceram.
+    event_id = _create_event(temp_db, datetime.timedelta(minutes=59, seconds=50))
+    executed = []
+
+    async def move_event(event):
+        executed.append(event['event_id'])
+        new_time = datetime.datetime.fromisoformat(event['event_time_utc']) + datetime.timedelta(days=1)
+        await adb.db_update_event_details(event_id, event_time_utc=new_time.isoformat())
+
+    async def noop(event):
+        return None
+
+    scheduler = JobScheduler({"criar_vc": move_event, "lembrete_confirmacao": noop, "lembrete": noop, "presenca": noop, "apagar_vc": noop})
+    asyncio.run(_run_until(scheduler, lambda: executed and scheduler.get_stats()["executed"] >= 2))
+
+    jobs = _jobs(temp_db, event_id)
+    assert executed == [event_id]
+    due_at_utc, status = jobs['criar_vc']
+    assert status == 'pendente'  # A execução antiga não fechou a ocorrência do dia seguinte.
+    assert datetime.datetime.fromisoformat(due_at_utc) > datetime.datetime.now(pytz.utc) + datetime.timedelta(hours=23)
+    assert jobs['lembrete_confirmacao'][1] == 'pendente'  # Também replanejada pelo handler de criar_vc.
+
+
+def test_due_job_is_closed_for_its_own_occurrence(temp_db):
+    event_id = _create_event(temp_db, datetime.timedelta(minutes=59, seconds=50))
+    executed = []
+
+    async def handler(event):
+        executed.append(event['event_id'])
+
+    scheduler = JobScheduler({kind: handler for kind in ("criar_vc", "lembrete_confirmacao", "lembrete", "presenca", "apagar_vc")})
+    asyncio.run(_run_until(scheduler, lambda: scheduler.get_stats()["executed"] >= 2))
+
+    jobs = _jobs(temp_db, event_id)
+    assert jobs['criar_vc'][1] == jobs['lembrete_confirmacao'][1] == 'feito'
+    assert jobs['lembrete'][1] == 'pendente'
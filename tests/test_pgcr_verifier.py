@@ -0,0 +1,139 @@
+# tests/test_pgcr_verifier.py
+import asyncio
+import datetime
+import json
+import os
+
+import pytest
+from aiohttp import web
+
+import pgcr_verifier
+from constants import PGCR_MIN_FIRETEAM_MATCH, PGCR_WINDOW_AFTER_HOURS, PGCR_WINDOW_BEFORE_MINUTES
+from fake_bungie import FakeBungie, success
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "pgcr")
+EVENT = {"event_time_utc": "2030-01-10T20:00:00+00:00", "activity_type": "Raid"}
+
+# Jogadores dos fixtures: A joga sempre, B e C são confirmados, X é um desconhecido.
+A, B, C, X = "4611686018400000001", "4611686018400000002", "4611686018400000003", "4611686018400000099"
+
+
+def _load(name: str) -> dict:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _report(instance_id: str) -> dict:
+    return _load(f"pgcr_{instance_id}.json")["Response"]
+
+
+def _row(user_id: int, membership_id, status: str) -> dict:
+    return {"user_id": user_id, "bungie_membership_id": membership_id, "bungie_membership_type": 3, "attendance_status": status}
+
+
+def _window():
+    event_time = datetime.datetime.fromisoformat(EVENT["event_time_utc"])
+    return (event_time - datetime.timedelta(minutes=PGCR_WINDOW_BEFORE_MINUTES),
+            event_time + datetime.timedelta(hours=PGCR_WINDOW_AFTER_HOURS))
+
+
+def test_instances_in_window_includes_both_edges():
+    start, end = _window()
+    activities = _load("activity_history.json")["Response"]["activities"]
+    # 1003 começou 1 s antes da janela e 1004 1 s depois; as entradas sem período ou sem instância são ignoradas.
+    assert pgcr_verifier.instances_in_window(activities, start, end) == ["1002", "1005", "1001"]
+
+
+def test_match_requires_fireteam_of_confirmed_players():
+    confirmed = {A: 1, B: 2, C: 3}
+    # Em 1001 só está C (mais um desconhecido): menos de PGCR_MIN_FIRETEAM_MATCH confirmados, não é o evento.
+    assert PGCR_MIN_FIRETEAM_MATCH == 2
+    assert pgcr_verifier.match_attendance([_report("1001")], confirmed, absent={3}) == set()
+    assert pgcr_verifier.match_attendance([_report("1005")], confirmed, absent={2, 3}) == {2}
+
+
+def test_match_threshold_shrinks_when_few_members_are_linked():
+    # Só C tem perfil vinculado: basta ele estar no PGCR.
+    assert pgcr_verifier.match_attendance([_report("1001")], {C: 3}, absent={3}) == {3}
+    assert pgcr_verifier.match_attendance([_report("1001")], {}, absent=set()) == set()
+
+
+def test_match_only_returns_absent_players():
+    assert pgcr_verifier.match_attendance([_report("1005")], {A: 1, B: 2}, absent={2}) == {2}
+    assert pgcr_verifier.match_attendance([_report("1005")], {A: 1, B: 2}, absent=set()) == set()
+
+
+@pytest.fixture
+def fake_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(pgcr_verifier, "cache", pgcr_verifier.PGCRCache(str(tmp_path / "pgcr_cache")))
+
+    async def start():
+        fake = FakeBungie(monkeypatch)
+        await fake.__aenter__()
+        fake.on("GET", "/Profile/", lambda request: success({"profile": {"data": {"characterIds": ["c1"]}}}))
+        fake.on("GET", "/Stats/Activities/", lambda request: _load("activity_history.json"))
+
+        def pgcr(request):
+            instance_id = request.path.rstrip("/").rsplit("/", 1)[-1]
+            path = os.path.join(FIXTURES, f"pgcr_{instance_id}.json")
+            return _load(f"pgcr_{instance_id}.json") if os.path.exists(path) else web.Response(status=404)
+        fake.on("GET", "/PostGameCarnageReport/", pgcr)
+        return fake
+    return start
+
+
+def test_verify_event_marks_absent_players_found_in_event_pgcr(fake_stats):
+    attendance = [
+        _row(1, A, "compareceu"),
+        _row(2, B, "ausente"),
+        _row(3, C, "ausente"),    # Só aparece em 1001 sem a equipa e em 1003/1004, fora da janela.
+        _row(4, None, "ausente"),  # Sem perfil vinculado: nunca é verificado.
+    ]
+
+    async def scenario():
+        fake = await fake_stats()
+        try:
+            return fake, await pgcr_verifier.verify_event(EVENT, attendance)
+        finally:
+            await fake.__aexit__(None, None, None)
+
+    fake, attended = asyncio.run(scenario())
+    assert attended == {2}
+    assert fake.count("/PostGameCarnageReport/1003/") == fake.count("/PostGameCarnageReport/1004/") == 0
+    assert fake.count("/PostGameCarnageReport/") == 3
+    assert pgcr_verifier.cache.misses == 3
+
+
+def test_verify_event_skips_when_no_linked_player_is_absent(fake_stats):
+    attendance = [_row(1, A, "compareceu"), _row(4, None, "ausente")]
+
+    async def scenario():
+        fake = await fake_stats()
+        try:
+            return fake, await pgcr_verifier.verify_event(EVENT, attendance)
+        finally:
+            await fake.__aexit__(None, None, None)
+
+    fake, attended = asyncio.run(scenario())
+    assert attended == set()
+    assert sum(fake.hits.values()) == 0
+
+
+def test_anchor_lookup_counts_against_request_budget(fake_stats):
+    start, end = _window()
+
+    async def scenario():
+        fake = await fake_stats()
+        try:
+            empty = await pgcr_verifier._anchor_instances(3, A, 4, start, end, pgcr_verifier.RequestBudget(0))
+            budget = pgcr_verifier.RequestBudget(2)
+            found = await pgcr_verifier._anchor_instances(3, A, 4, start, end, budget)
+            return fake, empty, found, budget.used
+        finally:
+            await fake.__aexit__(None, None, None)
+
+    fake, empty, found, used = asyncio.run(scenario())
+    assert empty == []
+    assert found == ["1002", "1005", "1001"]
+    assert used == 2  # Perfil + histórico de um personagem.
+    assert fake.count("/Profile/") == 1
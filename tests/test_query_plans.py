@@ -0,0 +1,32 @@
+# tests/test_query_plans.py
+import pytest
+
+import database
+import db_pool
+
+
+def _full_table_scans(cursor, query):
+    params = tuple(None for _ in range(query.count("?")))
+    cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+    # "SCAN (subquery-N)" percorre um resultado intermediário já filtrado, não uma tabela.
+    return [
+        row['detail'] for row in cursor.fetchall()
+        if row['detail'].startswith("SCAN ") and not row['detail'].startswith(("SCAN (", "SCAN CONSTANT ROW"))
+    ]
+
+
+@pytest.mark.parametrize("name", sorted(database.HOT_QUERIES))
+def test_hot_query_uses_an_index(temp_db, name):
+    with db_pool.connection() as conn:
+        assert _full_table_scans(conn.cursor(), database.HOT_QUERIES[name]) == []
+
+
+def test_index_set_is_recorded_in_user_version(temp_db):
+    with db_pool.connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == database.INDEX_SET_VERSION
+        names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'")}
+    assert names == set(database.INDEXES)
+
+
+def test_runtime_check_agrees(temp_db):
+    assert database.db_check_hot_query_plans() == {}
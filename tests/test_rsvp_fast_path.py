@@ -0,0 +1,158 @@
+# tests/test_rsvp_fast_path.py
+import asyncio
+import types
+
+import discord
+import pytest
+
+import utils
+from cogs import event_cog
+from constants import RSVP_FAST_PATH_TIMEOUT_SECONDS
+from render_coalescer import RenderCoalescer
+
+EVENT_ID, CHANNEL_ID, MESSAGE_ID, USER_ID = 7, 70, 700, 7000
+RESULT = {"event": {"channel_id": CHANNEL_ID, "status": "ativo"}, "status": "vou", "promoted": []}
+
+
+class _Response:
+    def __init__(self, calls: list, fail_edit: bool = False):
+        self._calls = calls
+        self._done = False
+        self._fail_edit = fail_edit
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def _answer(self, name: str):
+        assert not self._done, "a interação só pode ser respondida uma vez"
+        self._calls.append((name, asyncio.get_running_loop().time()))
+        self._done = True
+
+    async def defer(self, **kwargs):
+        await self._answer("defer")
+
+    async def edit_message(self, **kwargs):
+        if self._fail_edit:
+            raise discord.HTTPException(types.SimpleNamespace(status=500, reason="erro"), "falha ao editar")
+        await self._answer("edit_message")
+
+    async def send_message(self, content, **kwargs):
+        await self._answer(f"send_message:{content}")
+
+
+class _Followup:
+    def __init__(self, calls: list):
+        self._calls = calls
+
+    async def send(self, content, **kwargs):
+        self._calls.append((f"followup:{content}", asyncio.get_running_loop().time()))
+
+
+def _interaction(calls: list, fail_edit: bool = False):
+    return types.SimpleNamespace(
+        user=types.SimpleNamespace(id=USER_ID), channel_id=CHANNEL_ID, message=types.SimpleNamespace(id=MESSAGE_ID),
+        response=_Response(calls, fail_edit), followup=_Followup(calls)
+    )
+
+
+@pytest.fixture
+def rsvp_view(monkeypatch):
+    """Devolve (view, renders): a view com o trabalho de RSVP trocado por `work` e os renders pedidos ao coalescer."""
+    async def no_promotions(*args):
+        return None
+    monkeypatch.setattr(utils, "notify_waitlist_promotions", no_promotions)
+
+    def build(work):
+        bot = types.SimpleNamespace(render_coalescer=RenderCoalescer(window=0))
+        view = event_cog.PersistentRsvpView(bot)
+        renders = []
+
+        async def render(event_id, channel_id, message_id):
+            renders.append((event_id, channel_id, message_id))
+            return True
+        view._apply_rsvp_and_render = work
+        view._render_event_message = render
+        return view, renders
+    return build
+
+
+async def _click(view, interaction):
+    started = asyncio.get_running_loop().time()
+    await view._handle_rsvp_logic(interaction, "vou", EVENT_ID)
+    await asyncio.sleep(0.05)  # Deixa o coalescer correr o render pedido.
+    return started
+
+
+def test_slow_rsvp_is_deferred_within_the_bound(rsvp_view):
+    # O Discord dá 3 s para responder ao clique.
+    assert RSVP_FAST_PATH_TIMEOUT_SECONDS < 3
+    finished = []
+
+    async def slow_work(event_id, user_id, new_status):
+        await asyncio.sleep(RSVP_FAST_PATH_TIMEOUT_SECONDS + 0.5)
+        finished.append(asyncio.get_running_loop().time())
+        return None, RESULT, None, "conteudo"
+
+    view, renders = rsvp_view(slow_work)
+    calls = []
+    started = asyncio.run(_click(view, _interaction(calls)))
+
+    name, answered_at = calls[0]
+    assert name == "defer"
+    assert answered_at - started < RSVP_FAST_PATH_TIMEOUT_SECONDS + 0.3
+    assert answered_at < finished[0]
+    assert renders == [(EVENT_ID, CHANNEL_ID, MESSAGE_ID)]  # A edição segue pelo coalescer.
+
+
+def test_fast_rsvp_edits_the_message_directly(rsvp_view):
+    async def fast_work(event_id, user_id, new_status):
+        return None, RESULT, discord.Embed(title="Raid"), "conteudo"
+
+    view, renders = rsvp_view(fast_work)
+    calls = []
+    asyncio.run(_click(view, _interaction(calls)))
+
+    assert [name for name, _ in calls][0] == "edit_message"
+    assert renders == []
+    assert view.bot.render_coalescer.is_applied(MESSAGE_ID, "conteudo")
+
+
+def test_failed_rsvp_answers_with_ephemeral_error(rsvp_view):
+    async def broken_work(event_id, user_id, new_status):
+        raise RuntimeError("banco indisponível")
+
+    view, renders = rsvp_view(broken_work)
+    calls = []
+    asyncio.run(_click(view, _interaction(calls)))
+
+    assert [name for name, _ in calls] == ["send_message:Não foi possível registar a sua resposta. Tente novamente."]
+    assert renders == [(EVENT_ID, CHANNEL_ID, MESSAGE_ID)]  # A mensagem volta a ser desenhada a partir do banco.
+
+
+def test_failure_after_defer_uses_followup(rsvp_view, monkeypatch):
+    monkeypatch.setattr(event_cog, "RSVP_FAST_PATH_TIMEOUT_SECONDS", 0.05)
+
+    async def slow_broken_work(event_id, user_id, new_status):
+        await asyncio.sleep(0.1)
+        raise RuntimeError("banco indisponível")
+
+    view, renders = rsvp_view(slow_broken_work)
+    calls = []
+    asyncio.run(_click(view, _interaction(calls)))
+
+    assert [name for name, _ in calls] == ["defer", "followup:Não foi possível registar a sua resposta. Tente novamente."]
+    assert renders == [(EVENT_ID, CHANNEL_ID, MESSAGE_ID)]
+
+
+def test_failed_edit_rerenders_and_keeps_sequence_consistent(rsvp_view):
+    async def fast_work(event_id, user_id, new_status):
+        return None, RESULT, discord.Embed(title="Raid"), "conteudo"
+
+    view, renders = rsvp_view(fast_work)
+    calls = []
+    asyncio.run(_click(view, _interaction(calls, fail_edit=True)))
+
+    coalescer = view.bot.render_coalescer
+    assert [name for name, _ in calls] == ["send_message:Não foi possível registar a sua resposta. Tente novamente."]
+    assert renders == [(EVENT_ID, CHANNEL_ID, MESSAGE_ID)]
+    assert not coalescer.is_applied(MESSAGE_ID, "conteudo")  # A edição falhada não conta como aplicada.
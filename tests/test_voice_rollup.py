@@ -0,0 +1,89 @@
+# tests/test_voice_rollup.py
+import datetime
+import random
+from collections import defaultdict
+
+import pytz
+
+import database
+import db_pool
+
+
+def _iso(dt: datetime.datetime) -> str:
+    return dt.isoformat()
+
+
+def test_split_crosses_midnight():
+    start = datetime.datetime(2024, 3, 9, 23, 30, tzinfo=pytz.utc)
+    end = start + datetime.timedelta(hours=1, minutes=45)
+    assert database.split_voice_session_by_day(_iso(start), _iso(end), 6300) == [("2024-03-09", 1800), ("2024-03-10", 4500)]
+
+
+def test_split_spans_several_days_and_keeps_the_total():
+    start = datetime.datetime(2024, 3, 9, 22, 0, tzinfo=pytz.utc)
+    end = datetime.datetime(2024, 3, 12, 1, 0, tzinfo=pytz.utc)
+    duration = int((end - start).total_seconds())
+    parts = database.split_voice_session_by_day(_iso(start), _iso(end), duration)
+    assert [day for day, _ in parts] == ["2024-03-09", "2024-03-10", "2024-03-11", "2024-03-12"]
+    assert sum(seconds for _, seconds in parts) == duration
+
+
+def _seed_sessions(count: int, now: datetime.datetime):
+    rng = random.Random(7)
+    sessions = []
+    for _ in range(count):
+        # Começos concentrados perto da meia-noite UTC para que muitas sessões a atravessem.
+        day = now.date() - datetime.timedelta(days=rng.randint(0, 12))
+        start = datetime.datetime.combine(day, datetime.time(23, 0), tzinfo=pytz.utc) + datetime.timedelta(minutes=rng.randint(-180, 50))
+        duration = rng.randint(60, 4 * 3600)
+        end = start + datetime.timedelta(seconds=duration)
+        if end > now:
+            continue
+        session = (rng.randint(1, 15), rng.choice((10, 20)), _iso(start), _iso(end), duration)
+        database.db_log_voice_session(*session)
+        sessions.append(session)
+    return sessions
+
+
+def _rollup_rows():
+    with db_pool.connection() as conn:
+        return {(row[0], row[1], row[2]): row[3] for row in conn.execute("SELECT guild_id, user_id, day_utc, total_seconds FROM voice_daily_totals")}
+
+
+def test_rollup_matches_raw_sessions(temp_db):
+    now = datetime.datetime.now(pytz.utc)
+    sessions = _seed_sessions(400, now)
+    assert any(start[:10] != end[:10] for _, _, start, end, _ in sessions), "o cenário precisa de sessões que atravessam a meia-noite"
+
+    expected = defaultdict(int)
+    for user_id, guild_id, start, end, duration in sessions:
+        for day, seconds in database.split_voice_session_by_day(start, end, duration):
+            expected[(guild_id, user_id, day)] += seconds
+    rollup = _rollup_rows()
+    assert rollup == dict(expected)
+
+    # Por usuário, o total do rollup é exatamente a soma bruta de voice_sessions.
+    with db_pool.connection() as conn:
+        raw = {(row[0], row[1]): row[2] for row in conn.execute("SELECT guild_id, user_id, SUM(duration_seconds) FROM voice_sessions GROUP BY guild_id, user_id")}
+    per_user = defaultdict(int)
+    for (guild_id, user_id, _), seconds in rollup.items():
+        per_user[(guild_id, user_id)] += seconds
+    assert dict(per_user) == raw
+
+    # A semana (hoje e os seis dias UTC anteriores) sai do rollup com os mesmos valores.
+    window_start = (now.date() - datetime.timedelta(days=6)).isoformat()
+    for guild_id in (10, 20):
+        weekly = defaultdict(int)
+        for (g, user_id, day), seconds in expected.items():
+            if g == guild_id and day >= window_start:
+                weekly[user_id] += seconds
+        assert dict(database.db_get_all_users_weekly_voice_time(guild_id)) == dict(weekly)
+        for user_id, seconds in weekly.items():
+            assert database.db_get_user_weekly_voice_time(guild_id, user_id) == seconds
+
+
+def test_rebuild_reproduces_incremental_rollup(temp_db):
+    _seed_sessions(200, datetime.datetime.now(pytz.utc))
+    incremental = _rollup_rows()
+    database.db_rebuild_voice_daily_totals()
+    assert _rollup_rows() == incremental
@@ -5,11 +5,11 @@ from discord.ext import commands
 # Adicionado para corrigir o NameError e padronizar
 from discord.ui import Button, View, Modal, TextInput
 import asyncio
+import copy
 import datetime
 import pytz
-from typing import Optional, List, Tuple, Dict, Set, Any
+from typing import Optional, List, Tuple, Dict, Set, Any, Hashable
 import sqlite3
-from difflib import SequenceMatcher
 import re
 
 from constants import (
@@ -19,11 +19,13 @@ from constants import (
     ACTIVITY_SUBTYPES_NIGHTFALL, ACTIVITY_SUBTYPES_EXOTIC,
     ACTIVITY_SUBTYPES_SEASONAL, ACTIVITY_SUBTYPES_OTHER,
     DEFAULT_EVENT_COLOR, EVENT_TYPE_COLORS,
-    ALL_ACTIVITIES_PT, RAID_INFO_PT, MASMORRA_INFO_PT, PVP_ACTIVITY_INFO_PT,
-    SIMILARITY_THRESHOLD, DIAS_SEMANA_PT_SHORT
+    DIAS_SEMANA_PT_SHORT, EVENT_EMBED_CACHE_MAX_ENTRIES
 )
-import database as db
+from caching import LRUCache
+import db_async as adb
 import bungie_api
+import destiny_manifest
+from rate_limit import PRIORITY_INTERACTIVE
 
 # --- Funções de Verificação de Permissão ---
 async def check_event_permission(interaction: discord.Interaction, permission: str) -> bool:
@@ -32,7 +34,7 @@ async def check_event_permission(interaction: discord.Interaction, permission: s
     if interaction.user.guild_permissions.administrator:
         return True
     user_roles_ids: Set[int] = {role.id for role in interaction.user.roles}
-    return db.db_check_user_permission(interaction.guild.id, user_roles_ids, permission)
+    return await adb.db_check_user_permission(interaction.guild.id, user_roles_ids, permission)
 
 async def is_user_event_manager(interaction: discord.Interaction, event_creator_id: int, permission_to_check: str) -> bool:
     if not interaction.guild or not isinstance(interaction.user, discord.Member):
@@ -101,19 +103,18 @@ async def get_user_display_name_static(user_id: int, bot: commands.Bot, guild: O
     member = guild.get_member(user_id) if guild else None
     if member and member.nick: return member.nick
     try:
-        user_obj = bot.get_user(user_id) or await bot.fetch_user(user_id)
-        return user_obj.global_name or user_obj.name
-    except (discord.NotFound, discord.HTTPException):
-        return f"Usuário ({user_id})"
+        profile = await bot.profile_cache.get(user_id)
+    except discord.HTTPException:
+        profile = None
+    return profile.display_name if profile else f"Usuário ({user_id})"
 
-def format_event_line_for_list(row: sqlite3.Row, vou_count: int, guild_id: int) -> str:
+def format_event_line_for_list(row: sqlite3.Row, vou_count: int, guild_id: int, espera_count: int = 0) -> str:
     dt_utc = datetime.datetime.fromisoformat(row['event_time_utc'].replace('Z', '+00:00'))
     dt_brt = dt_utc.astimezone(BRAZIL_TZ)
     date_str = f"{DIAS_SEMANA_PT_SHORT[dt_brt.weekday()]}. {dt_brt.strftime('%d/%m')}"
     vagas_disp = row['max_attendees'] - vou_count
     vagas_str = f"{vagas_disp} vagas"
     if vagas_disp <= 0:
-        espera_count = len(db.db_get_rsvps_for_event(row['event_id']).get('lista_espera', []))
         vagas_str = f"Lotado (Espera: {espera_count})" if espera_count > 0 else "Lotado"
     elif vagas_disp == 1: vagas_str = "1 vaga"
     link = f"https://discord.com/channels/{guild_id}/{row['channel_id']}/{row['message_id']}"
@@ -130,14 +131,17 @@ async def generate_event_list_message_content(guild_id: int, days: int, bot: com
     now_brt = get_brazil_now()
     start_utc = now_brt.replace(hour=0, minute=0, second=0, microsecond=0).astimezone(pytz.utc)
     end_utc_detailed = (now_brt + datetime.timedelta(days=days)).replace(hour=23, minute=59, second=59).astimezone(pytz.utc)
-    detailed_events = db.db_get_events_for_digest_list(guild_id, start_utc, end_utc_detailed)
-    far_future_events = db.db_get_far_future_events(guild_id, end_utc_detailed)
+    detailed_events = await adb.db_get_events_for_digest_list(guild_id, start_utc, end_utc_detailed)
+    far_future_events = await adb.db_get_far_future_events(guild_id, end_utc_detailed)
     if not detailed_events and not far_future_events:
         return "Nenhum evento agendado para o futuro."
     message_parts = []
     if detailed_events:
         message_parts.append(f"**Próximos {days} Dias:**")
-        detailed_lines = [format_event_line_for_list(er, len(db.db_get_rsvps_for_event(er['event_id']).get('vou', [])), guild_id) for er in detailed_events]
+        detailed_lines = []
+        for er in detailed_events:
+            rsvps = await adb.db_get_rsvps_for_event(er['event_id'])
+            detailed_lines.append(format_event_line_for_list(er, len(rsvps.get('vou', [])), guild_id, len(rsvps.get('lista_espera', []))))
         message_parts.append("\n".join(detailed_lines))
     if far_future_events:
         message_parts.append("\n**Eventos Futuros:**" if message_parts else "**Eventos Futuros:**")
@@ -147,7 +151,7 @@ async def generate_event_list_message_content(guild_id: int, days: int, bot: com
 
 async def get_text_channels_for_select(guild: discord.Guild, bot_user: discord.ClientUser) -> list[discord.SelectOption]:
     options: List[discord.SelectOption] = []
-    designated_ids = db.db_get_designated_event_channels(guild.id)
+    designated_ids = await adb.db_get_designated_event_channels(guild.id)
     if not designated_ids: return options
     bot_member = guild.get_member(bot_user.id)
     if not bot_member: return options
@@ -159,20 +163,10 @@ async def get_text_channels_for_select(guild: discord.Guild, bot_user: discord.C
     return options
 
 def detect_activity_details(name_input: str) -> tuple[str, str | None, int | None]:
-    name_lower = name_input.lower().strip()
-    best_match, best_type, best_spots, highest_sim = name_input.strip(), None, None, 0.0
-    for official, keywords in ALL_ACTIVITIES_PT.items():
-        sim_off = SequenceMatcher(None, name_lower, official.lower()).ratio()
-        if sim_off > highest_sim: highest_sim, best_match = sim_off, official
-        for kw in keywords:
-            sim_kw = SequenceMatcher(None, name_lower, kw.lower()).ratio()
-            if sim_kw > highest_sim: highest_sim, best_match = sim_kw, official
-        if highest_sim == 1.0 and best_match == official: break
-    if highest_sim >= SIMILARITY_THRESHOLD:
-        if best_match in RAID_INFO_PT: best_type, best_spots = "Raid", 6
-        elif best_match in MASMORRA_INFO_PT: best_type, best_spots = "Dungeon", 3
-        elif best_match in PVP_ACTIVITY_INFO_PT: best_type, best_spots = "PvP", 3
-        return best_match, best_type, best_spots
+    # Índice do manifesto (com os dicionários de constants.py como apelidos extra).
+    match = destiny_manifest.lookup_activity(name_input)
+    if match:
+        return match
     return name_input.strip(), None, None
 
 def detect_and_format_event_subtype(title: str, description: Optional[str]) -> str:
@@ -185,18 +179,57 @@ def detect_and_format_event_subtype(title: str, description: Optional[str]) -> s
     return title
 
 async def create_event_embed(bot: commands.Bot, event_id: int) -> Optional[discord.Embed]:
-    event_details = db.db_get_event_details(event_id)
+    event_details = await adb.db_get_event_details(event_id)
     if not event_details: return None
-    rsvps = db.db_get_rsvps_for_event(event_id)
+    rsvps = await adb.db_get_rsvps_for_event(event_id)
+    return await build_event_embed(event_details, rsvps, bot)
+
+# Embeds já montados, por chave de conteúdo: o banco incrementa events.version e
+# events.roster_version a cada alteração do evento ou da lista, por isso a mesma
+# chave dá sempre o mesmo embed. Guarda-se o dict do embed (to_dict), copiado a cada uso.
+_event_embed_cache = LRUCache(EVENT_EMBED_CACHE_MAX_ENTRIES)
+
+def get_event_embed_cache_stats() -> Dict[str, float]:
+    return _event_embed_cache.get_stats()
+
+async def build_event_embed(event_details, rsvps: Dict[str, List[int]], bot: commands.Bot) -> discord.Embed:
+    """Monta o embed do evento a partir de dados já carregados (linha do evento + RSVPs)."""
+    embed, _ = await render_event_embed(event_details, rsvps, bot)
+    return embed
+
+async def render_event_embed(event_details, rsvps: Dict[str, List[int]], bot: commands.Bot) -> Tuple[discord.Embed, Hashable]:
+    """
+    Como build_event_embed, mas devolve também a chave de conteúdo do embed, que permite
+    saltar a edição quando a mensagem já o mostra. Os RSVPs têm de ser lidos depois da
+    linha do evento (ou na mesma transação, como no db_apply_rsvp).
+    """
+    try:
+        creator = await bot.profile_cache.get(event_details['creator_id'])
+    except discord.HTTPException:
+        creator = None
+    content_key = (event_details['event_id'], event_details['version'], event_details['roster_version'], creator)
+    payload = _event_embed_cache.get(content_key)
+    if payload is None:
+        generation = _event_embed_cache.generation(content_key)
+        payload = _compose_event_embed(event_details, rsvps, creator).to_dict()
+        _event_embed_cache.put(content_key, payload, generation)
+    return discord.Embed.from_dict(copy.deepcopy(payload)), content_key
+
+def _compose_event_embed(event_details, rsvps: Dict[str, List[int]], creator) -> discord.Embed:
+    event_id = event_details['event_id']
     attendees = rsvps.get('vou', [])
     maybe = rsvps.get('talvez', [])
-    waitlist = attendees[event_details['max_attendees']:]
+    # A lista de espera é gravada pelo db_apply_rsvp; confirmados acima das vagas (ex.: vagas
+    # reduzidas numa edição, RSVPs antigos) continuam a aparecer como espera.
+    waitlist = attendees[event_details['max_attendees']:] + rsvps.get('lista_espera', [])
     attendees = attendees[:event_details['max_attendees']]
-    creator = await bot.fetch_user(event_details['creator_id'])
     event_time_utc = datetime.datetime.fromisoformat(event_details['event_time_utc'])
     color = get_event_color(event_details['activity_type'])
     embed = discord.Embed(title=f"**{event_details['title']}**", description=event_details['description'], color=color)
-    embed.set_author(name=f"Criado por {creator.display_name}", icon_url=creator.avatar.url if creator.avatar else None)
+    if creator:
+        embed.set_author(name=f"Criado por {creator.display_name}", icon_url=creator.avatar_url)
+    else:
+        embed.set_author(name=f"Criado por Usuário ({event_details['creator_id']})")
     fmt_date, rel_time = format_datetime_for_embed(event_time_utc)
     embed.add_field(name="🗓️ Data e Hora", value=f"{fmt_date} ({rel_time})", inline=False)
     attendees_mentions = [f"<@{uid}>" for uid in attendees]
@@ -212,6 +245,15 @@ async def create_event_embed(bot: commands.Bot, event_id: int) -> Optional[disco
     embed.set_footer(text=f"ID do Evento: {event_id} | Tipo: {event_details['activity_type']}")
     return embed
 
+async def notify_waitlist_promotions(bot: commands.Bot, event_details, promoted: List[int]):
+    """Avisa por DM (em lote, pela fila de DMs) quem saiu da lista de espera."""
+    if not promoted: return
+    await bot.dm_outbox.enqueue(
+        promoted, "promocao_lista_espera",
+        f"🎉 Abriu uma vaga! Você saiu da lista de espera e está confirmado(a) no evento **'{event_details['title']}'**.",
+        event_id=event_details['event_id'], scope=datetime.datetime.now(pytz.utc).isoformat()
+    )
+
 # --- Views ---
 class EventModal(Modal):
     def __init__(self, bot: commands.Bot, event_details: Optional[Dict] = None):
@@ -304,10 +346,12 @@ class ConfirmAttendanceView(View):
     @discord.ui.button(label="Não vou", style=discord.ButtonStyle.danger)
     async def cancel(self, i: discord.Interaction, b: Button):
         if i.user.id != self.user_id: await i.response.send_message("Não é pra vc.", ephemeral=True); return
-        db.db_add_or_update_rsvp(self.event_id, self.user_id, 'nao_vou')
+        result = await adb.db_apply_rsvp(self.event_id, self.user_id, 'nao_vou')
         from cogs.event_cog import PersistentRsvpView
         rsvp_view = PersistentRsvpView(self.bot)
-        event_details = db.db_get_event_details(self.event_id)
+        event_details = await adb.db_get_event_details(self.event_id)
+        if event_details and result:
+            await notify_waitlist_promotions(self.bot, event_details, result['promoted'])
         if event_details and event_details['message_id']:
             await rsvp_view._update_event_message_embed(self.event_id, event_details['channel_id'], event_details['message_id'])
         await i.response.edit_message(content="RSVP atualizado para 'Não vou'.", view=None)
@@ -323,12 +367,15 @@ class ClanInviteView(View):
     async def handle_interaction(self, interaction: discord.Interaction, action: str):
         await interaction.response.defer()
         if not interaction.guild or not interaction.guild_id: return
-        configs = db.db_get_server_configs(interaction.guild_id)
-        if not configs or not configs.get('clan_admin_discord_id'):
+        configs = await adb.db_get_server_configs(interaction.guild_id) or {}
+        # O pedido traz o clã e o admin que o leu; o admin geral do servidor é o recurso.
+        admin_id = self.applicant_info.get('admin_discord_id') or configs.get('clan_admin_discord_id')
+        clan_id = self.applicant_info.get('clan_id')
+        if not admin_id:
             await interaction.followup.send("Admin do Clã não configurado.", ephemeral=True); return
-        admin_id = configs['clan_admin_discord_id']; success = False
-        if action == "approve": success = await bungie_api.approve_pending_invitation(admin_id, self.membership_id, self.membership_type)
-        elif action == "deny": success = await bungie_api.deny_pending_invitation(admin_id, self.membership_id, self.membership_type)
+        success = False
+        if action == "approve": success = await bungie_api.approve_pending_invitation(admin_id, self.membership_id, self.membership_type, priority=PRIORITY_INTERACTIVE, clan_id=clan_id)
+        elif action == "deny": success = await bungie_api.deny_pending_invitation(admin_id, self.membership_id, self.membership_type, priority=PRIORITY_INTERACTIVE, clan_id=clan_id)
         if not interaction.message: return
         original_embed = interaction.message.embeds[0]
         if success:
@@ -338,12 +385,12 @@ class ClanInviteView(View):
             for item in self.children:
                 if isinstance(item, Button): item.disabled = True
             await interaction.message.edit(embed=original_embed, view=self)
-            db.db_untrack_pending_invite(self.membership_id)
+            await adb.db_untrack_pending_invite(self.membership_id)
             if action == "approve":
                 role_msg = ""
                 clan_role_id = configs.get('clan_role_id')
                 if clan_role_id:
-                    bungie_profile = db.db_get_bungie_profile_by_bnet_id(self.membership_id)
+                    bungie_profile = await adb.db_get_bungie_profile_by_bnet_id(self.membership_id)
                     if bungie_profile and bungie_profile.get('discord_id'):
                         member = interaction.guild.get_member(bungie_profile['discord_id'])
                         clan_role = interaction.guild.get_role(clan_role_id)